@@ -5,9 +5,11 @@ Handles all database operations with Supabase
 """
 
 import os
-import requests
-from typing import List, Dict, Optional
-from datetime import datetime
+from threading import Lock
+from typing import List, Dict, Optional, Any, Callable
+from datetime import datetime, timedelta, timezone
+from services.http_pool import get_http_session
+from services.ttl_cache import TTLCache, MISSING
 
 class DatabaseManager:
     def __init__(self):
@@ -27,6 +29,18 @@ class DatabaseManager:
             'Prefer': 'return=representation'
         }
         
+        # Shared keep-alive pool so repeated PostgREST calls skip the TCP/TLS handshake
+        self.http = get_http_session('supabase')
+        
+        # Short-lived caches for rows the posting hot path re-reads several times per post.
+        # Writes through this manager invalidate the affected entries; the TTL bounds
+        # staleness from writes made elsewhere.
+        cache_size = int(os.getenv('DB_CACHE_MAX_ENTRIES', '1024'))
+        self.token_cache = TTLCache('tokens', max_size=cache_size,
+                                    ttl_seconds=float(os.getenv('DB_TOKEN_CACHE_TTL', '60')))
+        self.account_cache = TTLCache('accounts', max_size=cache_size,
+                                      ttl_seconds=float(os.getenv('DB_ACCOUNT_CACHE_TTL', '30')))
+        
         print("✅ Database manager initialized")
         print(f"✅ Supabase URL: {self.supabase_url}")
         print(f"✅ Using service role key: {bool(self.supabase_key)}")
@@ -41,7 +55,7 @@ class DatabaseManager:
             
             # First try without filter to see all accounts
             print("🔍 get_active_accounts: Fetching all accounts (no filter)...")
-            response = requests.get(
+            response = self.http.get(
                 f"{self.supabase_url}/rest/v1/accounts",
                 headers=self.headers
             )
@@ -83,7 +97,7 @@ class DatabaseManager:
         try:
             print(f"🔍 get_account_by_username: Looking for username '{username}'")
             
-            response = requests.get(
+            response = self.http.get(
                 f"{self.supabase_url}/rest/v1/accounts",
                 headers=self.headers,
                 params={'username': f'eq.{username}'}
@@ -122,7 +136,7 @@ class DatabaseManager:
             if 'created_at' not in account_data:
                 account_data['created_at'] = datetime.now().isoformat()
                 
-            response = requests.post(
+            response = self.http.post(
                 f"{self.supabase_url}/rest/v1/accounts",
                 json=account_data,
                 headers=self.headers
@@ -158,11 +172,12 @@ class DatabaseManager:
         try:
             print(f"🔍 save_session_data: Saving session for account {account_id}")
             
-            response = requests.patch(
+            response = self.http.patch(
                 f"{self.supabase_url}/rest/v1/accounts?id=eq.{account_id}",
                 json={"session_data": session_data},
                 headers=self.headers
             )
+            self.account_cache.invalidate(account_id)
             
             print(f"🔍 save_session_data: Response status: {response.status_code}")
             return response.status_code == 204
@@ -175,7 +190,7 @@ class DatabaseManager:
         try:
             print(f"🔍 get_session_data: Getting session for account {account_id}")
             
-            response = requests.get(
+            response = self.http.get(
                 f"{self.supabase_url}/rest/v1/accounts",
                 headers=self.headers,
                 params={'id': f'eq.{account_id}'}
@@ -201,7 +216,7 @@ class DatabaseManager:
         try:
             print("🔍 get_unused_caption: Fetching unused caption...")
             
-            response = requests.get(
+            response = self.http.get(
                 f"{self.supabase_url}/rest/v1/captions",
                 headers=self.headers,
                 params={'used': 'eq.false'}
@@ -230,7 +245,7 @@ class DatabaseManager:
         try:
             print("🔍 get_unused_image: Fetching unused image...")
             
-            response = requests.get(
+            response = self.http.get(
                 f"{self.supabase_url}/rest/v1/images",
                 headers=self.headers,
                 params={'used': 'eq.false'}
@@ -254,29 +269,12 @@ class DatabaseManager:
             print(f"❌ Error getting unused image: {e}")
             return None
     
-    def mark_caption_used(self, caption_id: int) -> bool:
-        """Mark a caption as used"""
-        try:
-            print(f"🔍 mark_caption_used: Marking caption {caption_id} as used")
-            
-            response = requests.patch(
-                f"{self.supabase_url}/rest/v1/captions?id=eq.{caption_id}",
-                json={"used": True},
-                headers=self.headers
-            )
-            
-            print(f"🔍 mark_caption_used: Response status: {response.status_code}")
-            return response.status_code == 204
-        except Exception as e:
-            print(f"❌ Error marking caption as used: {e}")
-            return False
-    
     def mark_image_used(self, image_id: int) -> bool:
         """Mark an image as used"""
         try:
             print(f"🔍 mark_image_used: Marking image {image_id} as used")
             
-            response = requests.patch(
+            response = self.http.patch(
                 f"{self.supabase_url}/rest/v1/images?id=eq.{image_id}",
                 json={"used": True},
                 headers=self.headers
@@ -294,11 +292,12 @@ class DatabaseManager:
             print(f"🔍 update_account_last_posted: Updating account {account_id}")
             
             from datetime import datetime
-            response = requests.patch(
+            response = self.http.patch(
                 f"{self.supabase_url}/rest/v1/accounts?id=eq.{account_id}",
                 json={"last_posted": datetime.now().isoformat()},
                 headers=self.headers
             )
+            self.account_cache.invalidate(account_id)
             
             print(f"🔍 update_account_last_posted: Response status: {response.status_code}")
             return response.status_code == 204
@@ -312,11 +311,12 @@ class DatabaseManager:
             print(f"🔍 update_account_last_login: Updating account {account_id}")
             
             from datetime import datetime
-            response = requests.patch(
+            response = self.http.patch(
                 f"{self.supabase_url}/rest/v1/accounts?id=eq.{account_id}",
                 json={"last_login": datetime.now().isoformat()},
                 headers=self.headers
             )
+            self.account_cache.invalidate(account_id)
             
             print(f"🔍 update_account_last_login: Response status: {response.status_code}")
             return response.status_code == 204
@@ -329,11 +329,12 @@ class DatabaseManager:
         try:
             print(f"🔍 update_account: Updating account {account_id} with data: {data}")
             
-            response = requests.patch(
+            response = self.http.patch(
                 f"{self.supabase_url}/rest/v1/accounts?id=eq.{account_id}",
                 json=data,
                 headers=self.headers
             )
+            self.account_cache.invalidate(account_id)
             
             print(f"🔍 update_account: Response status: {response.status_code}")
             print(f"🔍 update_account: Response text: {response.text}")
@@ -348,10 +349,12 @@ class DatabaseManager:
         try:
             print(f"🔍 delete_account: Deleting account {account_id}")
             
-            response = requests.delete(
+            response = self.http.delete(
                 f"{self.supabase_url}/rest/v1/accounts?id=eq.{account_id}",
                 headers=self.headers
             )
+            self.account_cache.invalidate(account_id)
+            self.token_cache.invalidate(account_id)
             
             print(f"🔍 delete_account: Response status: {response.status_code}")
             print(f"🔍 delete_account: Response text: {response.text}")
@@ -364,7 +367,7 @@ class DatabaseManager:
     def get_all_captions(self) -> List[Dict]:
         """Get all captions"""
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.supabase_url}/rest/v1/captions",
                 headers=self.headers
             )
@@ -394,7 +397,7 @@ class DatabaseManager:
             print(f"📝 Headers: {self.headers}")
             print(f"📝 Request URL: {self.supabase_url}/rest/v1/captions")
                 
-            response = requests.post(
+            response = self.http.post(
                 f"{self.supabase_url}/rest/v1/captions",
                 json=caption_data,
                 headers=self.headers
@@ -434,7 +437,7 @@ class DatabaseManager:
             if user_id:
                 image_data["user_id"] = user_id
                 
-            response = requests.post(
+            response = self.http.post(
                 f"{self.supabase_url}/rest/v1/images",
                 json=image_data,
                 headers=self.headers
@@ -447,7 +450,7 @@ class DatabaseManager:
     def get_all_images(self) -> List[Dict]:
         """Get all images"""
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.supabase_url}/rest/v1/images",
                 headers=self.headers
             )
@@ -463,7 +466,7 @@ class DatabaseManager:
     def delete_image(self, image_id: int) -> bool:
         """Delete an image"""
         try:
-            response = requests.delete(
+            response = self.http.delete(
                 f"{self.supabase_url}/rest/v1/images?id=eq.{image_id}",
                 headers=self.headers
             )
@@ -479,7 +482,7 @@ class DatabaseManager:
             if account_id:
                 params['account_id'] = f'eq.{account_id}'
                 
-            response = requests.get(
+            response = self.http.get(
                 f"{self.supabase_url}/rest/v1/posting_history",
                 headers=self.headers,
                 params=params
@@ -506,7 +509,7 @@ class DatabaseManager:
             if image_id:
                 record_data["image_id"] = image_id
                 
-            response = requests.post(
+            response = self.http.post(
                 f"{self.supabase_url}/rest/v1/posting_history",
                 json=record_data,
                 headers=self.headers
@@ -525,7 +528,7 @@ class DatabaseManager:
             if error_message:
                 update_data["error_message"] = error_message
                 
-            response = requests.patch(
+            response = self.http.patch(
                 f"{self.supabase_url}/rest/v1/posting_history?id=eq.{record_id}",
                 json=update_data,
                 headers=self.headers
@@ -569,11 +572,13 @@ class DatabaseManager:
             # For now, we'll delete based on some identifier or pattern
             # This is a placeholder implementation
             
-            response = requests.delete(
+            response = self.http.delete(
                 f"{self.supabase_url}/rest/v1/accounts",
                 headers=self.headers,
                 params={'user_id': f'eq.{user_id}'}
             )
+            self.account_cache.clear()
+            self.token_cache.clear()
             
             print(f"🗑️ delete_accounts_by_user_id: Response status: {response.status_code}")
             
@@ -593,7 +598,7 @@ class DatabaseManager:
         try:
             print(f"🗑️ delete_posting_history_by_user_id: Deleting posting history for user_id: {user_id}")
             
-            response = requests.delete(
+            response = self.http.delete(
                 f"{self.supabase_url}/rest/v1/posting_history",
                 headers=self.headers,
                 params={'user_id': f'eq.{user_id}'}
@@ -617,7 +622,7 @@ class DatabaseManager:
         try:
             print(f"🗑️ delete_captions_by_user_id: Deleting captions for user_id: {user_id}")
             
-            response = requests.delete(
+            response = self.http.delete(
                 f"{self.supabase_url}/rest/v1/captions",
                 headers=self.headers,
                 params={'user_id': f'eq.{user_id}'}
@@ -641,7 +646,7 @@ class DatabaseManager:
         try:
             print(f"🗑️ delete_images_by_user_id: Deleting images for user_id: {user_id}")
             
-            response = requests.delete(
+            response = self.http.delete(
                 f"{self.supabase_url}/rest/v1/images",
                 headers=self.headers,
                 params={'user_id': f'eq.{user_id}'}
@@ -686,7 +691,7 @@ class DatabaseManager:
             
             if existing_token:
                 # Update existing token
-                response = requests.patch(
+                response = self.http.patch(
                     f"{self.supabase_url}/rest/v1/tokens",
                     headers=self.headers,
                     params={'account_id': f'eq.{account_id}'},
@@ -695,11 +700,12 @@ class DatabaseManager:
             else:
                 # Create new token
                 token_data['account_id'] = account_id
-                response = requests.post(
+                response = self.http.post(
                     f"{self.supabase_url}/rest/v1/tokens",
                     headers=self.headers,
                     json=token_data
                 )
+            self.token_cache.invalidate(account_id)
             
             if response.status_code in [200, 201, 204]:
                 print(f"✅ save_token: Token saved for account {account_id}")
@@ -712,44 +718,18 @@ class DatabaseManager:
             print(f"❌ save_token: Error: {e}")
             return False
 
-    def get_token_by_account_id(self, account_id: int) -> Optional[dict]:
-        """Get token data for an account"""
-        try:
-            print(f"🔍 get_token_by_account_id: Getting token for account {account_id}")
-            
-            response = requests.get(
-                f"{self.supabase_url}/rest/v1/tokens",
-                headers=self.headers,
-                params={'account_id': f'eq.{account_id}'}
-            )
-            
-            if response.status_code == 200:
-                tokens = response.json()
-                if tokens:
-                    print(f"✅ get_token_by_account_id: Token found for account {account_id}")
-                    return tokens[0]
-                else:
-                    print(f"📂 get_token_by_account_id: No token found for account {account_id}")
-                    return None
-            else:
-                print(f"❌ get_token_by_account_id: HTTP {response.status_code}: {response.text}")
-                return None
-                
-        except Exception as e:
-            print(f"❌ get_token_by_account_id: Error: {e}")
-            return None
-
     def update_token(self, account_id: int, token_data: dict) -> bool:
         """Update token data for an account"""
         try:
             print(f"🔄 update_token: Updating token for account {account_id}")
             
-            response = requests.patch(
+            response = self.http.patch(
                 f"{self.supabase_url}/rest/v1/tokens",
                 headers=self.headers,
                 params={'account_id': f'eq.{account_id}'},
                 json=token_data
             )
+            self.token_cache.invalidate(account_id)
             
             if response.status_code in [200, 204]:
                 print(f"✅ update_token: Token updated for account {account_id}")
@@ -767,11 +747,12 @@ class DatabaseManager:
         try:
             print(f"🗑️ delete_token: Deleting token for account {account_id}")
             
-            response = requests.delete(
+            response = self.http.delete(
                 f"{self.supabase_url}/rest/v1/tokens",
                 headers=self.headers,
                 params={'account_id': f'eq.{account_id}'}
             )
+            self.token_cache.invalidate(account_id)
             
             if response.status_code in [200, 204]:
                 print(f"✅ delete_token: Token deleted for account {account_id}")
@@ -789,7 +770,7 @@ class DatabaseManager:
         try:
             print("🔍 get_all_tokens: Getting all tokens")
             
-            response = requests.get(
+            response = self.http.get(
                 f"{self.supabase_url}/rest/v1/tokens",
                 headers=self.headers
             )
@@ -824,7 +805,7 @@ class DatabaseManager:
             if image_id:
                 post_data["image_id"] = image_id
                 
-            response = requests.post(
+            response = self.http.post(
                 f"{self.supabase_url}/rest/v1/scheduled_posts",
                 headers=self.headers,
                 json=post_data
@@ -852,7 +833,7 @@ class DatabaseManager:
             if status:
                 params['status'] = f'eq.{status}'
                 
-            response = requests.get(
+            response = self.http.get(
                 f"{self.supabase_url}/rest/v1/scheduled_posts",
                 headers=self.headers,
                 params=params
@@ -875,7 +856,7 @@ class DatabaseManager:
         try:
             print(f"🔄 update_scheduled_post_status: Updating post {post_id} to status {status}")
             
-            response = requests.patch(
+            response = self.http.patch(
                 f"{self.supabase_url}/rest/v1/scheduled_posts",
                 headers=self.headers,
                 params={'id': f'eq.{post_id}'},
@@ -905,7 +886,7 @@ class DatabaseManager:
                 "created_at": datetime.now().isoformat()
             }
             
-            response = requests.post(
+            response = self.http.post(
                 f"{self.supabase_url}/rest/v1/oauth_states",
                 headers=self.headers,
                 json=state_data
@@ -927,7 +908,7 @@ class DatabaseManager:
         try:
             print(f"🔍 get_oauth_state_account_id: Looking up state")
             
-            response = requests.get(
+            response = self.http.get(
                 f"{self.supabase_url}/rest/v1/oauth_states",
                 headers=self.headers,
                 params={'state': f'eq.{state}'}
@@ -955,7 +936,7 @@ class DatabaseManager:
         try:
             print(f"🗑️ delete_oauth_state: Deleting state")
             
-            response = requests.delete(
+            response = self.http.delete(
                 f"{self.supabase_url}/rest/v1/oauth_states",
                 headers=self.headers,
                 params={'state': f'eq.{state}'}
@@ -980,7 +961,7 @@ class DatabaseManager:
             # Calculate cutoff time (1 hour ago)
             cutoff_time = (datetime.now() - timedelta(hours=1)).isoformat()
             
-            response = requests.delete(
+            response = self.http.delete(
                 f"{self.supabase_url}/rest/v1/oauth_states",
                 headers=self.headers,
                 params={'created_at': f'lt.{cutoff_time}'}
@@ -998,11 +979,15 @@ class DatabaseManager:
             return 0
 
     def get_account_by_id(self, account_id: int) -> Optional[dict]:
-        """Get account by ID"""
+        """Get account by ID (served from the account cache when fresh)"""
+        cached = self.account_cache.get(account_id)
+        if cached is not MISSING:
+            return cached
+        
         try:
             print(f"🔍 get_account_by_id: Getting account {account_id}")
             
-            response = requests.get(
+            response = self.http.get(
                 f"{self.supabase_url}/rest/v1/accounts",
                 headers=self.headers,
                 params={'id': f'eq.{account_id}'}
@@ -1012,6 +997,7 @@ class DatabaseManager:
                 accounts = response.json()
                 if accounts:
                     print(f"✅ get_account_by_id: Found account {account_id}")
+                    self.account_cache.set(account_id, accounts[0])
                     return accounts[0]
                 else:
                     print(f"📂 get_account_by_id: No account found with ID {account_id}")
@@ -1029,7 +1015,7 @@ class DatabaseManager:
         try:
             print(f"🔍 get_image_by_id: Getting image {image_id}")
             
-            response = requests.get(
+            response = self.http.get(
                 f"{self.supabase_url}/rest/v1/images",
                 headers=self.headers,
                 params={'id': f'eq.{image_id}'}
@@ -1056,7 +1042,7 @@ class DatabaseManager:
         try:
             print(f"🔍 get_caption_by_id: Getting caption {caption_id}")
             
-            response = requests.get(
+            response = self.http.get(
                 f"{self.supabase_url}/rest/v1/captions",
                 headers=self.headers,
                 params={'id': f'eq.{caption_id}'}
@@ -1094,7 +1080,7 @@ class DatabaseManager:
                 'posted_at': datetime.now().isoformat()
             }
             
-            response = requests.post(
+            response = self.http.post(
                 f"{self.supabase_url}/rest/v1/posting_history",
                 headers=self.headers,
                 json=data
@@ -1112,13 +1098,24 @@ class DatabaseManager:
             return False
     
     def _make_request(self, method: str, url: str, **kwargs):
-        """Make HTTP request with proper headers"""
-        return requests.request(method, url, headers=self.headers, **kwargs)
+        """Make HTTP request with proper headers over the pooled session"""
+        return self.http.request(method, url, headers=self.headers, **kwargs)
+    
+    def get_http_metrics(self) -> Dict[str, Any]:
+        """Get connection pool metrics for the Supabase session"""
+        return self.http.get_metrics()
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters for the token and account caches"""
+        return {
+            'tokens': self.token_cache.get_stats(),
+            'accounts': self.account_cache.get_stats()
+        }
     
     def update_image_use_count(self, image_id: int, update_data: dict) -> bool:
         """Update image use count"""
         try:
-            response = requests.patch(
+            response = self.http.patch(
                 f"{self.supabase_url}/rest/v1/images?id=eq.{image_id}",
                 json=update_data,
                 headers=self.headers
@@ -1128,10 +1125,44 @@ class DatabaseManager:
             print(f"❌ Error updating image use count: {e}")
             return False
     
+    def release_images(self, image_ids: List[int]) -> bool:
+        """Give back one use per entry in image_ids (release_images RPC, per-image PATCH fallback)"""
+        if not image_ids:
+            return True
+        
+        try:
+            response = self.http.post(
+                f"{self.supabase_url}/rest/v1/rpc/release_images",
+                headers=self.headers,
+                json={'p_image_ids': image_ids}
+            )
+            if response.status_code == 200:
+                return True
+            
+            print(f"⚠️ release_images: RPC unavailable ({response.status_code}), updating per image")
+            ids = ','.join(str(image_id) for image_id in set(image_ids))
+            response = self.http.get(
+                f"{self.supabase_url}/rest/v1/images",
+                headers=self.headers,
+                params={'select': 'id,use_count', 'id': f'in.({ids})'}
+            )
+            if response.status_code != 200:
+                print(f"❌ release_images: HTTP {response.status_code}: {response.text}")
+                return False
+            
+            ok = True
+            for image in response.json():
+                use_count = max((image.get('use_count') or 0) - image_ids.count(image['id']), 0)
+                ok = self.update_image_use_count(image['id'], {'use_count': use_count}) and ok
+            return ok
+        except Exception as e:
+            print(f"❌ release_images: Error: {e}")
+            return False
+    
     def mark_caption_used(self, caption_id: int) -> bool:
         """Mark caption as used"""
         try:
-            response = requests.patch(
+            response = self.http.patch(
                 f"{self.supabase_url}/rest/v1/captions?id=eq.{caption_id}",
                 json={'used': True},
                 headers=self.headers
@@ -1141,10 +1172,433 @@ class DatabaseManager:
             print(f"❌ Error marking caption used: {e}")
             return False
     
+    def set_captions_used(self, caption_ids: List[int], used: bool = True) -> bool:
+        """Set the used flag on many captions in one request"""
+        if not caption_ids:
+            return True
+        
+        try:
+            ids = ','.join(str(caption_id) for caption_id in caption_ids)
+            response = self.http.patch(
+                f"{self.supabase_url}/rest/v1/captions",
+                params={'id': f'in.({ids})'},
+                json={'used': used},
+                headers={**self.headers, 'Prefer': 'return=minimal'}
+            )
+            
+            if response.status_code in [200, 204]:
+                return True
+            
+            print(f"❌ set_captions_used: HTTP {response.status_code}: {response.text}")
+            return False
+        except Exception as e:
+            print(f"❌ Error updating captions used flag: {e}")
+            return False
+    
+    def bulk_insert_posting_history(self, records: List[Dict]) -> bool:
+        """Insert many posting_history rows in one request (rows must share keys)"""
+        if not records:
+            return True
+        
+        try:
+            response = self.http.post(
+                f"{self.supabase_url}/rest/v1/posting_history",
+                json=records,
+                headers={**self.headers, 'Prefer': 'return=minimal'}
+            )
+            
+            if response.status_code in [200, 201, 204]:
+                print(f"✅ bulk_insert_posting_history: Recorded {len(records)} posts")
+                return True
+            
+            print(f"❌ bulk_insert_posting_history: HTTP {response.status_code}: {response.text}")
+            return False
+        except Exception as e:
+            print(f"❌ bulk_insert_posting_history: Error: {e}")
+            return False
+    
+    def get_staged_posts(self, account_ids: List[int]) -> Dict[int, Dict]:
+        """Get the waiting (unexpired) staged post for each account, keyed by account_id"""
+        if not account_ids:
+            return {}
+        
+        try:
+            ids = ','.join(str(account_id) for account_id in account_ids)
+            response = self.http.get(
+                f"{self.supabase_url}/rest/v1/staged_posts",
+                params={
+                    'account_id': f'in.({ids})',
+                    'status': 'eq.staged',
+                    'expires_at': f'gt.{datetime.now(timezone.utc).isoformat()}'
+                },
+                headers=self.headers
+            )
+            
+            if response.status_code == 200:
+                return {row['account_id']: row for row in response.json()}
+            
+            print(f"❌ get_staged_posts: HTTP {response.status_code}: {response.text}")
+            return {}
+        except Exception as e:
+            print(f"❌ get_staged_posts: Error: {e}")
+            return {}
+    
+    def bulk_insert_staged_posts(self, rows: List[Dict]) -> List[Dict]:
+        """Insert staged posts; returns the rows actually stored (falls back to per-row on conflict)"""
+        if not rows:
+            return []
+        
+        headers = {**self.headers, 'Prefer': 'return=representation'}
+        stored = []
+        try:
+            response = self.http.post(
+                f"{self.supabase_url}/rest/v1/staged_posts",
+                json=rows,
+                headers=headers
+            )
+            
+            if response.status_code in [200, 201]:
+                return response.json()
+            
+            # One account already holding a staged post rejects the whole batch; store the rest
+            print(f"⚠️ bulk_insert_staged_posts: HTTP {response.status_code}, inserting individually")
+            for row in rows:
+                response = self.http.post(
+                    f"{self.supabase_url}/rest/v1/staged_posts",
+                    json=row,
+                    headers=headers
+                )
+                if response.status_code in [200, 201]:
+                    stored.extend(response.json())
+            return stored
+        except Exception as e:
+            print(f"❌ bulk_insert_staged_posts: Error: {e}")
+            return stored
+    
+    def set_staged_posts_status(self, staged_ids: List[int], status: str) -> bool:
+        """Set the status of many staged posts in one request"""
+        if not staged_ids:
+            return True
+        
+        try:
+            ids = ','.join(str(staged_id) for staged_id in staged_ids)
+            response = self.http.patch(
+                f"{self.supabase_url}/rest/v1/staged_posts",
+                params={'id': f'in.({ids})'},
+                json={'status': status, 'updated_at': datetime.now(timezone.utc).isoformat()},
+                headers={**self.headers, 'Prefer': 'return=minimal'}
+            )
+            
+            if response.status_code in [200, 204]:
+                return True
+            
+            print(f"❌ set_staged_posts_status: HTTP {response.status_code}: {response.text}")
+            return False
+        except Exception as e:
+            print(f"❌ set_staged_posts_status: Error: {e}")
+            return False
+    
+    def expire_staged_posts(self) -> List[Dict]:
+        """Mark staged posts whose container lifetime has passed as expired; returns the expired rows"""
+        try:
+            now = datetime.now(timezone.utc).isoformat()
+            response = self.http.patch(
+                f"{self.supabase_url}/rest/v1/staged_posts",
+                params={
+                    'status': 'eq.staged',
+                    'expires_at': f'lte.{now}',
+                    'select': 'id,account_id,caption_id,caption_was_unused'
+                },
+                json={'status': 'expired', 'updated_at': now},
+                headers={**self.headers, 'Prefer': 'return=representation'}
+            )
+            
+            if response.status_code == 200:
+                return response.json()
+            
+            print(f"❌ expire_staged_posts: HTTP {response.status_code}: {response.text}")
+            return []
+        except Exception as e:
+            print(f"❌ expire_staged_posts: Error: {e}")
+            return []
+    
+    def claim_accounts(self, account_ids: List[int], worker_id: str, lease_seconds: int) -> List[int]:
+        """
+        Lease the given accounts to a worker, skipping ones another worker holds
+        
+        Same claimed_by/claimed_until lease as claim_due_accounts; returns the
+        ids actually claimed.
+        """
+        if not account_ids:
+            return []
+        
+        try:
+            now = datetime.now(timezone.utc)
+            ids = ','.join(str(account_id) for account_id in account_ids)
+            response = self.http.patch(
+                f"{self.supabase_url}/rest/v1/accounts",
+                params={
+                    'id': f'in.({ids})',
+                    'or': f'(claimed_until.is.null,claimed_until.lt.{now.isoformat()})',
+                    'select': 'id'
+                },
+                json={
+                    'claimed_by': worker_id,
+                    'claimed_until': (now + timedelta(seconds=lease_seconds)).isoformat()
+                },
+                headers={**self.headers, 'Prefer': 'return=representation'}
+            )
+            for account_id in account_ids:
+                self.account_cache.invalidate(account_id)
+            
+            if response.status_code == 200:
+                return [row['id'] for row in response.json()]
+            
+            print(f"❌ claim_accounts: HTTP {response.status_code}: {response.text}")
+            return []
+        except Exception as e:
+            print(f"❌ claim_accounts: Error: {e}")
+            return []
+
+    def _bulk_upsert(self, table: str, rows: List[Dict], on_conflict: str) -> bool:
+        """Upsert many rows into a table in one request (rows must share the same keys)"""
+        if not rows:
+            return True
+
+        try:
+            response = self.http.post(
+                f"{self.supabase_url}/rest/v1/{table}",
+                params={'on_conflict': on_conflict},
+                json=rows,
+                headers={**self.headers, 'Prefer': 'resolution=merge-duplicates,return=minimal'}
+            )
+
+            if response.status_code in [200, 201, 204]:
+                return True
+
+            print(f"❌ bulk upsert into {table}: HTTP {response.status_code}: {response.text}")
+            return False
+        except Exception as e:
+            print(f"❌ bulk upsert into {table}: Error: {e}")
+            return False
+
+    def get_engagement_cursors(self, account_ids: List[int]) -> Dict[int, Dict]:
+        """Get engagement ingestion cursors keyed by account ID, in one request"""
+        if not account_ids:
+            return {}
+
+        try:
+            ids = ','.join(str(account_id) for account_id in account_ids)
+            response = self.http.get(
+                f"{self.supabase_url}/rest/v1/engagement_cursors",
+                headers=self.headers,
+                params={'account_id': f'in.({ids})'}
+            )
+
+            if response.status_code == 200:
+                return {row['account_id']: row for row in response.json()}
+
+            print(f"❌ get_engagement_cursors: HTTP {response.status_code}: {response.text}")
+            return {}
+        except Exception as e:
+            print(f"❌ get_engagement_cursors: Error: {e}")
+            return {}
+
+    def upsert_engagement_cursors(self, rows: List[Dict]) -> bool:
+        """Store engagement ingestion cursors ({account_id, last_post_at, last_run_at})"""
+        return self._bulk_upsert('engagement_cursors', rows, 'account_id')
+
+    def bulk_upsert_post_engagement(self, rows: List[Dict]) -> bool:
+        """Store the latest insights for many posts, keyed by thread_id"""
+        return self._bulk_upsert('post_engagement', rows, 'thread_id')
+
+    def bulk_upsert_daily_engagement(self, rows: List[Dict]) -> bool:
+        """Store per-account daily engagement totals, keyed by (account_id, post_date)"""
+        return self._bulk_upsert('daily_engagement', rows, 'account_id,post_date')
+
+    def _get_all_pages(self, table: str, params: Dict[str, str], page_size: int = 1000) -> Optional[List[Dict]]:
+        """
+        Read every row matching params, limit/offset page by page
+        
+        PostgREST truncates responses at max-rows (1000 on Supabase), so
+        aggregations must not rely on one response. params must carry a
+        total 'order'. Returns None if any page fails, never a partial list.
+        """
+        rows: List[Dict] = []
+        while True:
+            response = self.http.get(
+                f"{self.supabase_url}/rest/v1/{table}",
+                headers=self.headers,
+                params={**params, 'limit': str(page_size), 'offset': str(len(rows))}
+            )
+            if response.status_code != 200:
+                print(f"❌ _get_all_pages({table}): HTTP {response.status_code}: {response.text}")
+                return None
+            page = response.json()
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+
+    def get_post_engagement(self, account_ids: List[int], since_date: str) -> Optional[List[Dict]]:
+        """Get stored per-post insights for accounts from since_date (YYYY-MM-DD) on (None on failure)"""
+        if not account_ids:
+            return []
+
+        try:
+            ids = ','.join(str(account_id) for account_id in account_ids)
+            return self._get_all_pages('post_engagement', {
+                'select': 'account_id,thread_id,post_date,likes,replies,reposts,quotes,views',
+                'account_id': f'in.({ids})',
+                'post_date': f'gte.{since_date}',
+                'order': 'account_id.asc,thread_id.asc'
+            })
+        except Exception as e:
+            print(f"❌ get_post_engagement: Error: {e}")
+            return None
+
+    def get_daily_engagement(self, since_date: Optional[str] = None, account_id: Optional[int] = None,
+                             dates: Optional[List[str]] = None) -> Optional[List[Dict]]:
+        """
+        Get daily_engagement rows from since_date (YYYY-MM-DD) on, optionally
+        for one account or given dates (None on failure)
+        """
+        if dates is not None and not dates:
+            return []
+
+        try:
+            params = {'order': 'post_date.asc,account_id.asc'}
+            if since_date:
+                params['post_date'] = f'gte.{since_date}'
+            if dates is not None:
+                params['post_date'] = f"in.({','.join(dates)})"
+            if account_id is not None:
+                params['account_id'] = f'eq.{account_id}'
+
+            return self._get_all_pages('daily_engagement', params)
+        except Exception as e:
+            print(f"❌ get_daily_engagement: Error: {e}")
+            return None
+
+    def get_daily_engagement_totals(self, since_date: str) -> Optional[List[Dict]]:
+        """Get precomputed all-account daily totals from since_date on (None if the rollup table is unavailable)"""
+        try:
+            response = self.http.get(
+                f"{self.supabase_url}/rest/v1/daily_engagement_totals",
+                headers=self.headers,
+                params={'post_date': f'gte.{since_date}', 'order': 'post_date.asc'}
+            )
+
+            if response.status_code == 200:
+                return response.json()
+
+            print(f"⚠️ get_daily_engagement_totals: HTTP {response.status_code}: {response.text}")
+            return None
+        except Exception as e:
+            print(f"❌ get_daily_engagement_totals: Error: {e}")
+            return None
+
+    def upsert_daily_engagement_totals(self, rows: List[Dict]) -> bool:
+        """Store all-account daily totals, keyed by post_date"""
+        return self._bulk_upsert('daily_engagement_totals', rows, 'post_date')
+
+    def refresh_engagement_rollups(self, account_ids: List[int], since_date: str) -> Optional[int]:
+        """
+        Rebuild account/day and global/day rollups via the refresh_engagement_rollups RPC
+
+        Returns the number of account/day rows written, or None when the RPC
+        is not deployed so the caller can rebuild the rollups itself.
+        """
+        if not account_ids:
+            return 0
+
+        try:
+            response = self.http.post(
+                f"{self.supabase_url}/rest/v1/rpc/refresh_engagement_rollups",
+                headers=self.headers,
+                json={'p_account_ids': account_ids, 'p_since': since_date}
+            )
+
+            if response.status_code == 200:
+                return int(response.json() or 0)
+
+            print(f"⚠️ refresh_engagement_rollups: RPC unavailable ({response.status_code})")
+            return None
+        except Exception as e:
+            print(f"❌ refresh_engagement_rollups: Error: {e}")
+            return None
+    
+    def update_accounts_bulk(self, rows: List[Dict]) -> Optional[bool]:
+        """
+        Write per-account column updates in one request via the update_accounts_bulk RPC
+        
+        Each row is {'id': ..., <column>: <value>, ...}; rows may carry different
+        columns. Update-only. Returns None when the RPC is not deployed so the
+        caller can fall back to PATCH requests.
+        """
+        if not rows:
+            return True
+        
+        try:
+            response = self.http.post(
+                f"{self.supabase_url}/rest/v1/rpc/update_accounts_bulk",
+                headers=self.headers,
+                json={'p_rows': rows}
+            )
+            for row in rows:
+                self.account_cache.invalidate(row.get('id'))
+            
+            if response.status_code == 200:
+                print(f"✅ update_accounts_bulk: Updated {response.json()} of {len(rows)} accounts")
+                return True
+            
+            if response.status_code == 404:
+                print("⚠️ update_accounts_bulk: RPC unavailable (404)")
+                return None
+            
+            print(f"❌ update_accounts_bulk: HTTP {response.status_code}: {response.text}")
+            return False
+        except Exception as e:
+            print(f"❌ update_accounts_bulk: Error: {e}")
+            return False
+    
+    def bulk_update_accounts(self, account_ids: List[int], data: Dict) -> bool:
+        """
+        Apply the same column values to many existing accounts in one PATCH
+        
+        Update-only (id=in.(...)): accounts deleted meanwhile are not recreated.
+        """
+        if not account_ids:
+            return True
+        
+        try:
+            ids = ','.join(str(account_id) for account_id in account_ids)
+            response = self.http.patch(
+                f"{self.supabase_url}/rest/v1/accounts",
+                params={'id': f'in.({ids})'},
+                json=data,
+                headers={**self.headers, 'Prefer': 'return=minimal'}
+            )
+            for account_id in account_ids:
+                self.account_cache.invalidate(account_id)
+            
+            if response.status_code in [200, 204]:
+                print(f"✅ bulk_update_accounts: Updated {len(account_ids)} accounts")
+                return True
+            
+            print(f"❌ bulk_update_accounts: HTTP {response.status_code}: {response.text}")
+            return False
+        except Exception as e:
+            print(f"❌ bulk_update_accounts: Error: {e}")
+            return False
+    
     def get_token_by_account_id(self, account_id: int) -> Optional[dict]:
-        """Get OAuth token for account"""
+        """Get OAuth token for account (served from the token cache when fresh)"""
+        cached = self.token_cache.get(account_id)
+        if cached is not MISSING:
+            return cached
+        
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.supabase_url}/rest/v1/oauth_tokens",
                 headers=self.headers,
                 params={'account_id': f'eq.{account_id}'}
@@ -1152,8 +1606,11 @@ class DatabaseManager:
             
             if response.status_code == 200:
                 tokens = response.json()
-                if tokens:
-                    return tokens[0]
+                if not tokens:
+                    # Not cached: a token stored by another worker must be seen right away
+                    return None
+                self.token_cache.set(account_id, tokens[0])
+                return tokens[0]
             return None
         except Exception as e:
             print(f"❌ Error getting token: {e}")
@@ -1178,7 +1635,7 @@ class DatabaseManager:
             
             if existing_token:
                 # Update existing token
-                response = requests.patch(
+                response = self.http.patch(
                     f"{self.supabase_url}/rest/v1/oauth_tokens?id=eq.{existing_token['id']}",
                     json=token_record,
                     headers=self.headers
@@ -1186,11 +1643,12 @@ class DatabaseManager:
             else:
                 # Create new token
                 token_record['created_at'] = datetime.now().isoformat()
-                response = requests.post(
+                response = self.http.post(
                     f"{self.supabase_url}/rest/v1/oauth_tokens",
                     json=token_record,
                     headers=self.headers
                 )
+            self.token_cache.invalidate(account_id)
             
             print(f"🔍 store_access_token: Response status: {response.status_code}")
             return response.status_code in [200, 201, 204]
@@ -1204,7 +1662,7 @@ class DatabaseManager:
         try:
             print(f"🔍 get_last_posted_for_account: Getting last posted for account {account_id}")
             
-            response = requests.get(
+            response = self.http.get(
                 f"{self.supabase_url}/rest/v1/posting_history",
                 headers=self.headers,
                 params={
@@ -1228,4 +1686,183 @@ class DatabaseManager:
                 
         except Exception as e:
             print(f"❌ get_last_posted_for_account: Error: {e}")
-            return None 
\ No newline at end of file
+            return None
+    
+    def get_accounts_overview(self) -> Optional[List[Dict]]:
+        """
+        Get active accounts with token presence and last successful post time
+        
+        Reads the account_overview view in one request. If the view is not
+        deployed yet, falls back to three bulk requests (accounts, tokens,
+        account_last_posted).
+        Returns None if the accounts could not be fetched at all.
+        """
+        try:
+            response = self.http.get(
+                f"{self.supabase_url}/rest/v1/account_overview",
+                headers=self.headers
+            )
+            
+            if response.status_code == 200:
+                accounts = response.json()
+                if accounts and 'status' in accounts[0]:
+                    accounts = [a for a in accounts if a.get('status') == 'enabled']
+                print(f"✅ get_accounts_overview: Retrieved {len(accounts)} accounts")
+                return accounts
+            
+            print(f"⚠️ get_accounts_overview: View unavailable (HTTP {response.status_code}), using bulk fallback")
+            
+            response = self.http.get(
+                f"{self.supabase_url}/rest/v1/accounts",
+                headers=self.headers
+            )
+            if response.status_code != 200:
+                print(f"❌ get_accounts_overview: HTTP {response.status_code}: {response.text}")
+                return None
+            
+            accounts = response.json()
+            if accounts and 'status' in accounts[0]:
+                accounts = [a for a in accounts if a.get('status') == 'enabled']
+            
+            account_ids = [a['id'] for a in accounts]
+            token_account_ids = self.get_token_account_ids(account_ids)
+            last_posted = self.get_last_posted_at(account_ids)
+            for account in accounts:
+                account['has_token'] = account['id'] in token_account_ids
+                account['last_posted_from_history'] = last_posted.get(account['id'])
+            
+            return accounts
+            
+        except Exception as e:
+            print(f"❌ get_accounts_overview: Error: {e}")
+            return None
+    
+    def get_token_account_ids(self, account_ids: List[int]) -> set:
+        """Get the subset of account IDs that have an OAuth token, in one request"""
+        if not account_ids:
+            return set()
+        
+        try:
+            ids = ','.join(str(account_id) for account_id in account_ids)
+            response = self.http.get(
+                f"{self.supabase_url}/rest/v1/oauth_tokens",
+                headers=self.headers,
+                params={'select': 'account_id', 'account_id': f'in.({ids})'}
+            )
+            
+            if response.status_code == 200:
+                return {row['account_id'] for row in response.json()}
+            
+            print(f"❌ get_token_account_ids: HTTP {response.status_code}: {response.text}")
+            return set()
+            
+        except Exception as e:
+            print(f"❌ get_token_account_ids: Error: {e}")
+            return set()
+
+    def get_last_posted_at(self, account_ids: List[int]) -> Dict[int, str]:
+        """
+        Get the latest successful posted_at per account
+        
+        One request to the account_last_posted view (one row per account).
+        Without the view, falls back to one newest-row lookup per account.
+        """
+        if not account_ids:
+            return {}
+        
+        try:
+            ids = ','.join(str(account_id) for account_id in account_ids)
+            response = self.http.get(
+                f"{self.supabase_url}/rest/v1/account_last_posted",
+                headers=self.headers,
+                params={'select': 'account_id,last_posted_at', 'account_id': f'in.({ids})'}
+            )
+            
+            if response.status_code == 200:
+                return {row['account_id']: row['last_posted_at'] for row in response.json()}
+            
+            print(f"⚠️ get_last_posted_at: View unavailable (HTTP {response.status_code}), querying per account")
+            last_posted = {}
+            for account_id in account_ids:
+                response = self.http.get(
+                    f"{self.supabase_url}/rest/v1/posting_history",
+                    headers=self.headers,
+                    params={
+                        'select': 'posted_at',
+                        'account_id': f'eq.{account_id}',
+                        'status': 'eq.posted',
+                        'order': 'posted_at.desc',
+                        'limit': '1'
+                    }
+                )
+                if response.status_code == 200 and response.json():
+                    last_posted[account_id] = response.json()[0]['posted_at']
+            return last_posted
+            
+        except Exception as e:
+            print(f"❌ get_last_posted_at: Error: {e}")
+            return {}
+
+    def get_oauth_tokens(self, account_ids: Optional[List[int]] = None) -> List[Dict]:
+        """Get OAuth tokens for the given accounts (all connected accounts if None), in one request"""
+        if account_ids is not None and not account_ids:
+            return []
+
+        try:
+            params = {'select': 'account_id,access_token,refresh_token,expires_at', 'access_token': 'not.is.null'}
+            if account_ids is not None:
+                params['account_id'] = f"in.({','.join(str(account_id) for account_id in account_ids)})"
+
+            response = self.http.get(
+                f"{self.supabase_url}/rest/v1/oauth_tokens",
+                headers=self.headers,
+                params=params
+            )
+
+            if response.status_code == 200:
+                return response.json()
+
+            print(f"❌ get_oauth_tokens: HTTP {response.status_code}: {response.text}")
+            return []
+
+        except Exception as e:
+            print(f"❌ get_oauth_tokens: Error: {e}")
+            return []
+
+# Process-wide shared instance (created lazily on first use)
+_db_instance: Optional[DatabaseManager] = None
+_db_factory: Callable[[], DatabaseManager] = DatabaseManager
+_db_lock = Lock()
+
+def get_db() -> DatabaseManager:
+    """Get the shared DatabaseManager, creating it on first call"""
+    global _db_instance
+    
+    instance = _db_instance
+    if instance is not None:
+        return instance
+    
+    with _db_lock:
+        if _db_instance is None:
+            _db_instance = _db_factory()
+        return _db_instance
+
+def set_db_factory(factory: Optional[Callable[[], DatabaseManager]] = None):
+    """
+    Override how the shared DatabaseManager is built (e.g. a stub in tests)
+    
+    Passing None restores the default factory. The current instance is
+    dropped so the next get_db() call uses the new factory.
+    """
+    global _db_instance, _db_factory
+    
+    with _db_lock:
+        _db_factory = factory or DatabaseManager
+        _db_instance = None
+
+def reset_db():
+    """Drop the shared instance so the next get_db() rebuilds it"""
+    global _db_instance
+    
+    with _db_lock:
+        _db_instance = None
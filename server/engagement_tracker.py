@@ -1,74 +1,365 @@
 #!/usr/bin/env python3
 """
 Engagement Tracker Module
-Placeholder implementation for engagement statistics
+Incremental ingestion of per-post Threads insights, rolled up per account/day and per day
 """
 
+import os
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, Any, List
+import concurrent.futures
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple
+
+from database import get_db
+from services.graph_client import graph_client
+from services.meta_quota import meta_quota
+
+logger = logging.getLogger(__name__)
+
+INSIGHT_METRICS = ('likes', 'replies', 'reposts', 'quotes', 'views')
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """Parse Graph / PostgREST timestamps ("...+0000", "...Z", "...+00:00") as aware UTC datetimes"""
+    if not value:
+        return None
+    try:
+        value = value.replace('Z', '+00:00')
+        if len(value) > 5 and value[-5] in '+-' and value[-3] != ':':
+            value = f"{value[:-2]}:{value[-2:]}"
+        parsed = datetime.fromisoformat(value)
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+def parse_insights(data: Dict[str, Any]) -> Dict[str, int]:
+    """Metric name -> value from a /{media-id}/insights response"""
+    values = {}
+    for metric in data.get('data', []):
+        if 'total_value' in metric:
+            value = metric['total_value'].get('value')
+        else:
+            value = (metric.get('values') or [{}])[0].get('value')
+        values[metric.get('name')] = int(value or 0)
+    return values
 
 class EngagementTracker:
-    """Placeholder engagement tracker for statistics"""
-    
+    """
+    Pulls per-post insights for every connected account
+
+    Each run lists only posts newer than the account's stored cursor, plus
+    every post inside a sliding re-fetch window (recent posts keep
+    collecting likes/views), fetches their insights, upserts them into
+    post_engagement in bulk and rebuilds the affected days of the rollups
+    (daily_engagement per account/day, daily_engagement_totals per day)
+    from the stored per-post rows.
+    """
+
     def __init__(self):
-        self.data = {}
-    
-    def get_daily_engagement_stats(self, days: int = 7) -> Dict[str, Any]:
-        """Get daily engagement statistics (placeholder)"""
+        self.refetch_days = int(os.getenv('ENGAGEMENT_REFETCH_DAYS', '3'))
+        self.backfill_days = int(os.getenv('ENGAGEMENT_BACKFILL_DAYS', '30'))
+        self.max_posts = int(os.getenv('ENGAGEMENT_MAX_POSTS_PER_ACCOUNT', '200'))
+        self.page_size = int(os.getenv('ENGAGEMENT_PAGE_SIZE', '50'))
+        self.account_concurrency = int(os.getenv('ENGAGEMENT_ACCOUNT_CONCURRENCY', '5'))
+        self.insight_concurrency = int(os.getenv('ENGAGEMENT_INSIGHT_CONCURRENCY', '20'))
+        self.timeout = float(os.getenv('ENGAGEMENT_REFRESH_TIMEOUT_SECONDS', '600'))
+
+        logger.info(f"📈 EngagementTracker initialized (re-fetch window: {self.refetch_days}d)")
+
+    def get_daily_engagement_stats(self, days: int = 7, account_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Get daily engagement statistics for the last `days` days
+
+        Reads only the window's precomputed rows: daily_engagement_totals for
+        all accounts, or daily_engagement for a single account.
+        """
         try:
-            # Generate placeholder data
-            stats = {
+            today = datetime.now(timezone.utc).date()
+            start = (today - timedelta(days=days - 1)).isoformat()
+            db = get_db()
+
+            rows = None
+            if account_id is None:
+                rows = db.get_daily_engagement_totals(start)
+            if rows is None:
+                # Per-account rows (or all accounts' rows when the totals table is not deployed yet)
+                rows = db.get_daily_engagement(start, account_id=account_id)
+            if rows is None:
+                raise Exception("daily engagement rows could not be read")
+
+            empty = {'posts': 0, **{metric: 0 for metric in INSIGHT_METRICS}}
+            by_date: Dict[str, Dict[str, int]] = {}
+            for row in rows:
+                day = by_date.setdefault(row['post_date'], dict(empty))
+                day['posts'] += row.get('post_count') or 0
+                for metric in INSIGHT_METRICS:
+                    day[metric] += row.get(metric) or 0
+
+            daily_stats = []
+            for i in range(days):
+                date = (today - timedelta(days=i)).isoformat()
+                day = by_date.get(date, empty)
+                interactions = day['likes'] + day['replies'] + day['reposts'] + day['quotes']
+                daily_stats.append({
+                    "date": date,
+                    "posts": day['posts'],
+                    "likes": day['likes'],
+                    "comments": day['replies'],
+                    "shares": day['reposts'] + day['quotes'],
+                    "views": day['views'],
+                    "engagement_rate": round(interactions / day['views'] * 100, 2) if day['views'] else 0.0
+                })
+
+            totals = {key: sum(day[key] for day in daily_stats) for key in ('posts', 'likes', 'comments', 'shares', 'views')}
+            interactions = totals['likes'] + totals['comments'] + totals['shares']
+
+            return {
                 "success": True,
                 "period_days": days,
+                "account_id": account_id,
                 "data": {
-                    "total_posts": 0,
-                    "total_likes": 0,
-                    "total_comments": 0,
-                    "total_shares": 0,
-                    "average_engagement_rate": 0.0,
-                    "daily_stats": []
+                    "total_posts": totals['posts'],
+                    "total_likes": totals['likes'],
+                    "total_comments": totals['comments'],
+                    "total_shares": totals['shares'],
+                    "total_views": totals['views'],
+                    "average_engagement_rate": round(interactions / totals['views'] * 100, 2) if totals['views'] else 0.0,
+                    "daily_stats": daily_stats
                 },
-                "timestamp": datetime.now().isoformat(),
-                "message": "Engagement tracking not yet implemented"
+                "timestamp": datetime.now().isoformat()
             }
-            
-            # Generate daily placeholder data
-            for i in range(days):
-                date = datetime.now() - timedelta(days=i)
-                stats["data"]["daily_stats"].append({
-                    "date": date.strftime("%Y-%m-%d"),
-                    "posts": 0,
-                    "likes": 0,
-                    "comments": 0,
-                    "shares": 0,
-                    "engagement_rate": 0.0
-                })
-            
-            return stats
-            
+
         except Exception as e:
             return {
                 "success": False,
                 "error": f"Failed to get engagement stats: {str(e)}",
                 "timestamp": datetime.now().isoformat()
             }
-    
-    async def refresh_engagement_data(self) -> Dict[str, Any]:
-        """Refresh engagement data (placeholder)"""
+
+    async def _list_posts(self, token: str, account_id: int, since: datetime) -> List[Dict[str, Any]]:
+        """Posts published at or after `since`, newest first, following the paging cursor"""
+        params = {'fields': 'id,timestamp', 'since': int(since.timestamp()), 'limit': self.page_size}
+        posts: List[Dict[str, Any]] = []
+
+        while len(posts) < self.max_posts:
+            page = await graph_client.client.request('GET', 'me/threads', token, account_id, params=params)
+            for post in page.get('data', []):
+                posted_at = parse_timestamp(post.get('timestamp'))
+                # Pages are newest first; stop at the first post older than the cutoff
+                if posted_at is None or posted_at < since:
+                    return posts
+                posts.append({'id': post['id'], 'posted_at': posted_at})
+
+            paging = page.get('paging', {})
+            after = paging.get('cursors', {}).get('after')
+            if not after or not paging.get('next'):
+                break
+            params = {**params, 'after': after}
+
+        return posts[:self.max_posts]
+
+    async def _ingest_account(self, token_row: Dict[str, Any], cursor: Optional[Dict[str, Any]],
+                              now: datetime, insight_slots: asyncio.Semaphore) -> Dict[str, Any]:
+        account_id = token_row['account_id']
+        token = token_row['access_token']
+
+        last_post_at = parse_timestamp((cursor or {}).get('last_post_at'))
+        window_start = now - timedelta(days=self.refetch_days)
+        since = min(last_post_at, window_start) if last_post_at else now - timedelta(days=self.backfill_days)
+
+        posts = await self._list_posts(token, account_id, since)
+
+        async def fetch_insights(post: Dict[str, Any]):
+            async with insight_slots:
+                return await graph_client.client.request('GET', f"{post['id']}/insights", token, account_id,
+                                                         params={'metric': ','.join(INSIGHT_METRICS)})
+
+        results = await asyncio.gather(*(fetch_insights(post) for post in posts), return_exceptions=True)
+
+        rows, failed_at = [], []
+        for post, result in zip(posts, results):
+            if isinstance(result, Exception):
+                # Keep the previously stored values; the cursor below stops at this post so it is retried
+                failed_at.append(post['posted_at'])
+                continue
+            insights = parse_insights(result)
+            rows.append({
+                'account_id': account_id,
+                'thread_id': post['id'],
+                'posted_at': post['posted_at'].isoformat(),
+                'post_date': post['posted_at'].date().isoformat(),
+                **{metric: insights.get(metric, 0) for metric in INSIGHT_METRICS},
+                'fetched_at': now.isoformat()
+            })
+
+        if failed_at:
+            # Posts at or after the cursor are listed again next run, so stop at the oldest failure
+            newest = min(failed_at)
+        else:
+            newest = max([post['posted_at'] for post in posts] + ([last_post_at] if last_post_at else []), default=None)
+
+        return {
+            'account_id': account_id,
+            'rows': rows,
+            'failed': len(failed_at),
+            'since_date': min((post['posted_at'] for post in posts), default=since).date(),
+            'cursor': {
+                'account_id': account_id,
+                'last_post_at': newest.isoformat() if newest else None,
+                'last_run_at': now.isoformat(),
+                'updated_at': now.isoformat()
+            }
+        }
+
+    def _rebuild_daily(self, since_dates: Dict[int, Any], now: datetime) -> List[Dict[str, Any]]:
+        """Recompute daily_engagement rows from post_engagement for each account's affected days"""
+        db = get_db()
+        rows = db.get_post_engagement(list(since_dates), min(since_dates.values()).isoformat())
+        if rows is None:
+            # Rebuilding from a partial read would overwrite correct rows with undercounts
+            raise Exception("post_engagement could not be read; daily rollups not rebuilt")
+
+        days: Dict[Tuple[int, str], Dict[str, Any]] = {}
+        for row in rows:
+            if row['post_date'] < since_dates[row['account_id']].isoformat():
+                continue
+            key = (row['account_id'], row['post_date'])
+            day = days.setdefault(key, {
+                'account_id': row['account_id'],
+                'post_date': row['post_date'],
+                'post_count': 0,
+                **{metric: 0 for metric in INSIGHT_METRICS}
+            })
+            day['post_count'] += 1
+            for metric in INSIGHT_METRICS:
+                day[metric] += row.get(metric) or 0
+
+        daily_rows = []
+        for day in days.values():
+            day['total_engagement'] = day['likes'] + day['replies'] + day['reposts'] + day['quotes']
+            day['updated_at'] = now.isoformat()
+            daily_rows.append(day)
+
+        return daily_rows if db.bulk_upsert_daily_engagement(daily_rows) else []
+
+    def _rebuild_totals(self, dates: List[str], now: datetime) -> bool:
+        """Recompute daily_engagement_totals for the given days from the account/day rows"""
+        db = get_db()
+        rows = db.get_daily_engagement(dates=dates)
+        if rows is None:
+            raise Exception("daily_engagement could not be read; daily totals not rebuilt")
+
+        totals: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            day = totals.setdefault(row['post_date'], {
+                'post_date': row['post_date'],
+                'account_count': 0,
+                'post_count': 0,
+                'total_engagement': 0,
+                **{metric: 0 for metric in INSIGHT_METRICS}
+            })
+            day['account_count'] += 1
+            day['post_count'] += row.get('post_count') or 0
+            day['total_engagement'] += row.get('total_engagement') or 0
+            for metric in INSIGHT_METRICS:
+                day[metric] += row.get(metric) or 0
+
+        for day in totals.values():
+            day['updated_at'] = now.isoformat()
+        return db.upsert_daily_engagement_totals(list(totals.values()))
+
+    def _update_rollups(self, since_dates: Dict[int, Any], now: datetime) -> int:
+        """
+        Maintain the account/day and global/day rollups for the days just ingested
+
+        Uses the refresh_engagement_rollups RPC when deployed, otherwise
+        rebuilds both levels here. Either way only the ingested window is
+        touched, so the cost does not grow with total post history. Raises
+        if the fallback cannot read its source rows, so the run fails and
+        the cursors stay put instead of storing undercounts.
+        """
+        if not since_dates:
+            return 0
+
+        written = get_db().refresh_engagement_rollups(sorted(since_dates), min(since_dates.values()).isoformat())
+        if written is not None:
+            return written
+
+        daily_rows = self._rebuild_daily(since_dates, now)
+        if daily_rows:
+            self._rebuild_totals(sorted({row['post_date'] for row in daily_rows}), now)
+        return len(daily_rows)
+
+    async def _refresh(self, account_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        """Ingestion run; executes on the graph client's event loop"""
+        loop = asyncio.get_running_loop()
+        db = get_db()
+        now = datetime.now(timezone.utc)
+
+        tokens = await loop.run_in_executor(None, db.get_oauth_tokens, account_ids)
+        ready = [row for row in tokens if meta_quota.defer_seconds(row['account_id']) == 0]
+        cursors = await loop.run_in_executor(None, db.get_engagement_cursors, [row['account_id'] for row in ready])
+
+        account_slots = asyncio.Semaphore(max(1, self.account_concurrency))
+        insight_slots = asyncio.Semaphore(max(1, self.insight_concurrency))
+
+        async def ingest(token_row: Dict[str, Any]):
+            async with account_slots:
+                return await self._ingest_account(token_row, cursors.get(token_row['account_id']), now, insight_slots)
+
+        results = await asyncio.gather(*(ingest(row) for row in ready), return_exceptions=True)
+
+        ingested = [result for result in results if not isinstance(result, Exception)]
+        for token_row, result in zip(ready, results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ Engagement ingestion failed for account {token_row['account_id']}: {result}")
+
+        post_rows = [row for result in ingested for row in result['rows']]
+        stored = await loop.run_in_executor(None, db.bulk_upsert_post_engagement, post_rows)
+
+        days_updated = 0
+        if stored:
+            since_dates = {result['account_id']: result['since_date'] for result in ingested if result['rows']}
+            days_updated = await loop.run_in_executor(None, self._update_rollups, since_dates, now)
+            # Cursors only advance once the posts behind them are stored
+            await loop.run_in_executor(None, db.upsert_engagement_cursors, [result['cursor'] for result in ingested])
+
+        return {
+            'accounts': len(ingested),
+            'failed_accounts': len(results) - len(ingested),
+            'deferred_accounts': len(tokens) - len(ready),
+            'posts': len(post_rows),
+            'failed_posts': sum(result['failed'] for result in ingested),
+            'days_updated': days_updated,
+            'data_updated': bool(stored and post_rows)
+        }
+
+    def refresh_engagement_data(self, account_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        """
+        Refresh engagement data for all connected accounts (or just account_ids)
+
+        Blocking; the run happens on the graph client's loop (its aiohttp
+        session lives there) via the graph_client.run sync facade.
+        """
+        started = datetime.now()
         try:
-            # Simulate async operation
-            await asyncio.sleep(0.1)
-            
+            try:
+                result = graph_client.run(self._refresh(account_ids), self.timeout)
+            except concurrent.futures.TimeoutError:
+                raise TimeoutError(f"timed out after {self.timeout:g}s")
+
+            logger.info(f"📈 Engagement refresh: {result['posts']} posts from {result['accounts']} accounts, "
+                        f"{result['days_updated']} days updated")
             return {
                 "success": True,
-                "message": "Engagement data refresh completed (placeholder)",
+                "message": "Engagement data refresh completed",
                 "timestamp": datetime.now().isoformat(),
-                "data_updated": False,
-                "note": "Real engagement tracking not yet implemented"
+                "duration_seconds": round((datetime.now() - started).total_seconds(), 2),
+                **result
             }
-            
+
         except Exception as e:
+            logger.error(f"❌ Engagement refresh failed: {e}")
             return {
                 "success": False,
                 "error": f"Failed to refresh engagement data: {str(e)}",
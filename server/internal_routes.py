@@ -5,7 +5,7 @@ Protected endpoints for handling Meta-compliant data deletion
 """
 
 from flask import Blueprint, request, jsonify, current_app
-from database import DatabaseManager
+from database import get_db
 import os
 import logging
 
@@ -55,7 +55,7 @@ def delete_user_data():
         logger.info(f"Processing data deletion for user_id: {user_id}, token: {token}")
         
         # Initialize database
-        db = DatabaseManager()
+        db = get_db()
         
         # Delete user data from all tables
         deletion_results = {}
@@ -4,67 +4,28 @@ Meta Client for Threads API
 Handles posting and user stats via official Threads API
 """
 
-import os
 import logging
-import requests
-from typing import Optional, Dict, Any, List
-from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+from services.graph_client import graph_client
+from services.stats_collector import stats_collector
 
 logger = logging.getLogger(__name__)
 
 class MetaClient:
+    """Blocking facade over the shared async Graph client (pooled, with timeouts)"""
+    
     def __init__(self):
-        self.base_url = "https://graph.threads.net/"
-        self.api_version = os.getenv('GRAPH_API_VERSION', 'v1.0')
-        self.api_url = f"{self.base_url}{self.api_version}/"
+        self.graph = graph_client
+        self.api_url = self.graph.client.api_url
         
         logger.info("✅ MetaClient initialized")
     
-    def post_thread(self, token: str, text: str, image_url: Optional[str] = None) -> Dict[str, Any]:
-        """Post a thread via Threads API"""
+    def post_thread(self, token: str, text: str, image_url: Optional[str] = None,
+                    account_id: Optional[int] = None) -> Dict[str, Any]:
+        """Post a thread via Threads API (account_id attributes quota usage)"""
+        logger.info(f"📝 Posting thread with text: {text[:50]}...")
         try:
-            logger.info(f"📝 Posting thread with text: {text[:50]}...")
-            
-            # Build post parameters
-            params = {
-                'text': text,
-            }
-            
-            # Add image if provided
-            if image_url:
-                params['media_url'] = image_url
-            
-            # Create post
-            url = f"{self.api_url}me/threads"
-            headers = {
-                'Authorization': f'Bearer {token}',
-                'Content-Type': 'application/json',
-            }
-            
-            response = requests.post(url, json=params, headers=headers)
-            
-            if not response.ok:
-                logger.error(f"❌ Post creation failed: {response.status_code} - {response.text}")
-                raise Exception(f"Post creation failed: {response.text}")
-            
-            post_data = response.json()
-            container_id = post_data.get('id')
-            
-            if not container_id:
-                raise Exception("No container ID received")
-            
-            logger.info(f"✅ Post created successfully, container: {container_id}")
-            
-            # Publish the post
-            publish_result = self._publish_post(token, container_id)
-            
-            return {
-                'success': True,
-                'container_id': container_id,
-                'thread_id': publish_result.get('thread_id'),
-                'status': 'published'
-            }
-            
+            return self.graph.post_thread(token, text, image_url, account_id)
         except Exception as e:
             logger.error(f"❌ Error posting thread: {e}")
             return {
@@ -72,33 +33,11 @@ class MetaClient:
                 'error': str(e)
             }
     
-    def _publish_post(self, token: str, container_id: str) -> Dict[str, Any]:
+    def _publish_post(self, token: str, container_id: str, account_id: Optional[int] = None) -> Dict[str, Any]:
         """Publish a created post"""
         try:
             logger.info(f"🚀 Publishing post {container_id}")
-            
-            url = f"{self.api_url}me/threads_publish"
-            headers = {
-                'Authorization': f'Bearer {token}',
-                'Content-Type': 'application/json',
-            }
-            
-            params = {
-                'creation_id': container_id,
-            }
-            
-            response = requests.post(url, json=params, headers=headers)
-            
-            if not response.ok:
-                logger.error(f"❌ Post publishing failed: {response.status_code} - {response.text}")
-                raise Exception(f"Post publishing failed: {response.text}")
-            
-            publish_data = response.json()
-            thread_id = publish_data.get('id')
-            
-            if not thread_id:
-                raise Exception("No thread ID received")
-            
+            thread_id = self.graph.run(self.graph.client.publish_container(token, container_id, account_id))
             logger.info(f"✅ Post published successfully, thread: {thread_id}")
             
             return {
@@ -110,47 +49,11 @@ class MetaClient:
             logger.error(f"❌ Error publishing post: {e}")
             raise
     
-    def get_user_stats(self, token: str) -> Dict[str, Any]:
+    def get_user_stats(self, token: str, account_id: Optional[int] = None) -> Dict[str, Any]:
         """Get user statistics from Threads API"""
+        logger.info("📊 Getting user stats")
         try:
-            logger.info("📊 Getting user stats")
-            
-            url = f"{self.api_url}me"
-            headers = {
-                'Authorization': f'Bearer {token}',
-            }
-            
-            params = {
-                'fields': 'id,username,threads_biography,threads_profile_picture_url,follower_count',
-            }
-            
-            response = requests.get(url, params=params, headers=headers)
-            
-            if not response.ok:
-                logger.error(f"❌ User stats failed: {response.status_code} - {response.text}")
-                raise Exception(f"User stats failed: {response.text}")
-            
-            user_data = response.json()
-            
-            # Get recent posts for engagement stats
-            posts_data = self._get_recent_posts(token)
-            
-            stats = {
-                'user_id': user_data.get('id'),
-                'username': user_data.get('username'),
-                'biography': user_data.get('threads_biography'),
-                'profile_picture': user_data.get('threads_profile_picture_url'),
-                'follower_count': user_data.get('follower_count', 0),
-                'recent_posts': posts_data.get('posts', []),
-                'total_posts': len(posts_data.get('posts', [])),
-            }
-            
-            logger.info(f"✅ User stats retrieved for {user_data.get('username', 'unknown')}")
-            return {
-                'success': True,
-                'data': stats
-            }
-            
+            return self.graph.get_user_stats(token, account_id)
         except Exception as e:
             logger.error(f"❌ Error getting user stats: {e}")
             return {
@@ -158,27 +61,24 @@ class MetaClient:
                 'error': str(e)
             }
     
-    def _get_recent_posts(self, token: str, limit: int = 10) -> Dict[str, Any]:
+    def get_user_stats_many(self, accounts: List[Tuple[str, Optional[int]]]) -> List[Dict[str, Any]]:
+        """Get user statistics for many (token, account_id) pairs via the batched stats collector"""
+        try:
+            tokens = [{'access_token': token, 'account_id': account_id} for token, account_id in accounts]
+            return stats_collector.collect(
+                tokens,
+                profile_fields='id,username,threads_biography,threads_profile_picture_url,follower_count',
+                post_fields='id,text,media_type,media_url,permalink,timestamp,likes,replies,reposts,quotes,views',
+                max_posts=10
+            )
+        except Exception as e:
+            logger.error(f"❌ Error getting user stats: {e}")
+            return [{'success': False, 'error': str(e)} for _ in accounts]
+    
+    def _get_recent_posts(self, token: str, limit: int = 10, account_id: Optional[int] = None) -> Dict[str, Any]:
         """Get recent posts for engagement analysis"""
         try:
-            url = f"{self.api_url}me/threads"
-            headers = {
-                'Authorization': f'Bearer {token}',
-            }
-            
-            params = {
-                'fields': 'id,text,media_type,media_url,permalink,timestamp,likes,replies,reposts,quotes,views',
-                'limit': limit,
-            }
-            
-            response = requests.get(url, params=params, headers=headers)
-            
-            if not response.ok:
-                logger.error(f"❌ Recent posts failed: {response.status_code} - {response.text}")
-                return {'posts': []}
-            
-            data = response.json()
-            posts = data.get('data', [])
+            posts = self.graph.get_recent_posts(token, limit, account_id)
             
             # Calculate engagement metrics
             total_likes = sum(post.get('likes', 0) for post in posts)
@@ -203,17 +103,10 @@ class MetaClient:
             logger.error(f"❌ Error getting recent posts: {e}")
             return {'posts': []}
     
-    def validate_token(self, token: str) -> bool:
+    def validate_token(self, token: str, account_id: Optional[int] = None) -> bool:
         """Validate if a token is still valid"""
         try:
-            url = f"{self.api_url}me"
-            headers = {
-                'Authorization': f'Bearer {token}',
-            }
-            
-            response = requests.get(url, headers=headers)
-            return response.ok
-            
+            return self.graph.validate_token(token, account_id)
         except Exception as e:
             logger.error(f"❌ Error validating token: {e}")
             return False
@@ -10,7 +10,7 @@ import logging
 from datetime import datetime, timedelta
 from urllib.parse import urlencode
 from typing import Optional, Dict, Any
-from database import DatabaseManager
+from database import get_db
 
 logger = logging.getLogger(__name__)
 
@@ -69,7 +69,7 @@ class MetaOAuthHelper:
             state = secrets.token_urlsafe(32)
             
             # Store in database
-            db = DatabaseManager()
+            db = get_db()
             if db.store_oauth_state(account_id, state):
                 logger.info(f"✅ Generated and stored OAuth state for account {account_id}")
                 return state
@@ -83,7 +83,7 @@ class MetaOAuthHelper:
     def validate_state(self, state: str) -> Optional[int]:
         """Validate and retrieve account_id from state"""
         try:
-            db = DatabaseManager()
+            db = get_db()
             account_id = db.get_oauth_state_account_id(state)
             
             if account_id:
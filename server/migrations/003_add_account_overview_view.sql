@@ -0,0 +1,58 @@
+-- Migration: Add account overview view
+-- Date: 2025-01-XX
+-- Description: One-query account listing with token presence and last post time
+
+-- OAuth tokens table used by DatabaseManager.store_access_token
+CREATE TABLE IF NOT EXISTS oauth_tokens (
+    id SERIAL PRIMARY KEY,
+    account_id INTEGER REFERENCES accounts(id) ON DELETE CASCADE,
+    access_token TEXT NOT NULL,
+    refresh_token TEXT,
+    expires_at TIMESTAMP,
+    scope TEXT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Older deployments may hold several tokens per account; keep only the newest
+-- row for each so the unique index below can be created
+DELETE FROM oauth_tokens
+WHERE id IN (
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (
+            PARTITION BY account_id
+            ORDER BY updated_at DESC NULLS LAST, created_at DESC NULLS LAST, id DESC
+        ) AS rn
+        FROM oauth_tokens
+    ) ranked
+    WHERE ranked.rn > 1
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_oauth_tokens_account_id ON oauth_tokens(account_id);
+
+-- Supports the correlated "latest successful post" lookup below
+CREATE INDEX IF NOT EXISTS idx_posting_history_account_posted
+  ON posting_history(account_id, posted_at DESC)
+  WHERE status = 'posted';
+
+-- Account rows plus the data GET /api/accounts used to fetch per account.
+-- Note: a.* is expanded when the view is created; migrations that add
+-- columns to accounts must recreate the view (006 does).
+CREATE OR REPLACE VIEW account_overview AS
+SELECT
+    a.*,
+    EXISTS (
+        SELECT 1 FROM oauth_tokens t WHERE t.account_id = a.id
+    ) AS has_token,
+    (
+        SELECT max(ph.posted_at)
+        FROM posting_history ph
+        WHERE ph.account_id = a.id AND ph.status = 'posted'
+    ) AS last_posted_from_history
+FROM accounts a;
+
+GRANT SELECT ON account_overview TO service_role;
+
+-- Add comments for documentation
+COMMENT ON TABLE oauth_tokens IS 'OAuth access tokens for Meta Threads API, one row per account';
+COMMENT ON VIEW account_overview IS 'Accounts with token presence and last successful post time for the dashboard listing';
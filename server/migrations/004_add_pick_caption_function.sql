@@ -0,0 +1,82 @@
+-- Migration: Add pick_caption function
+-- Date: 2025-01-XX
+-- Description: Pick and claim a caption in one round trip for autopilot
+
+-- Track when each caption was last handed out (least-recently-used rotation)
+ALTER TABLE captions ADD COLUMN IF NOT EXISTS last_used_at TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS idx_captions_unused_lru
+  ON captions(last_used_at NULLS FIRST, id)
+  WHERE used = false;
+
+CREATE INDEX IF NOT EXISTS idx_captions_lru
+  ON captions(last_used_at NULLS FIRST, id);
+
+-- Picks a caption and marks it used atomically.
+-- Preference order: unused captions, then any caption, both excluding
+-- p_exclude_id; finally any caption at all so a one-caption library still
+-- posts. Within a tier it takes the p_candidates least recently used rows
+-- (index scan, not a full-table sort) and chooses one of them at random.
+-- SKIP LOCKED keeps concurrent ticks from claiming the same caption.
+CREATE OR REPLACE FUNCTION pick_caption(p_exclude_id int DEFAULT NULL, p_candidates int DEFAULT 20)
+RETURNS TABLE (id int, text text, category text, tags text[], was_unused boolean)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+#variable_conflict use_column
+DECLARE
+  v_id int;
+BEGIN
+  SELECT pool.id INTO v_id
+  FROM (
+    SELECT c.id FROM captions c
+    WHERE c.used = false
+      AND (p_exclude_id IS NULL OR c.id <> p_exclude_id)
+    ORDER BY c.last_used_at NULLS FIRST, c.id
+    LIMIT p_candidates
+    FOR UPDATE SKIP LOCKED
+  ) pool
+  ORDER BY random()
+  LIMIT 1;
+
+  IF v_id IS NULL THEN
+    SELECT pool.id INTO v_id
+    FROM (
+      SELECT c.id FROM captions c
+      WHERE p_exclude_id IS NULL OR c.id <> p_exclude_id
+      ORDER BY c.last_used_at NULLS FIRST, c.id
+      LIMIT p_candidates
+      FOR UPDATE SKIP LOCKED
+    ) pool
+    ORDER BY random()
+    LIMIT 1;
+  END IF;
+
+  IF v_id IS NULL THEN
+    SELECT c.id INTO v_id
+    FROM captions c
+    ORDER BY c.last_used_at NULLS FIRST, c.id
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED;
+  END IF;
+
+  IF v_id IS NULL THEN
+    RETURN;
+  END IF;
+
+  RETURN QUERY
+  WITH before AS (
+    SELECT c.id, c.used FROM captions c WHERE c.id = v_id
+  )
+  UPDATE captions c
+  SET used = true, last_used_at = now()
+  FROM before
+  WHERE c.id = before.id
+  RETURNING c.id, c.text, c.category::text, c.tags, NOT before.used;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION pick_caption(int, int) TO service_role;
+
+COMMENT ON COLUMN captions.last_used_at IS 'When autopilot last picked this caption (LRU rotation)';
+COMMENT ON FUNCTION pick_caption(int, int) IS 'Atomically pick a least-recently-used caption (excluding p_exclude_id) and mark it used';
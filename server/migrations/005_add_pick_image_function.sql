@@ -0,0 +1,47 @@
+-- Migration: Add pick_image function
+-- Date: 2025-01-XX
+-- Description: Pick the least-used image and bump its use count atomically
+
+ALTER TABLE images ADD COLUMN IF NOT EXISTS use_count int DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_images_use_count
+  ON images(use_count NULLS FIRST, id);
+
+-- Takes the p_candidates least-used images (index scan), picks one at
+-- random and increments use_count in the same statement, so usage spreads
+-- evenly and concurrent ticks never lose an increment.
+CREATE OR REPLACE FUNCTION pick_image(p_candidates int DEFAULT 10)
+RETURNS TABLE (id int, url text, filename text, use_count int)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+#variable_conflict use_column
+DECLARE
+  v_id int;
+BEGIN
+  SELECT pool.id INTO v_id
+  FROM (
+    SELECT i.id FROM images i
+    WHERE i.url IS NOT NULL
+    ORDER BY i.use_count NULLS FIRST, i.id
+    LIMIT p_candidates
+    FOR UPDATE SKIP LOCKED
+  ) pool
+  ORDER BY random()
+  LIMIT 1;
+
+  IF v_id IS NULL THEN
+    RETURN;
+  END IF;
+
+  RETURN QUERY
+  UPDATE images i
+  SET use_count = COALESCE(i.use_count, 0) + 1
+  WHERE i.id = v_id
+  RETURNING i.id, i.url, i.filename::text, i.use_count;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION pick_image(int) TO service_role;
+
+COMMENT ON FUNCTION pick_image(int) IS 'Atomically pick one of the least-used images and increment its use_count';
@@ -0,0 +1,69 @@
+-- Migration: Add claim_due_accounts function
+-- Date: 2025-01-XX
+-- Description: Lease-based claiming of due accounts so several workers can tick in parallel
+
+ALTER TABLE accounts ADD COLUMN IF NOT EXISTS claimed_by TEXT NULL;
+ALTER TABLE accounts ADD COLUMN IF NOT EXISTS claimed_until TIMESTAMPTZ NULL;
+
+-- account_overview (migration 003) expands a.* when created, so rebuild it to
+-- pick up the new columns. DROP first: CREATE OR REPLACE cannot insert columns
+-- ahead of the view's computed ones.
+DROP VIEW IF EXISTS account_overview;
+CREATE VIEW account_overview AS
+SELECT
+    a.*,
+    EXISTS (
+        SELECT 1 FROM oauth_tokens t WHERE t.account_id = a.id
+    ) AS has_token,
+    (
+        SELECT max(ph.posted_at)
+        FROM posting_history ph
+        WHERE ph.account_id = a.id AND ph.status = 'posted'
+    ) AS last_posted_from_history
+FROM accounts a;
+
+GRANT SELECT ON account_overview TO service_role;
+
+CREATE INDEX IF NOT EXISTS idx_accounts_due_claim
+  ON accounts(next_run_at, claimed_until)
+  WHERE autopilot_enabled = true;
+
+-- Claims up to p_limit due accounts for p_worker and returns them.
+-- FOR UPDATE SKIP LOCKED lets concurrent callers take disjoint slices
+-- without waiting on each other; the lease (claimed_until) hides claimed
+-- rows from other workers until it is released or expires, so a crashed
+-- worker's accounts become claimable again automatically.
+CREATE OR REPLACE FUNCTION claim_due_accounts(
+  p_worker text,
+  p_limit int DEFAULT 5,
+  p_lease_seconds int DEFAULT 300
+)
+RETURNS SETOF accounts
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+  RETURN QUERY
+  WITH due AS (
+    SELECT a.id FROM accounts a
+    WHERE a.autopilot_enabled = true
+      AND a.next_run_at <= now()
+      AND (a.claimed_until IS NULL OR a.claimed_until < now())
+    ORDER BY a.next_run_at
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  )
+  UPDATE accounts a
+  SET claimed_by = p_worker,
+      claimed_until = now() + make_interval(secs => p_lease_seconds)
+  FROM due
+  WHERE a.id = due.id
+  RETURNING a.*;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION claim_due_accounts(text, int, int) TO service_role;
+
+COMMENT ON COLUMN accounts.claimed_by IS 'Autopilot worker currently holding this account';
+COMMENT ON COLUMN accounts.claimed_until IS 'Lease expiry for claimed_by; expired claims are ignored';
+COMMENT ON FUNCTION claim_due_accounts(text, int, int) IS 'Claim due autopilot accounts for one worker with FOR UPDATE SKIP LOCKED';
@@ -0,0 +1,71 @@
+-- Migration: Add shared rate limiter
+-- Date: 2025-01-XX
+-- Description: GCRA rate limit state shared by every backend worker/instance
+
+CREATE TABLE IF NOT EXISTS rate_limits (
+    limit_key TEXT PRIMARY KEY,
+    tat TIMESTAMPTZ NOT NULL
+);
+
+-- Supports the periodic delete of expired keys
+CREATE INDEX IF NOT EXISTS idx_rate_limits_tat ON rate_limits(tat);
+
+-- Checks (and, if p_consume, consumes) one request for p_key.
+-- GCRA: each key stores only its theoretical arrival time (tat); a request
+-- is allowed while tat + interval stays within one window of now. The row
+-- lock taken by INSERT ... ON CONFLICT / SELECT FOR UPDATE serialises
+-- concurrent callers on the same key, so limits hold across processes.
+CREATE OR REPLACE FUNCTION rate_limit_check(
+  p_key text,
+  p_max_requests int,
+  p_window_seconds double precision,
+  p_consume boolean DEFAULT true
+)
+RETURNS TABLE (allowed boolean, remaining int, retry_after double precision)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_now timestamptz := clock_timestamp();
+  v_interval double precision := p_window_seconds / p_max_requests;
+  v_tat timestamptz;
+  v_used double precision;
+BEGIN
+  IF NOT p_consume THEN
+    SELECT r.tat INTO v_tat FROM rate_limits r WHERE r.limit_key = p_key;
+    v_used := greatest(0, extract(epoch FROM (coalesce(v_tat, v_now) - v_now)));
+    RETURN QUERY SELECT
+      true,
+      least(p_max_requests, greatest(0, floor((p_window_seconds - v_used) / v_interval + 1e-9)))::int,
+      0::double precision;
+    RETURN;
+  END IF;
+
+  INSERT INTO rate_limits (limit_key, tat) VALUES (p_key, v_now)
+  ON CONFLICT (limit_key) DO NOTHING;
+
+  SELECT r.tat INTO v_tat FROM rate_limits r WHERE r.limit_key = p_key FOR UPDATE;
+
+  v_used := extract(epoch FROM (greatest(v_tat, v_now) - v_now)) + v_interval;
+
+  IF v_used > p_window_seconds + 1e-6 THEN
+    RETURN QUERY SELECT false, 0, v_used - p_window_seconds;
+    RETURN;
+  END IF;
+
+  UPDATE rate_limits
+  SET tat = v_now + make_interval(secs => v_used)
+  WHERE limit_key = p_key;
+
+  RETURN QUERY SELECT
+    true,
+    greatest(0, floor((p_window_seconds - v_used) / v_interval + 1e-9))::int,
+    0::double precision;
+END;
+$$;
+
+GRANT SELECT, DELETE ON rate_limits TO service_role;
+GRANT EXECUTE ON FUNCTION rate_limit_check(text, int, double precision, boolean) TO service_role;
+
+COMMENT ON TABLE rate_limits IS 'Shared GCRA rate limiter state (theoretical arrival time per key)';
+COMMENT ON FUNCTION rate_limit_check(text, int, double precision, boolean) IS 'Atomically check/consume one request against a shared GCRA limit';
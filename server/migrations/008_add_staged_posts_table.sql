@@ -0,0 +1,31 @@
+-- Migration: Add staged posts table
+-- Date: 2025-01-XX
+-- Description: Media containers created ahead of an account's due time, published at post time
+
+CREATE TABLE IF NOT EXISTS staged_posts (
+    id SERIAL PRIMARY KEY,
+    account_id INTEGER NOT NULL REFERENCES accounts(id) ON DELETE CASCADE,
+    container_id TEXT NOT NULL,
+    caption_id INTEGER REFERENCES captions(id) ON DELETE SET NULL,
+    image_id INTEGER REFERENCES images(id) ON DELETE SET NULL,
+    caption_was_unused BOOLEAN DEFAULT false,
+    status VARCHAR(20) NOT NULL DEFAULT 'staged',  -- staged | published | failed | expired
+    error TEXT,
+    expires_at TIMESTAMPTZ NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- At most one container waiting per account
+CREATE UNIQUE INDEX IF NOT EXISTS idx_staged_posts_one_per_account
+  ON staged_posts(account_id)
+  WHERE status = 'staged';
+
+CREATE INDEX IF NOT EXISTS idx_staged_posts_expires
+  ON staged_posts(expires_at)
+  WHERE status = 'staged';
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON staged_posts TO service_role;
+GRANT USAGE, SELECT ON SEQUENCE staged_posts_id_seq TO service_role;
+
+COMMENT ON TABLE staged_posts IS 'Pre-created Threads media containers awaiting publish at the account''s next_run_at';
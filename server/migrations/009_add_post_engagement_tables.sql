@@ -0,0 +1,38 @@
+-- Migration: Add post engagement ingestion tables
+-- Date: 2025-01-XX
+-- Description: Per-post insights and per-account ingestion cursors feeding daily_engagement
+
+-- Latest insights for each published thread; daily_engagement is rebuilt from these rows
+CREATE TABLE IF NOT EXISTS post_engagement (
+    id SERIAL PRIMARY KEY,
+    account_id INTEGER NOT NULL REFERENCES accounts(id) ON DELETE CASCADE,
+    thread_id TEXT NOT NULL UNIQUE,
+    posted_at TIMESTAMPTZ NOT NULL,
+    post_date DATE NOT NULL,
+    likes INTEGER DEFAULT 0,
+    replies INTEGER DEFAULT 0,
+    reposts INTEGER DEFAULT 0,
+    quotes INTEGER DEFAULT 0,
+    views INTEGER DEFAULT 0,
+    fetched_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_post_engagement_account_date
+  ON post_engagement(account_id, post_date);
+
+-- Newest post seen per account, so each run only lists posts after it (plus the re-fetch window)
+CREATE TABLE IF NOT EXISTS engagement_cursors (
+    account_id INTEGER PRIMARY KEY REFERENCES accounts(id) ON DELETE CASCADE,
+    last_post_at TIMESTAMPTZ,
+    last_run_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+ALTER TABLE daily_engagement ADD COLUMN IF NOT EXISTS views INTEGER DEFAULT 0;
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON post_engagement TO service_role;
+GRANT USAGE, SELECT ON SEQUENCE post_engagement_id_seq TO service_role;
+GRANT SELECT, INSERT, UPDATE, DELETE ON engagement_cursors TO service_role;
+
+COMMENT ON TABLE post_engagement IS 'Latest Threads insights per post, upserted by the engagement ingestion job';
+COMMENT ON TABLE engagement_cursors IS 'Per-account incremental cursor for engagement ingestion';
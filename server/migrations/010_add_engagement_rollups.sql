@@ -0,0 +1,81 @@
+-- Migration: Add engagement rollups
+-- Date: 2025-01-XX
+-- Description: Global per-day engagement totals and an RPC that maintains both rollup levels on ingest
+
+-- One row per day across all accounts; the dashboard reads only the requested window
+CREATE TABLE IF NOT EXISTS daily_engagement_totals (
+    post_date DATE PRIMARY KEY,
+    account_count INTEGER DEFAULT 0,
+    post_count INTEGER DEFAULT 0,
+    likes INTEGER DEFAULT 0,
+    replies INTEGER DEFAULT 0,
+    reposts INTEGER DEFAULT 0,
+    quotes INTEGER DEFAULT 0,
+    views INTEGER DEFAULT 0,
+    total_engagement INTEGER DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Recomputes daily_engagement (account/day) from post_engagement for the given
+-- accounts from p_since on, then daily_engagement_totals (day) for every day
+-- touched. Work is bounded by the ingested window, not by total post history.
+-- Returns the number of account/day rows written.
+CREATE OR REPLACE FUNCTION refresh_engagement_rollups(p_account_ids int[], p_since date)
+RETURNS int
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_rows int;
+BEGIN
+  INSERT INTO daily_engagement AS d
+    (account_id, post_date, post_count, likes, replies, reposts, quotes, views, total_engagement, updated_at)
+  SELECT p.account_id, p.post_date, COUNT(*),
+         SUM(p.likes), SUM(p.replies), SUM(p.reposts), SUM(p.quotes), SUM(p.views),
+         SUM(p.likes + p.replies + p.reposts + p.quotes), NOW()
+  FROM post_engagement p
+  WHERE p.account_id = ANY(p_account_ids)
+    AND p.post_date >= p_since
+  GROUP BY p.account_id, p.post_date
+  ON CONFLICT (account_id, post_date) DO UPDATE SET
+    post_count = EXCLUDED.post_count,
+    likes = EXCLUDED.likes,
+    replies = EXCLUDED.replies,
+    reposts = EXCLUDED.reposts,
+    quotes = EXCLUDED.quotes,
+    views = EXCLUDED.views,
+    total_engagement = EXCLUDED.total_engagement,
+    updated_at = EXCLUDED.updated_at;
+
+  GET DIAGNOSTICS v_rows = ROW_COUNT;
+
+  INSERT INTO daily_engagement_totals AS t
+    (post_date, account_count, post_count, likes, replies, reposts, quotes, views, total_engagement, updated_at)
+  SELECT d.post_date, COUNT(DISTINCT d.account_id), SUM(d.post_count),
+         SUM(d.likes), SUM(d.replies), SUM(d.reposts), SUM(d.quotes), SUM(COALESCE(d.views, 0)),
+         SUM(d.total_engagement), NOW()
+  FROM daily_engagement d
+  WHERE d.post_date IN (
+    SELECT DISTINCT p.post_date FROM post_engagement p
+    WHERE p.account_id = ANY(p_account_ids) AND p.post_date >= p_since
+  )
+  GROUP BY d.post_date
+  ON CONFLICT (post_date) DO UPDATE SET
+    account_count = EXCLUDED.account_count,
+    post_count = EXCLUDED.post_count,
+    likes = EXCLUDED.likes,
+    replies = EXCLUDED.replies,
+    reposts = EXCLUDED.reposts,
+    quotes = EXCLUDED.quotes,
+    views = EXCLUDED.views,
+    total_engagement = EXCLUDED.total_engagement,
+    updated_at = EXCLUDED.updated_at;
+
+  RETURN v_rows;
+END;
+$$;
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON daily_engagement_totals TO service_role;
+GRANT EXECUTE ON FUNCTION refresh_engagement_rollups(int[], date) TO service_role;
+
+COMMENT ON TABLE daily_engagement_totals IS 'Per-day engagement totals across all accounts, maintained by refresh_engagement_rollups';
@@ -0,0 +1,39 @@
+-- Migration: Add update_accounts_bulk function
+-- Date: 2025-01-XX
+-- Description: Apply per-account column updates for a whole autopilot tick in one request
+
+-- p_rows is a JSON array of objects such as
+--   {"id": 1, "last_posted_at": "...", "next_run_at": "...", "error_count": 0}
+-- Only the keys present in an object are written; other columns keep their
+-- value. Update-only: ids of deleted accounts are ignored, never re-inserted.
+-- Values are cast to the column types via jsonb_populate_record.
+-- Returns the number of accounts updated.
+CREATE OR REPLACE FUNCTION update_accounts_bulk(p_rows jsonb)
+RETURNS int
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_rows int;
+BEGIN
+  UPDATE accounts a SET
+    last_posted_at  = CASE WHEN e ? 'last_posted_at'  THEN r.last_posted_at  ELSE a.last_posted_at  END,
+    last_caption_id = CASE WHEN e ? 'last_caption_id' THEN r.last_caption_id ELSE a.last_caption_id END,
+    last_error      = CASE WHEN e ? 'last_error'      THEN r.last_error      ELSE a.last_error      END,
+    error_count     = CASE WHEN e ? 'error_count'     THEN r.error_count     ELSE a.error_count     END,
+    next_run_at     = CASE WHEN e ? 'next_run_at'     THEN r.next_run_at     ELSE a.next_run_at     END,
+    updated_at      = CASE WHEN e ? 'updated_at'      THEN r.updated_at      ELSE a.updated_at      END,
+    claimed_by      = CASE WHEN e ? 'claimed_by'      THEN r.claimed_by      ELSE a.claimed_by      END,
+    claimed_until   = CASE WHEN e ? 'claimed_until'   THEN r.claimed_until   ELSE a.claimed_until   END
+  FROM jsonb_array_elements(p_rows) AS e,
+       LATERAL jsonb_populate_record(NULL::accounts, e) AS r
+  WHERE a.id = r.id;
+
+  GET DIAGNOSTICS v_rows = ROW_COUNT;
+  RETURN v_rows;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION update_accounts_bulk(jsonb) TO service_role;
+
+COMMENT ON FUNCTION update_accounts_bulk(jsonb) IS 'Update-only bulk write of autopilot tick outcomes (one object per account, only present keys are set)';
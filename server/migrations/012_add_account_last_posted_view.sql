@@ -0,0 +1,16 @@
+-- Migration: Add account_last_posted view
+-- Date: 2025-01-XX
+-- Description: One row per account with its latest successful post time
+
+-- Filtering on account_id is pushed below the GROUP BY, so a lookup for N
+-- accounts reads only their rows via idx_posting_history_account_posted
+-- (migration 003) instead of scanning posting_history.
+CREATE OR REPLACE VIEW account_last_posted AS
+SELECT ph.account_id, max(ph.posted_at) AS last_posted_at
+FROM posting_history ph
+WHERE ph.status = 'posted'
+GROUP BY ph.account_id;
+
+GRANT SELECT ON account_last_posted TO service_role;
+
+COMMENT ON VIEW account_last_posted IS 'Latest successful post time per account (one row per account)';
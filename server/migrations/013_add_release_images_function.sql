@@ -0,0 +1,31 @@
+-- Migration: Add release_images function
+-- Date: 2025-01-XX
+-- Description: Undo pick_image's use_count increment for images that were never posted
+
+-- p_image_ids may repeat an id (the same image picked for several accounts);
+-- each occurrence gives back one use. Counts never go below zero.
+CREATE OR REPLACE FUNCTION release_images(p_image_ids int[])
+RETURNS int
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_rows int;
+BEGIN
+  UPDATE images i
+  SET use_count = GREATEST(COALESCE(i.use_count, 0) - picked.uses, 0)
+  FROM (
+    SELECT image_id, count(*)::int AS uses
+    FROM unnest(p_image_ids) AS image_id
+    GROUP BY image_id
+  ) picked
+  WHERE i.id = picked.image_id;
+
+  GET DIAGNOSTICS v_rows = ROW_COUNT;
+  RETURN v_rows;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION release_images(int[]) TO service_role;
+
+COMMENT ON FUNCTION release_images(int[]) IS 'Decrement use_count for images picked but not posted (e.g. failed staging)';
@@ -0,0 +1,57 @@
+-- Migration: Add rate_limit_reserve function
+-- Date: 2025-01-XX
+-- Description: Consume several shared rate limit requests in one round trip
+
+-- Like rate_limit_check with p_consume, but grants up to p_count requests
+-- at once (as many as fit right now). Backend workers hand the extra
+-- requests out locally, so busy keys need one RPC per reservation rather
+-- than one per request. granted = 0 means denied; retry_after says when
+-- one request will fit again.
+CREATE OR REPLACE FUNCTION rate_limit_reserve(
+  p_key text,
+  p_max_requests int,
+  p_window_seconds double precision,
+  p_count int DEFAULT 1
+)
+RETURNS TABLE (granted int, remaining int, retry_after double precision)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_now timestamptz := clock_timestamp();
+  v_interval double precision := p_window_seconds / p_max_requests;
+  v_tat timestamptz;
+  v_used double precision;
+  v_available int;
+  v_granted int;
+BEGIN
+  INSERT INTO rate_limits (limit_key, tat) VALUES (p_key, v_now)
+  ON CONFLICT (limit_key) DO NOTHING;
+
+  SELECT r.tat INTO v_tat FROM rate_limits r WHERE r.limit_key = p_key FOR UPDATE;
+
+  v_used := extract(epoch FROM (greatest(v_tat, v_now) - v_now));
+  v_available := least(p_max_requests, greatest(0, floor((p_window_seconds - v_used) / v_interval + 1e-9)))::int;
+  v_granted := least(greatest(p_count, 1), v_available);
+
+  IF v_granted < 1 THEN
+    RETURN QUERY SELECT 0, 0, v_used + v_interval - p_window_seconds;
+    RETURN;
+  END IF;
+
+  v_used := v_used + v_granted * v_interval;
+
+  UPDATE rate_limits
+  SET tat = v_now + make_interval(secs => v_used)
+  WHERE limit_key = p_key;
+
+  RETURN QUERY SELECT
+    v_granted,
+    greatest(0, floor((p_window_seconds - v_used) / v_interval + 1e-9))::int,
+    0::double precision;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION rate_limit_reserve(text, int, double precision, int) TO service_role;
+
+COMMENT ON FUNCTION rate_limit_reserve(text, int, double precision, int) IS 'Atomically consume up to p_count requests against a shared GCRA limit';
@@ -9,5 +9,6 @@ from .threads import threads
 from .autopilot import autopilot
 from .captions import captions
 from .images import images
+from .engagement import engagement
 
-__all__ = ['accounts', 'threads', 'autopilot', 'captions', 'images']
+__all__ = ['accounts', 'threads', 'autopilot', 'captions', 'images', 'engagement']
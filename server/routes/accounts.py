@@ -8,7 +8,7 @@ import os
 import logging
 from datetime import datetime
 from flask import Blueprint, request, jsonify
-from database import DatabaseManager
+from database import get_db
 
 logger = logging.getLogger(__name__)
 
@@ -52,7 +52,7 @@ def login_account():
         logger.info(f"🔐 Creating account for username: {username}")
         
         # Create account in database
-        db = DatabaseManager()
+        db = get_db()
         
         # Check connection status
         from services.session_store import session_store
@@ -132,7 +132,7 @@ def upload_session(account_id):
             }), 400
         
         # Get account
-        db = DatabaseManager()
+        db = get_db()
         account = db.get_account_by_id(account_id)
         if not account:
             return jsonify({
@@ -186,7 +186,7 @@ def check_account_status(account_id):
     """Check account connection status and posting capabilities"""
     try:
         # Get account
-        db = DatabaseManager()
+        db = get_db()
         account = db.get_account_by_id(account_id)
         if not account:
             return jsonify({
@@ -210,6 +210,41 @@ def check_account_status(account_id):
             "error": str(e)
         }), 500
 
+@accounts.route('/api/accounts/stats', methods=['GET'])
+def get_accounts_stats():
+    """Refresh profile and recent-post stats for all connected accounts in one pass"""
+    try:
+        from services.stats_collector import stats_collector, PROFILE_FIELDS, POST_FIELDS
+
+        # Optional filters: ?account_ids=1,2,3&max_posts=25&fields=...&post_fields=...
+        account_ids = request.args.get('account_ids')
+        if account_ids:
+            account_ids = [int(account_id) for account_id in account_ids.split(',') if account_id.strip()]
+
+        result = stats_collector.collect_all(
+            account_ids or None,
+            profile_fields=request.args.get('fields', PROFILE_FIELDS),
+            post_fields=request.args.get('post_fields', POST_FIELDS),
+            max_posts=request.args.get('max_posts', type=int)
+        )
+
+        return jsonify({
+            "ok": True,
+            **result
+        }), 200
+
+    except ValueError:
+        return jsonify({
+            "ok": False,
+            "error": "account_ids must be a comma-separated list of integers"
+        }), 400
+    except Exception as e:
+        logger.error(f"❌ Error collecting account stats: {e}")
+        return jsonify({
+            "ok": False,
+            "error": str(e)
+        }), 500
+
 @accounts.route('/api/accounts/<int:account_id>', methods=['PATCH'])
 def update_account(account_id):
     """Update account settings (autopilot, cadence, etc.)"""
@@ -222,7 +257,7 @@ def update_account(account_id):
             }), 400
         
         # Get account
-        db = DatabaseManager()
+        db = get_db()
         account = db.get_account_by_id(account_id)
         if not account:
             return jsonify({
@@ -295,7 +330,7 @@ def update_autopilot(account_id):
         enabled = bool(enabled)
         
         # Get account to check current state
-        db = DatabaseManager()
+        db = get_db()
         account = db.get_account_by_id(account_id)
         if not account:
             return jsonify({
@@ -368,7 +403,7 @@ def update_cadence(account_id):
             }), 400
         
         # Get account to check current state
-        db = DatabaseManager()
+        db = get_db()
         account = db.get_account_by_id(account_id)
         if not account:
             return jsonify({
@@ -8,7 +8,7 @@ import os
 import logging
 from flask import Blueprint, request, jsonify, redirect
 from services.meta_oauth import MetaOAuthService
-from database import DatabaseManager
+from database import get_db
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -27,7 +27,7 @@ def start_oauth():
             }), 400
         
         # Get account from database
-        db = DatabaseManager()
+        db = get_db()
         account = db.get_account_by_id(int(account_id))
         
         if not account:
@@ -116,7 +116,7 @@ def handle_oauth_callback():
                 }), 400
         
         # Common processing for both GET and POST
-        db = DatabaseManager()
+        db = get_db()
         account = db.get_account_by_id(int(account_id))
         
         if not account:
@@ -5,11 +5,15 @@ Handles automated posting with idempotent tick endpoint
 """
 
 import os
+import socket
+import uuid
 import logging
 from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify
 from services.autopilot import autopilot_service
-from database import DatabaseManager
+from services.meta_quota import meta_quota
+from services.token_refresher import token_refresher
+from database import get_db
 
 logger = logging.getLogger(__name__)
 autopilot = Blueprint('autopilot', __name__)
@@ -17,7 +21,7 @@ autopilot = Blueprint('autopilot', __name__)
 def acquire_lock(lock_id: str, timeout_seconds: int = 30) -> bool:
     """Poor-man's lock using database"""
     try:
-        db = DatabaseManager()
+        db = get_db()
         now = datetime.now()
         expires_at = now + timedelta(seconds=timeout_seconds)
         
@@ -80,7 +84,7 @@ def acquire_lock(lock_id: str, timeout_seconds: int = 30) -> bool:
 def release_lock(lock_id: str) -> bool:
     """Release the lock"""
     try:
-        db = DatabaseManager()
+        db = get_db()
         response = db._make_request(
             'DELETE',
             f"{db.supabase_url}/rest/v1/autopilot_locks?id=eq.{lock_id}"
@@ -100,10 +104,20 @@ def release_lock(lock_id: str) -> bool:
 @autopilot.route('/tick', methods=['POST'])
 def tick():
     """Idempotent tick endpoint for autopilot posting"""
+    now = datetime.now()
+    
+    # Preferred path: claim a disjoint slice of due accounts, so any number
+    # of instances can tick at once without a global lock
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    claimed_accounts = autopilot_service.claim_due_accounts(worker_id)
+    if claimed_accounts is not None:
+        return run_tick(claimed_accounts, now)
+    
+    # Claim RPC not deployed: serialise ticks with the global lock
     lock_id = "autopilot:tick"
     
-    # Try to acquire lock
-    if not acquire_lock(lock_id):
+    # Hold the lock for the whole tick budget so it cannot expire mid-run
+    if not acquire_lock(lock_id, timeout_seconds=autopilot_service.tick_deadline_seconds + 60):
         return jsonify({
             'ok': False,
             'error': 'Another autopilot tick is already running',
@@ -111,111 +125,56 @@ def tick():
             'timestamp': datetime.now().isoformat()
         }), 409
     
+    try:
+        return run_tick(autopilot_service.due_accounts(now), now)
+    finally:
+        # Always release lock
+        release_lock(lock_id)
+
+def run_tick(due_accounts, now: datetime):
+    """Process one tick's due accounts and build the tick response"""
     try:
         logger.info("🚀 Starting autopilot tick")
-        now = datetime.now()
-        
-        # Get due accounts
-        due_accounts = autopilot_service.due_accounts(now)
         
         if not due_accounts:
             logger.info("📭 No due accounts found")
+            staging = autopilot_service.stage_upcoming(now)
             return jsonify({
                 'ok': True,
                 'processed': 0,
+                'staged': staging['staged'],
                 'message': 'No due accounts found',
                 'timestamp': now.isoformat()
             })
         
         logger.info(f"📝 Processing {len(due_accounts)} due accounts")
         
-        results = []
-        successes = 0
-        failures = 0
+        results = autopilot_service.process_accounts(due_accounts)
         
-        for account in due_accounts:
-            try:
-                account_id = account['id']
-                username = account['username']
-                
-                logger.info(f"📝 Processing account {account_id} ({username})")
-                
-                # Pick content with deduplication
-                caption = autopilot_service.pick_caption(account)
-                if not caption:
-                    logger.warning(f"⚠️ No caption available for account {account_id}")
-                    results.append({
-                        'account_id': account_id,
-                        'username': username,
-                        'status': 'failed',
-                        'error': 'No caption available'
-                    })
-                    failures += 1
-                    continue
-                
-                image = autopilot_service.pick_image()
-                if image:
-                    logger.info(f"🖼️ Using image: {image['id']}")
-                
-                # Post content with retry logic
-                success, message = autopilot_service.post_once(account, caption, image)
-                
-                # Record history
-                autopilot_service.record_posting_history(
-                    account_id=account_id,
-                    caption_id=caption['id'],
-                    image_id=image['id'] if image else None,
-                    success=success,
-                    message=message
-                )
-                
-                # Handle success/failure with resilience logic
-                if success:
-                    autopilot_service.handle_posting_success(
-                        account_id, caption['id'], image['id'] if image else None
-                    )
-                else:
-                    autopilot_service.handle_posting_failure(account_id, message)
-                
-                # Record result
-                result = {
-                    'account_id': account_id,
-                    'username': username,
-                    'status': 'success' if success else 'failed',
-                    'caption_id': caption['id'],
-                    'image_id': image['id'] if image else None,
-                    'message': message
-                }
-                
-                results.append(result)
-                
-                if success:
-                    successes += 1
-                    logger.info(f"✅ Posted successfully for account {account_id}")
-                else:
-                    failures += 1
-                    logger.error(f"❌ Failed to post for account {account_id}: {message}")
-                
-            except Exception as e:
-                logger.error(f"❌ Error processing account {account.get('id')}: {e}")
-                results.append({
-                    'account_id': account.get('id'),
-                    'username': account.get('username'),
-                    'status': 'failed',
-                    'error': str(e)
-                })
-                failures += 1
+        successes = len([r for r in results if r['status'] == 'success'])
+        failures = len([r for r in results if r['status'] == 'failed'])
+        skipped = len([r for r in results if r['status'] == 'skipped'])
+        retries = len([r for r in results if r['status'] == 'retry_scheduled'])
+        deferred = len([r for r in results if r['status'] == 'deferred'])
+        
+        # Pre-create containers for accounts due soon, off their critical path
+        staging = autopilot_service.stage_upcoming(now)
         
         # Clean up expired locks
         cleanup_expired_locks()
         
-        logger.info(f"✅ Autopilot tick completed: {successes} successes, {failures} failures")
+        logger.info(f"✅ Autopilot tick completed: {successes} successes, {failures} failures, {retries} retries scheduled, {deferred} deferred, {skipped} skipped")
         
         return jsonify({
             'ok': True,
-            'processed': len(due_accounts),
+            'processed': len(due_accounts) - skipped - deferred,
             'successes': successes,
             'failures': failures,
+            'retries_scheduled': retries,
+            'skipped': skipped,
+            'deferred': deferred,
+            'staged': staging['staged'],
+            'meta_quota': meta_quota.get_status(),
             'results': results,
             'timestamp': now.isoformat()
         })
@@ -228,15 +187,11 @@ def tick():
             'processed': 0,
             'timestamp': datetime.now().isoformat()
         }), 500
-        
-    finally:
-        # Always release lock
-        release_lock(lock_id)
 
 def cleanup_expired_locks():
     """Clean up expired locks"""
     try:
-        db = DatabaseManager()
+        db = get_db()
         now = datetime.now()
         
         response = db._make_request(
@@ -255,7 +210,7 @@ def cleanup_expired_locks():
 def status():
     """Get autopilot status"""
     try:
-        db = DatabaseManager()
+        db = get_db()
         now = datetime.now()
         
         # Get autopilot-enabled accounts with error info
@@ -295,6 +250,7 @@ def status():
                 'due_accounts': due_accounts,
                 'error_accounts': error_accounts,
                 'error_details': error_details,
+                'token_refresher': token_refresher.get_status(),
                 'timestamp': now.isoformat()
             })
         else:
@@ -310,6 +266,32 @@ def status():
             'error': str(e)
         }), 500
 
+@autopilot.route('/refresh-tokens', methods=['POST'])
+def refresh_tokens():
+    """Run one token refresh pass now (for cron when the background refresher is disabled)"""
+    lock_id = "autopilot:refresh-tokens"
+    if not acquire_lock(lock_id, timeout_seconds=600):
+        return jsonify({
+            'ok': False,
+            'error': 'Another token refresh pass is already running'
+        }), 409
+    
+    try:
+        result = token_refresher.run_pending()
+        return jsonify({
+            'ok': True,
+            **result,
+            'token_refresher': token_refresher.get_status()
+        })
+    except Exception as e:
+        logger.error(f"❌ Error refreshing tokens: {e}")
+        return jsonify({
+            'ok': False,
+            'error': str(e)
+        }), 500
+    finally:
+        release_lock(lock_id)
+
 @autopilot.route('/accounts/<int:account_id>/enable', methods=['POST'])
 def enable_autopilot(account_id):
     """Enable autopilot for an account"""
@@ -318,7 +300,7 @@ def enable_autopilot(account_id):
         cadence_minutes = data.get('cadence_minutes', 10)
         jitter_seconds = data.get('jitter_seconds', 60)
         
-        db = DatabaseManager()
+        db = get_db()
         now = datetime.now()
         
         # Calculate initial next_run_at
@@ -357,7 +339,7 @@ def enable_autopilot(account_id):
 def disable_autopilot(account_id):
     """Disable autopilot for an account"""
     try:
-        db = DatabaseManager()
+        db = get_db()
         now = datetime.now()
         
         update_data = {
@@ -9,7 +9,7 @@ import csv
 import logging
 from datetime import datetime
 from flask import Blueprint, request, jsonify
-from database import DatabaseManager
+from database import get_db
 
 logger = logging.getLogger(__name__)
 captions = Blueprint('captions', __name__)
@@ -18,7 +18,7 @@ captions = Blueprint('captions', __name__)
 def get_captions():
     """Get all captions"""
     try:
-        db = DatabaseManager()
+        db = get_db()
         response = db._make_request(
             'GET',
             f"{db.supabase_url}/rest/v1/captions",
@@ -70,7 +70,7 @@ def create_caption():
             "created_at": datetime.now().isoformat()
         }
         
-        db = DatabaseManager()
+        db = get_db()
         response = db._make_request(
             'POST',
             f"{db.supabase_url}/rest/v1/captions",
@@ -120,7 +120,7 @@ def update_caption(caption_id):
             "updated_at": datetime.now().isoformat()
         }
         
-        db = DatabaseManager()
+        db = get_db()
         response = db._make_request(
             'PATCH',
             f"{db.supabase_url}/rest/v1/captions?id=eq.{caption_id}",
@@ -149,7 +149,7 @@ def update_caption(caption_id):
 def delete_caption(caption_id):
     """Delete a caption"""
     try:
-        db = DatabaseManager()
+        db = get_db()
         response = db._make_request(
             'DELETE',
             f"{db.supabase_url}/rest/v1/captions?id=eq.{caption_id}"
@@ -221,7 +221,7 @@ def upload_captions_csv():
                 }), 400
             
             # Insert captions in batches
-            db = DatabaseManager()
+            db = get_db()
             success_count = 0
             
             for caption_data in captions_to_add:
@@ -260,7 +260,7 @@ def upload_captions_csv():
 def reset_all_captions():
     """Mark all captions as unused"""
     try:
-        db = DatabaseManager()
+        db = get_db()
         
         update_data = {
             "used": False,
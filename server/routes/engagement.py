@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Engagement Routes
+Handles engagement ingestion and daily engagement statistics
+"""
+
+import logging
+from flask import Blueprint, request, jsonify
+from engagement_tracker import engagement_tracker
+
+logger = logging.getLogger(__name__)
+
+engagement = Blueprint('engagement', __name__)
+
+@engagement.route('/api/engagement/refresh', methods=['POST'])
+def refresh_engagement():
+    """Ingest new and recent post insights for all connected accounts (or the given account_ids)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        account_ids = data.get('account_ids')
+        if account_ids is not None:
+            account_ids = [int(account_id) for account_id in account_ids]
+
+        result = engagement_tracker.refresh_engagement_data(account_ids)
+        status = 200 if result.get('success') else 500
+
+        return jsonify({
+            "ok": result.get('success', False),
+            **result
+        }), status
+
+    except (TypeError, ValueError):
+        return jsonify({
+            "ok": False,
+            "error": "account_ids must be a list of integers"
+        }), 400
+    except Exception as e:
+        logger.error(f"❌ Error refreshing engagement: {e}")
+        return jsonify({
+            "ok": False,
+            "error": str(e)
+        }), 500
+
+@engagement.route('/api/engagement/stats', methods=['GET'])
+def engagement_stats():
+    """Get daily engagement statistics for the last `days` days (all accounts, or ?account_id=)"""
+    try:
+        days = max(1, min(request.args.get('days', 7, type=int), 365))
+        account_id = request.args.get('account_id', type=int)
+        result = engagement_tracker.get_daily_engagement_stats(days, account_id)
+        status = 200 if result.get('success') else 500
+
+        return jsonify({
+            "ok": result.get('success', False),
+            **result
+        }), status
+
+    except Exception as e:
+        logger.error(f"❌ Error getting engagement stats: {e}")
+        return jsonify({
+            "ok": False,
+            "error": str(e)
+        }), 500
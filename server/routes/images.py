@@ -9,7 +9,7 @@ import logging
 import requests
 from datetime import datetime
 from flask import Blueprint, request, jsonify
-from database import DatabaseManager
+from database import get_db
 
 logger = logging.getLogger(__name__)
 images = Blueprint('images', __name__)
@@ -18,7 +18,7 @@ images = Blueprint('images', __name__)
 def get_images():
     """Get all images"""
     try:
-        db = DatabaseManager()
+        db = get_db()
         response = db._make_request(
             'GET',
             f"{db.supabase_url}/rest/v1/images",
@@ -97,7 +97,7 @@ def add_image_by_url():
             "created_at": datetime.now().isoformat()
         }
         
-        db = DatabaseManager()
+        db = get_db()
         response = db._make_request(
             'POST',
             f"{db.supabase_url}/rest/v1/images",
@@ -197,7 +197,7 @@ def upload_image():
             "created_at": datetime.now().isoformat()
         }
         
-        db = DatabaseManager()
+        db = get_db()
         response = db._make_request(
             'POST',
             f"{db.supabase_url}/rest/v1/images",
@@ -236,7 +236,7 @@ def upload_image():
 def delete_image(image_id):
     """Delete an image"""
     try:
-        db = DatabaseManager()
+        db = get_db()
         
         # Get image info first
         response = db._make_request(
@@ -9,7 +9,7 @@ import logging
 import requests
 from datetime import datetime
 from flask import Blueprint, request, jsonify
-from database import DatabaseManager
+from database import get_db
 from services.rate_limiter import rate_limiter, TEST_POST_LIMIT, TEST_POST_WINDOW
 
 logger = logging.getLogger(__name__)
@@ -35,7 +35,7 @@ def post_to_threads():
         
         # If use_random is True, pick random caption and image
         if use_random:
-            db = DatabaseManager()
+            db = get_db()
             
             # Pick random caption
             captions = db.get_captions()
@@ -81,7 +81,7 @@ def post_to_threads():
         logger.info(f"📝 Posting to Threads for account {account_id} (test: {is_test})")
         
         # Get account details from database
-        db = DatabaseManager()
+        db = get_db()
         account = db.get_account_by_id(account_id)
         
         if not account:
@@ -159,7 +159,7 @@ def test_account_connection(account_id):
         logger.info(f"🧪 Testing account {account_id} connection")
         
         # Get account details
-        db = DatabaseManager()
+        db = get_db()
         account = db.get_account_by_id(account_id)
         
         if not account:
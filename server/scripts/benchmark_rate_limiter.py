@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Rate Limiter Benchmark
+File: server/scripts/benchmark_rate_limiter.py
+
+Compares the rate limiter engines (sliding_log, token_bucket, gcra), alone
+and behind the sharded RateLimiter facade, on:
+- is_allowed() throughput for a hot key with a large window
+- is_allowed() throughput spread across many keys
+- memory held per key after the run
+
+Usage:
+  cd server
+  python scripts/benchmark_rate_limiter.py [--calls 50000] [--keys 1000]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+# Add parent directory to path to import from server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from functools import partial
+from services.rate_limiter import ENGINES, RateLimiter
+
+def run_hot_key(engine_cls, calls: int) -> float:
+    """Hammer a single key whose limit is never reached"""
+    engine = engine_cls()
+    start = time.perf_counter()
+    for _ in range(calls):
+        engine.is_allowed('hot', calls * 2, 3600)
+    return time.perf_counter() - start
+
+def run_many_keys(engine_cls, calls: int, keys: int) -> float:
+    """Spread calls over many keys"""
+    engine = engine_cls()
+    start = time.perf_counter()
+    for i in range(calls):
+        engine.is_allowed(f"account:{i % keys}", 100, 3600)
+    return time.perf_counter() - start
+
+def measure_memory(engine_cls, calls: int, keys: int) -> int:
+    """Bytes retained by the engine after the many-keys workload"""
+    tracemalloc.start()
+    engine = engine_cls()
+    for i in range(calls):
+        engine.is_allowed(f"account:{i % keys}", 100, 3600)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark rate limiter engines')
+    parser.add_argument('--calls', type=int, default=50000, help='is_allowed() calls per scenario')
+    parser.add_argument('--keys', type=int, default=1000, help='distinct keys for the many-keys scenario')
+    args = parser.parse_args()
+
+    print(f"🚦 Rate limiter benchmark: {args.calls} calls, {args.keys} keys")
+    print(f"{'engine':<20}{'hot key (µs/call)':>20}{'many keys (µs/call)':>22}{'bytes/key':>12}")
+
+    variants = dict(ENGINES)
+    for name in ENGINES:
+        variants[f"{name} x16"] = partial(RateLimiter, name, 16)
+
+    for name, engine_cls in variants.items():
+        hot = run_hot_key(engine_cls, args.calls)
+        many = run_many_keys(engine_cls, args.calls, args.keys)
+        memory = measure_memory(engine_cls, args.calls, args.keys)
+        print(f"{name:<20}{hot / args.calls * 1e6:>20.2f}{many / args.calls * 1e6:>22.2f}{memory / args.keys:>12.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -5,27 +5,215 @@ Handles automated posting with per-account cadence and jitter
 """
 
 import os
+import re
 import random
 import logging
 import time
-from datetime import datetime, timedelta
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Optional, Tuple
-from database import DatabaseManager
+from database import DatabaseManager, get_db
+from services.meta_quota import meta_quota
+from services.graph_client import graph_client, GraphAPIError
 
 logger = logging.getLogger(__name__)
 
+# Matches "Retry-After: 30", "retry after 30s", "retry_after=30" in error messages
+RETRY_AFTER_PATTERN = re.compile(r'retry[-_ ]after\D{0,3}(\d+)', re.IGNORECASE)
+MAX_RETRY_AFTER_SECONDS = 3600
+
+# Official API post whose media container was created but not ready in time
+PENDING_CONTAINER_PATTERN = re.compile(r'OFFICIAL_API_PENDING: container (\S+)')
+HARD_ERROR_BACKOFF_MINUTES = 60
+
+# Time kept back from the tick deadline for the publish call after a container wait
+PUBLISH_MARGIN_SECONDS = 15
+
+# Threads media containers expire after 24h; stop trusting staged ones a little earlier
+STAGED_CONTAINER_TTL_HOURS = 23
+
+# Account columns the tick needs
+DUE_ACCOUNT_COLUMNS = 'id,username,cadence_minutes,jitter_seconds,connection_status,threads_user_id,last_caption_id,error_count,last_error'
+
+class TickWriteBatch:
+    """
+    Collects the database writes produced by one autopilot tick
+    
+    Workers record outcomes here instead of writing per account; flush()
+    then applies them as a handful of bulk requests. Thread-safe so the
+    tick's worker pool can share one batch.
+    
+    Outcomes only reach the database on flush, so a process that dies
+    mid-tick loses the unflushed ones: those accounts keep their old
+    next_run_at and post again once their claim lease lapses. checkpoint()
+    bounds that window by flushing every flush_seconds while the tick runs.
+    """
+    
+    def __init__(self, flush_seconds: float = 0):
+        self.lock = Lock()
+        self.flush_lock = Lock()
+        self.flush_seconds = flush_seconds
+        self.last_flush = time.monotonic()
+        self._reset()
+    
+    def _reset(self):
+        self.history: List[Dict] = []
+        self.account_updates: Dict[int, Dict] = {}
+        self.captions_used: set = set()
+        self.captions_released: set = set()
+        self.staged_status: Dict[int, str] = {}
+        self.staged_rows: List[Dict] = []
+    
+    def add_history(self, account_id: int, caption_id: Optional[int], image_id: Optional[int],
+                    status: str, thread_id: Optional[str] = None):
+        """Queue a posting_history row"""
+        with self.lock:
+            self.history.append({
+                'account_id': account_id,
+                'caption_id': caption_id,
+                'image_id': image_id,
+                'thread_id': thread_id,
+                'status': status,
+                'posted_at': datetime.now().isoformat()
+            })
+    
+    def update_account(self, account: Dict, data: Dict):
+        """Queue column updates for an account (merged with earlier updates)"""
+        with self.lock:
+            self.account_updates.setdefault(account['id'], {}).update(data)
+    
+    def set_caption_used(self, caption_id: int, used: bool):
+        """Queue a caption to be marked used (or released back to unused)"""
+        with self.lock:
+            if used:
+                self.captions_used.add(caption_id)
+                self.captions_released.discard(caption_id)
+            else:
+                self.captions_released.add(caption_id)
+                self.captions_used.discard(caption_id)
+    
+    def set_staged_status(self, staged_id: int, status: str):
+        """Queue a status change for a staged post"""
+        with self.lock:
+            self.staged_status[staged_id] = status
+    
+    def add_staged_post(self, row: Dict):
+        """Queue a staged_posts row (a created container to publish on a later tick)"""
+        with self.lock:
+            self.staged_rows.append(row)
+    
+    def checkpoint(self, db: DatabaseManager):
+        """Flush early if flush_seconds have passed since the last write-back (no-op while one runs)"""
+        if not self.flush_seconds or time.monotonic() - self.last_flush < self.flush_seconds:
+            return
+        if not self.flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._flush(db)
+        finally:
+            self.flush_lock.release()
+    
+    def flush(self, db: DatabaseManager) -> Dict[str, int]:
+        """Apply all queued writes; returns per-table row counts written"""
+        with self.flush_lock:
+            return self._flush(db)
+    
+    def _flush(self, db: DatabaseManager) -> Dict[str, int]:
+        with self.lock:
+            history = self.history
+            account_updates = self.account_updates
+            captions_used = sorted(self.captions_used)
+            captions_released = sorted(self.captions_released)
+            staged_status = self.staged_status
+            staged_rows = self.staged_rows
+            self._reset()
+            self.last_flush = time.monotonic()
+        
+        written = {'posting_history': 0, 'accounts': 0, 'captions': 0}
+        
+        if history and db.bulk_insert_posting_history(history):
+            written['posting_history'] = len(history)
+        
+        if account_updates:
+            # Rows differ per account (timestamps, jittered next_run_at), so write them all in one RPC call
+            rows = [{'id': account_id, **data} for account_id, data in account_updates.items()]
+            result = db.update_accounts_bulk(rows)
+            if result:
+                written['accounts'] = len(rows)
+            else:
+                if result is None:
+                    logger.warning("⚠️ update_accounts_bulk RPC not deployed, using PATCH per distinct update")
+                written['accounts'] = self._update_accounts_fallback(db, account_updates)
+        
+        if captions_used and db.set_captions_used(captions_used, True):
+            written['captions'] += len(captions_used)
+        
+        if captions_released and db.set_captions_used(captions_released, False):
+            written['captions'] += len(captions_released)
+        
+        staged_by_status: Dict[str, List[int]] = {}
+        for staged_id, status in staged_status.items():
+            staged_by_status.setdefault(status, []).append(staged_id)
+        for status, staged_ids in staged_by_status.items():
+            db.set_staged_posts_status(sorted(staged_ids), status)
+        
+        # After the status changes: a failed staged post must leave 'staged' before its replacement arrives
+        if staged_rows:
+            stored = db.bulk_insert_staged_posts(staged_rows)
+            if len(stored) < len(staged_rows):
+                logger.warning(f"⚠️ Stored {len(stored)} of {len(staged_rows)} pending containers")
+        
+        logger.info(f"💾 Tick write-back: {written}")
+        return written
+    
+    def _update_accounts_fallback(self, db: DatabaseManager, account_updates: Dict[int, Dict]) -> int:
+        """One update-only PATCH per distinct set of column values, then per row if that fails"""
+        groups: Dict[Tuple, Tuple[Dict, List[int]]] = {}
+        for account_id, data in account_updates.items():
+            key = tuple(sorted((column, repr(value)) for column, value in data.items()))
+            groups.setdefault(key, (data, []))[1].append(account_id)
+        
+        written = 0
+        for data, account_ids in groups.values():
+            if db.bulk_update_accounts(account_ids, data):
+                written += len(account_ids)
+                continue
+            # Account scheduling must not be lost; fall back to per-row updates
+            logger.warning(f"⚠️ Bulk account update failed, updating {len(account_ids)} accounts individually")
+            for account_id in account_ids:
+                if db.update_account(account_id, data):
+                    written += 1
+        return written
+
 class AutopilotService:
     def __init__(self):
-        self.db = DatabaseManager()
         self.max_per_tick = int(os.getenv('POSTING_MAX_PER_TICK', '5'))
         self.default_cadence = int(os.getenv('POSTING_DEFAULT_CADENCE_MIN', '10'))
         self.meta_publish_enabled = os.getenv('META_THREADS_PUBLISH_ENABLED', 'false').lower() == 'true'
+        self.tick_concurrency = max(1, int(os.getenv('AUTOPILOT_TICK_CONCURRENCY', '4')))
+        self.tick_deadline_seconds = int(os.getenv('AUTOPILOT_TICK_DEADLINE_SECONDS', '240'))
+        # Mid-tick write-back interval: bounds the outcomes a crashed tick can lose (0 = end of tick only)
+        self.flush_seconds = float(os.getenv('AUTOPILOT_FLUSH_SECONDS', '5'))
+        self.max_quick_retries = int(os.getenv('AUTOPILOT_MAX_QUICK_RETRIES', '1'))
+        self.retry_min_seconds = int(os.getenv('AUTOPILOT_RETRY_MIN_SECONDS', '10'))
+        self.retry_max_seconds = max(self.retry_min_seconds, int(os.getenv('AUTOPILOT_RETRY_MAX_SECONDS', '20')))
+        self.stage_window_minutes = int(os.getenv('AUTOPILOT_STAGE_WINDOW_MINUTES', '30'))
+        self.stage_max_per_tick = int(os.getenv('AUTOPILOT_STAGE_MAX_PER_TICK', '10'))
+        self.staged_ready_timeout = float(os.getenv('AUTOPILOT_STAGED_READY_TIMEOUT_SECONDS', '20'))
         
         logger.info(f"🚀 AutopilotService initialized")
         logger.info(f"📊 Max per tick: {self.max_per_tick}")
         logger.info(f"⏰ Default cadence: {self.default_cadence} minutes")
+        logger.info(f"🧵 Tick concurrency: {self.tick_concurrency}, deadline: {self.tick_deadline_seconds}s")
         logger.info(f"🔐 Meta publish enabled: {self.meta_publish_enabled}")
     
+    @property
+    def db(self) -> DatabaseManager:
+        """Shared DatabaseManager (resolved per call so test factories take effect)"""
+        return get_db()
+    
     def due_accounts(self, now: datetime) -> List[Dict]:
         """Fetch accounts that are due for posting"""
         try:
@@ -38,7 +226,9 @@ class AutopilotService:
                 params={
                     'autopilot_enabled': 'eq.true',
                     'next_run_at': f'lte.{now.isoformat()}',
-                    'select': 'id,username,cadence_minutes,jitter_seconds,connection_status,threads_user_id,last_caption_id,error_count,last_error'
+                    'select': DUE_ACCOUNT_COLUMNS,
+                    'order': 'next_run_at.asc',  # Most overdue first
+                    'limit': str(self.max_per_tick)
                 }
             )
             
@@ -54,34 +244,83 @@ class AutopilotService:
             logger.error(f"❌ Error fetching due accounts: {e}")
             return []
     
-    def schedule_next(self, account: Dict) -> bool:
-        """Schedule next run for an account with cadence + jitter"""
+    def claim_due_accounts(self, worker_id: str) -> Optional[List[Dict]]:
+        """
+        Claim due accounts for this worker via the claim_due_accounts RPC
+        
+        Concurrent workers receive disjoint sets of accounts, each leased for
+        the tick budget. Returns None when the RPC is not deployed so the
+        caller can fall back to the global tick lock.
+        """
         try:
-            account_id = account['id']
-            cadence_minutes = account.get('cadence_minutes', self.default_cadence)
-            jitter_seconds = account.get('jitter_seconds', 60)
+            response = self.db._make_request(
+                'POST',
+                f"{self.db.supabase_url}/rest/v1/rpc/claim_due_accounts",
+                params={'select': DUE_ACCOUNT_COLUMNS + ',claimed_by'},
+                json={
+                    'p_worker': worker_id,
+                    'p_limit': self.max_per_tick,
+                    'p_lease_seconds': self.tick_deadline_seconds + 60
+                }
+            )
             
-            # Calculate next run time
-            now = datetime.now()
-            base_interval = timedelta(minutes=cadence_minutes)
-            jitter = timedelta(seconds=random.randint(0, jitter_seconds))
-            next_run = now + base_interval + jitter
+            if response.status_code == 200:
+                accounts = response.json()
+                logger.info(f"✅ Worker {worker_id} claimed {len(accounts)} due accounts")
+                return accounts
             
-            logger.info(f"📅 Scheduling next run for account {account_id}: {next_run}")
+            logger.warning(f"⚠️ claim_due_accounts RPC unavailable ({response.status_code})")
+            return None
             
-            # Update account with next run time
-            update_data = {
-                'next_run_at': next_run.isoformat(),
-                'updated_at': now.isoformat()
-            }
+        except Exception as e:
+            logger.error(f"❌ Error claiming due accounts: {e}")
+            return None
+    
+    def next_run_time(self, account: Dict, now: datetime) -> datetime:
+        """Next regular run: cadence plus random jitter"""
+        cadence_minutes = account.get('cadence_minutes') or self.default_cadence
+        jitter_seconds = account.get('jitter_seconds')
+        if jitter_seconds is None:
+            jitter_seconds = 60
+        
+        return now + timedelta(minutes=cadence_minutes) + timedelta(seconds=random.randint(0, jitter_seconds))
+    
+    def pick_caption(self, account: Dict) -> Optional[Dict]:
+        """
+        Pick and claim a caption in one round trip via the pick_caption RPC
+        
+        The RPC chooses a least-recently-used unused caption (excluding the
+        account's last caption) and marks it used atomically. Falls back to
+        client-side picking if the function is not deployed.
+        """
+        last_caption_id = account.get('last_caption_id')
+        
+        try:
+            response = self.db._make_request(
+                'POST',
+                f"{self.db.supabase_url}/rest/v1/rpc/pick_caption",
+                json={'p_exclude_id': last_caption_id}
+            )
             
-            return self.db.update_account(account_id, update_data)
+            if response.status_code == 200:
+                captions = response.json()
+                if captions:
+                    caption = captions[0]
+                    caption['claimed'] = True
+                    logger.info(f"📝 Claimed caption: {caption['id']} (avoiding {last_caption_id})")
+                    return caption
+                
+                logger.warning("⚠️ No captions available")
+                return None
+            
+            logger.warning(f"⚠️ pick_caption RPC unavailable ({response.status_code}), picking client-side")
             
         except Exception as e:
-            logger.error(f"❌ Error scheduling next run for account {account.get('id')}: {e}")
-            return False
+            logger.error(f"❌ Error calling pick_caption RPC: {e}")
+        
+        return self._pick_caption_rest(account)
     
-    def pick_caption(self, account: Dict) -> Optional[Dict]:
+    def _pick_caption_rest(self, account: Dict) -> Optional[Dict]:
         """Pick a caption with deduplication (avoid same caption twice in a row)"""
         try:
             last_caption_id = account.get('last_caption_id')
@@ -154,6 +393,37 @@ class AutopilotService:
             return None
     
     def pick_image(self) -> Optional[Dict]:
+        """
+        Pick a least-used image and bump its use count via the pick_image RPC
+        
+        One round trip and race-free; falls back to client-side picking if
+        the function is not deployed.
+        """
+        try:
+            response = self.db._make_request(
+                'POST',
+                f"{self.db.supabase_url}/rest/v1/rpc/pick_image",
+                json={}
+            )
+            
+            if response.status_code == 200:
+                images = response.json()
+                if images:
+                    image = images[0]
+                    logger.info(f"🖼️ Picked image {image['id']}, use count: {image.get('use_count')}")
+                    return image
+                
+                logger.warning("⚠️ No images available")
+                return None
+            
+            logger.warning(f"⚠️ pick_image RPC unavailable ({response.status_code}), picking client-side")
+            
+        except Exception as e:
+            logger.error(f"❌ Error calling pick_image RPC: {e}")
+        
+        return self._pick_image_rest()
+    
+    def _pick_image_rest(self) -> Optional[Dict]:
         """Pick a random image and bump use count"""
         try:
             response = self.db._make_request(
@@ -190,8 +460,449 @@ class AutopilotService:
             logger.error(f"❌ Error picking image: {e}")
             return None
     
-    def post_once(self, account: Dict, caption: Dict, image: Optional[Dict] = None) -> Tuple[bool, str]:
-        """Post once with retry logic for transient errors"""
+    def process_account(self, account: Dict, batch: Optional[TickWriteBatch] = None,
+                        staged: Optional[Dict] = None, deadline: Optional[float] = None) -> Dict:
+        """
+        Pick content, post and record the outcome for one due account
+        
+        When a staged container is given it is published first; if that
+        fails the normal pick-and-post path runs in the same turn.
+        Outcome writes are queued on the batch; without one, a private
+        batch is created and flushed before returning. Container waits are
+        bounded by the deadline (time.monotonic() value) when one is given.
+        """
+        if batch is None:
+            batch = TickWriteBatch()
+            try:
+                return self.process_account(account, batch, staged, deadline)
+            finally:
+                batch.flush(self.db)
+        
+        account_id = account.get('id')
+        username = account.get('username')
+        
+        try:
+            logger.info(f"📝 Processing account {account_id} ({username})")
+            
+            if staged:
+                result = self.publish_staged(account, staged, batch, deadline)
+                if result:
+                    return result
+            
+            # Pick content with deduplication
+            caption = self.pick_caption(account)
+            if not caption:
+                logger.warning(f"⚠️ No caption available for account {account_id}")
+                return {
+                    'account_id': account_id,
+                    'username': username,
+                    'status': 'failed',
+                    'error': 'No caption available'
+                }
+            
+            image = self.pick_image()
+            if image:
+                logger.info(f"🖼️ Using image: {image['id']}")
+            
+            # Single attempt; transient failures are re-enqueued rather than retried inline
+            success, message = self.post_once(account, caption, image, self.ready_budget(deadline))
+            now = datetime.now()
+            result = {
+                'account_id': account_id,
+                'username': username,
+                'status': 'success' if success else 'failed',
+                'caption_id': caption['id'],
+                'image_id': image['id'] if image else None,
+                'message': message
+            }
+            
+            if success:
+                batch.add_history(account_id, caption['id'], result['image_id'], 'posted')
+                batch.update_account(account, self.success_update(account, caption['id'], now))
+                if not caption.get('claimed'):
+                    batch.set_caption_used(caption['id'], True)
+                logger.info(f"✅ Posted successfully for account {account_id}")
+                return result
+            
+            # Container created but still processing: publish it on the retry instead of creating another
+            pending = PENDING_CONTAINER_PATTERN.search(message or '')
+            if pending:
+                expires_at = (datetime.now(timezone.utc) + timedelta(hours=STAGED_CONTAINER_TTL_HOURS)).isoformat()
+                batch.add_staged_post({
+                    'account_id': account_id,
+                    'container_id': pending.group(1),
+                    'caption_id': caption['id'],
+                    'image_id': result['image_id'],
+                    'caption_was_unused': bool(caption.get('was_unused')),
+                    'expires_at': expires_at
+                })
+                if not caption.get('claimed'):
+                    batch.set_caption_used(caption['id'], True)
+                retry_at = now + timedelta(seconds=self.retry_delay_seconds(message))
+                batch.update_account(account, {
+                    'last_error': message,
+                    'next_run_at': retry_at.isoformat(),
+                    'updated_at': now.isoformat()
+                })
+                logger.info(f"⏳ Container {pending.group(1)} for account {account_id} staged, publishing at {retry_at}")
+                result.update({'status': 'retry_scheduled', 'retry_at': retry_at.isoformat(), 'container_id': pending.group(1)})
+                return result
+            
+            # Give a claimed caption back so it is not burned by a failed post
+            if caption.get('claimed') and caption.get('was_unused'):
+                batch.set_caption_used(caption['id'], False)
+            
+            # Let the quota tracker hold this account back until Meta's limit resets
+            if 'rate limit' in (message or '').lower():
+                hint = RETRY_AFTER_PATTERN.search(message)
+                meta_quota.record_throttle(account_id, int(hint.group(1)) if hint else None)
+            
+            error_count = (account.get('error_count') or 0) + 1
+            
+            if self.should_retry(account, message):
+                retry_at = now + timedelta(seconds=self.retry_delay_seconds(message))
+                batch.update_account(account, {
+                    'last_error': message,
+                    'error_count': error_count,
+                    'next_run_at': retry_at.isoformat(),
+                    'updated_at': now.isoformat()
+                })
+                logger.info(f"🔁 Retry for account {account_id} scheduled at {retry_at}")
+                result.update({'status': 'retry_scheduled', 'retry_at': retry_at.isoformat()})
+                return result
+            
+            # Hard failure: record it and back off
+            next_run = now + timedelta(minutes=HARD_ERROR_BACKOFF_MINUTES)
+            batch.add_history(account_id, caption['id'], result['image_id'], 'failed')
+            batch.update_account(account, {
+                'last_error': message,
+                'error_count': error_count,
+                'next_run_at': next_run.isoformat(),
+                'updated_at': now.isoformat()
+            })
+            logger.error(f"❌ Failed to post for account {account_id}: {message}")
+            logger.warning(f"⚠️ Error #{error_count} for account {account_id}, backing off until {next_run}")
+            return result
+            
+        except Exception as e:
+            logger.error(f"❌ Error processing account {account_id}: {e}")
+            return {
+                'account_id': account_id,
+                'username': username,
+                'status': 'failed',
+                'error': str(e)
+            }
+    
+    def success_update(self, account: Dict, caption_id: Optional[int], now: datetime) -> Dict:
+        """Account columns written after a successful post"""
+        return {
+            'last_posted_at': now.isoformat(),
+            'last_caption_id': caption_id,
+            'last_error': None,
+            'error_count': 0,
+            'next_run_at': self.next_run_time(account, now).isoformat(),
+            'updated_at': now.isoformat()
+        }
+    
+    def ready_budget(self, deadline: Optional[float]) -> Optional[float]:
+        """Seconds a container wait may take before the tick deadline (None: no deadline)"""
+        if deadline is None:
+            return None
+        return max(0.0, deadline - time.monotonic() - PUBLISH_MARGIN_SECONDS)
+    
+    def publish_staged(self, account: Dict, staged: Dict, batch: TickWriteBatch,
+                       deadline: Optional[float] = None) -> Optional[Dict]:
+        """
+        Publish a pre-created container for a due account
+        
+        Returns the success result, or None after marking the staged post
+        failed (and giving its caption back) so the caller can post normally.
+        """
+        account_id = account['id']
+        
+        try:
+            token_data = self.db.get_token_by_account_id(account_id)
+            if not token_data:
+                raise GraphAPIError("No access token found")
+            
+            if staged.get('image_id'):
+                # Normally already FINISHED (the poller started at staging time); otherwise wait briefly
+                wait = self.staged_ready_timeout
+                budget = self.ready_budget(deadline)
+                if budget is not None:
+                    wait = min(wait, budget)
+                graph_client.wait_container_ready(
+                    token_data['access_token'], staged['container_id'], account_id, timeout=wait
+                )
+            
+            thread_id = graph_client.run(graph_client.client.publish_container(
+                token_data['access_token'], staged['container_id'], account_id
+            ))
+        except Exception as e:
+            logger.warning(f"⚠️ Staged container {staged.get('container_id')} failed for account {account_id}, posting normally: {e}")
+            batch.set_staged_status(staged['id'], 'failed')
+            if staged.get('caption_id') and staged.get('caption_was_unused'):
+                batch.set_caption_used(staged['caption_id'], False)
+            return None
+        
+        now = datetime.now()
+        batch.add_history(account_id, staged.get('caption_id'), staged.get('image_id'), 'posted', thread_id)
+        batch.update_account(account, self.success_update(account, staged.get('caption_id'), now))
+        batch.set_staged_status(staged['id'], 'published')
+        logger.info(f"✅ Published staged container for account {account_id} (thread {thread_id})")
+        
+        return {
+            'account_id': account_id,
+            'username': account.get('username'),
+            'status': 'success',
+            'caption_id': staged.get('caption_id'),
+            'image_id': staged.get('image_id'),
+            'message': f"OFFICIAL_API_SUCCESS: Published staged container (thread {thread_id})",
+            'staged': True
+        }
+    
+    def stage_upcoming(self, now: datetime) -> Dict[str, int]:
+        """
+        Pre-create media containers for accounts due within the staging window
+        
+        Content is picked now and containers are created concurrently, so at
+        due time posting is a single publish call and image processing has
+        already happened off the critical path. Only accounts that post via
+        the official API are staged. Accounts are leased (claimed_by) while
+        staging so overlapping ticks cannot stage the same account, and
+        captions are only kept used for rows that were actually stored.
+        """
+        summary = {'candidates': 0, 'staged': 0, 'failed': 0}
+        
+        if not self.meta_publish_enabled:
+            return summary
+        
+        from services.threads_api import threads_client
+        
+        claimed_ids: List[int] = []
+        jobs = []
+        staged_accounts = set()
+        
+        try:
+            # Expired containers were never published; give their captions back
+            expired = self.db.expire_staged_posts()
+            self.db.set_captions_used(
+                [row['caption_id'] for row in expired if row.get('caption_id') and row.get('caption_was_unused')],
+                False
+            )
+            
+            window_end = now + timedelta(minutes=self.stage_window_minutes)
+            response = self.db._make_request(
+                'GET',
+                f"{self.db.supabase_url}/rest/v1/accounts",
+                params=[
+                    ('autopilot_enabled', 'eq.true'),
+                    ('threads_user_id', 'not.is.null'),
+                    ('next_run_at', f'gt.{now.isoformat()}'),
+                    ('next_run_at', f'lte.{window_end.isoformat()}'),
+                    ('select', DUE_ACCOUNT_COLUMNS),
+                    ('order', 'next_run_at.asc'),
+                    ('limit', str(self.stage_max_per_tick))
+                ]
+            )
+            if response.status_code != 200:
+                logger.error(f"❌ Failed to fetch upcoming accounts: {response.status_code}")
+                return summary
+            
+            upcoming = response.json()
+            if not upcoming:
+                return summary
+            
+            worker_id = f"stage:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            claimed_ids = self.db.claim_accounts(
+                [a['id'] for a in upcoming], worker_id, self.tick_deadline_seconds + 60
+            )
+            upcoming = [a for a in upcoming if a['id'] in claimed_ids]
+            already_staged = self.db.get_staged_posts([a['id'] for a in upcoming])
+            
+            for account in upcoming:
+                if account['id'] in already_staged or not threads_client.has_official_access(account):
+                    continue
+                
+                token_data = self.db.get_token_by_account_id(account['id'])
+                if not token_data:
+                    continue
+                
+                caption = self.pick_caption(account)
+                if not caption:
+                    logger.warning("⚠️ No caption available for staging")
+                    break
+                
+                jobs.append((account, caption, self.pick_image(), token_data['access_token']))
+            
+            summary['candidates'] = len(jobs)
+            if not jobs:
+                return summary
+            
+            container_ids = graph_client.run_many([
+                graph_client.client.create_container(token, caption['text'], image['url'] if image else None, account['id'])
+                for account, caption, image, token in jobs
+            ])
+            
+            rows = []
+            expires_at = (datetime.now(timezone.utc) + timedelta(hours=STAGED_CONTAINER_TTL_HOURS)).isoformat()
+            
+            for (account, caption, image, token), container_id in zip(jobs, container_ids):
+                if isinstance(container_id, Exception):
+                    logger.warning(f"⚠️ Could not stage container for account {account['id']}: {container_id}")
+                    continue
+                
+                if image:
+                    # Let the shared poller watch image processing in the background
+                    graph_client.track_container(token, container_id, account['id'])
+                rows.append({
+                    'account_id': account['id'],
+                    'container_id': container_id,
+                    'caption_id': caption['id'],
+                    'image_id': image['id'] if image else None,
+                    'caption_was_unused': bool(caption.get('was_unused')),
+                    'expires_at': expires_at
+                })
+            
+            staged_accounts = {row['account_id'] for row in self.db.bulk_insert_staged_posts(rows)}
+            logger.info(f"📦 Staged {len(staged_accounts)} containers for the next {self.stage_window_minutes} minutes")
+            return summary
+            
+        except Exception as e:
+            logger.error(f"❌ Error staging upcoming posts: {e}")
+            return summary
+        
+        finally:
+            # Keep captions of stored rows used; give back the ones claimed for anything else,
+            # along with the use counts pick_image added for images that were never staged
+            captions_used, captions_released, images_released = [], [], []
+            for account, caption, image, token in jobs:
+                if account['id'] in staged_accounts:
+                    if not caption.get('claimed'):
+                        captions_used.append(caption['id'])
+                    continue
+                if caption.get('claimed') and caption.get('was_unused'):
+                    captions_released.append(caption['id'])
+                if image:
+                    images_released.append(image['id'])
+            self.db.set_captions_used(captions_used, True)
+            self.db.set_captions_used(captions_released, False)
+            self.db.release_images(images_released)
+            
+            if claimed_ids:
+                self.db.bulk_update_accounts(claimed_ids, {'claimed_by': None, 'claimed_until': None})
+            
+            summary['staged'] = len(staged_accounts)
+            summary['failed'] = len(jobs) - summary['staged']
+    
+    def process_accounts(self, accounts: List[Dict], deadline: Optional[float] = None) -> List[Dict]:
+        """
+        Process due accounts concurrently on a bounded worker pool
+        
+        Each account runs in isolation (its failure never affects others).
+        Accounts whose turn comes after the deadline (time.monotonic() value)
+        are skipped and left due, so the next tick picks them up.
+        Meta API quota is checked first for accounts that post through the
+        Graph API (session-only accounts never touch it): throttled ones are
+        pushed back until their quota resets, and when app usage runs high
+        only the most overdue of them run, the rest are deferred to later ticks.
+        All outcome writes are flushed in bulk once the workers finish.
+        Results are returned in the same order as the input accounts.
+        """
+        if not accounts:
+            return []
+        
+        if deadline is None:
+            deadline = time.monotonic() + self.tick_deadline_seconds
+        
+        batch = TickWriteBatch(self.flush_seconds)
+        staged_posts = self.db.get_staged_posts([a['id'] for a in accounts]) if self.meta_publish_enabled else {}
+        pace_limit = 0
+        
+        def run(ranked_account: Tuple[Optional[int], Dict]) -> Dict:
+            graph_rank, account = ranked_account
+            
+            defer = meta_quota.defer_seconds(account.get('id')) if graph_rank is not None else 0
+            if defer or (graph_rank is not None and graph_rank >= pace_limit):
+                result = {
+                    'account_id': account.get('id'),
+                    'username': account.get('username'),
+                    'status': 'deferred',
+                    'error': 'Meta API quota exhausted' if defer else 'Pacing Meta API usage'
+                }
+                if defer:
+                    now = datetime.now()
+                    retry_at = now + timedelta(seconds=defer)
+                    batch.update_account(account, {
+                        'next_run_at': retry_at.isoformat(),
+                        'updated_at': now.isoformat()
+                    })
+                    result['retry_at'] = retry_at.isoformat()
+                logger.info(f"🐢 Deferring account {account.get('id')}: {result['error']}")
+                return result
+            
+            if time.monotonic() >= deadline:
+                logger.warning(f"⏰ Tick deadline reached, skipping account {account.get('id')}")
+                return {
+                    'account_id': account.get('id'),
+                    'username': account.get('username'),
+                    'status': 'skipped',
+                    'error': 'Tick deadline reached'
+                }
+            
+            try:
+                result = self.process_account(account, batch, staged_posts.get(account.get('id')), deadline)
+                batch.checkpoint(self.db)
+                return result
+            except Exception as e:
+                logger.error(f"❌ Worker error for account {account.get('id')}: {e}")
+                return {
+                    'account_id': account.get('id'),
+                    'username': account.get('username'),
+                    'status': 'failed',
+                    'error': str(e)
+                }
+        
+        workers = min(self.tick_concurrency, len(accounts))
+        logger.info(f"🧵 Processing {len(accounts)} accounts with {workers} workers")
+        
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='autopilot') as executor:
+                # Rank Graph API accounts by position (input is most overdue first); session-only ones get None
+                uses_graph = list(executor.map(self.uses_graph_api, accounts))
+                ranks, graph_count = [], 0
+                for uses in uses_graph:
+                    ranks.append(graph_count if uses else None)
+                    graph_count += int(uses)
+                
+                pace_limit = meta_quota.pace_limit(graph_count)
+                if pace_limit < graph_count:
+                    logger.warning(f"🐢 Meta API usage at {meta_quota.app_usage():.0f}%, running {pace_limit} of {graph_count} Graph API accounts")
+                
+                return list(executor.map(run, zip(ranks, accounts)))
+        finally:
+            # Hand claimed accounts back (including skipped ones) in the same write-back
+            for account in accounts:
+                if account.get('claimed_by'):
+                    batch.update_account(account, {'claimed_by': None, 'claimed_until': None})
+            batch.flush(self.db)
+    
+    def uses_graph_api(self, account: Dict) -> bool:
+        """Whether this account's posts go through the official Graph API (and so count against Meta quota)"""
+        if not self.meta_publish_enabled:
+            return False
+        from services.threads_api import threads_client
+        return threads_client.has_official_access(account)
+    
+    def post_once(self, account: Dict, caption: Dict, image: Optional[Dict] = None,
+                  ready_timeout: Optional[float] = None) -> Tuple[bool, str]:
+        """
+        Make a single posting attempt
+        
+        Never sleeps: transient failures are returned to the caller, which
+        re-enqueues the account with a near-future next_run_at instead.
+        ready_timeout caps the wait for image container processing.
+        """
         try:
             from services.threads_api import threads_client
             
@@ -205,40 +916,33 @@ class AutopilotService:
             if image_url:
                 logger.info(f"🖼️ Image: {image_url}")
             
-            # First attempt
-            success, message = threads_client.post_thread(account, caption_text, image_url)
+            success, message = threads_client.post_thread(account, caption_text, image_url, ready_timeout)
             
             if success:
-                logger.info(f"✅ Post successful on first attempt for account {account_id}")
-                return True, message
-            
-            # Check if error is retryable
-            if self._is_retryable_error(message):
-                logger.warning(f"⚠️ Transient error for account {account_id}, retrying: {message}")
-                
-                # Wait 10-20 seconds before retry
-                retry_delay = random.randint(10, 20)
-                logger.info(f"⏳ Waiting {retry_delay}s before retry for account {account_id}")
-                time.sleep(retry_delay)
-                
-                # Retry attempt
-                logger.info(f"🔄 Retrying post for account {account_id}")
-                success, message = threads_client.post_thread(account, caption_text, image_url)
-                
-                if success:
-                    logger.info(f"✅ Post successful on retry for account {account_id}")
-                    return True, message
-                else:
-                    logger.error(f"❌ Post failed on retry for account {account_id}: {message}")
-                    return False, f"Retry failed: {message}"
+                logger.info(f"✅ Post successful for account {account_id}")
+            elif self._is_retryable_error(message):
+                logger.warning(f"⚠️ Transient error for account {account_id}: {message}")
             else:
                 logger.error(f"❌ Hard error for account {account_id}: {message}")
-                return False, message
+            
+            return success, message
             
         except Exception as e:
             logger.error(f"❌ Exception during post for account {account.get('id')}: {e}")
             return False, str(e)
     
+    def should_retry(self, account: Dict, error_message: str) -> bool:
+        """Whether a failed post should be re-enqueued soon instead of backed off"""
+        error_count = account.get('error_count') or 0
+        return self._is_retryable_error(error_message) and error_count < self.max_quick_retries
+    
+    def retry_delay_seconds(self, error_message: str) -> int:
+        """Delay before a quick retry, honouring any Retry-After hint in the error"""
+        match = RETRY_AFTER_PATTERN.search(error_message or '')
+        if match:
+            return min(int(match.group(1)), MAX_RETRY_AFTER_SECONDS)
+        return random.randint(self.retry_min_seconds, self.retry_max_seconds)
+    
     def _is_retryable_error(self, error_message: str) -> bool:
         """Determine if an error is worth retrying"""
         retryable_patterns = [
@@ -256,111 +960,6 @@ class AutopilotService:
         
         error_lower = error_message.lower()
         return any(pattern in error_lower for pattern in retryable_patterns)
-    
-
-    
-    def record_posting_history(self, account_id: int, caption_id: int, image_id: Optional[int], 
-                              success: bool, message: str) -> bool:
-        """Record posting attempt in history"""
-        try:
-            status = 'posted' if success else 'failed'
-            thread_id = None  # Would be set by actual posting
-            
-            return self.db.record_posting_history(
-                account_id=account_id,
-                caption_id=caption_id,
-                image_id=image_id,
-                thread_id=thread_id,
-                status=status
-            )
-            
-        except Exception as e:
-            logger.error(f"❌ Error recording posting history: {e}")
-            return False
-    
-    def mark_caption_used(self, caption_id: int) -> bool:
-        """Mark caption as used"""
-        try:
-            return self.db.mark_caption_used(caption_id)
-        except Exception as e:
-            logger.error(f"❌ Error marking caption used: {e}")
-            return False
-    
-    def update_account_posting_stats(self, account_id: int, success: bool, caption_id: Optional[int] = None, error_message: Optional[str] = None) -> bool:
-        """Update account posting statistics with resilience tracking"""
-        try:
-            now = datetime.now()
-            update_data = {
-                'updated_at': now.isoformat()
-            }
-            
-            if success:
-                # Reset error tracking on success
-                update_data.update({
-                    'last_posted_at': now.isoformat(),
-                    'last_caption_id': caption_id,
-                    'last_error': None,
-                    'error_count': 0
-                })
-                logger.info(f"✅ Reset error tracking for successful post on account {account_id}")
-            else:
-                # Handle error case with backoff
-                # Get current error count
-                account = self.db.get_account_by_id(account_id)
-                current_error_count = account.get('error_count', 0) if account else 0
-                new_error_count = current_error_count + 1
-                
-                update_data.update({
-                    'last_error': error_message,
-                    'error_count': new_error_count
-                })
-                
-                # Apply backoff - 60 minutes for hard errors
-                backoff_minutes = 60
-                next_run = now + timedelta(minutes=backoff_minutes)
-                update_data['next_run_at'] = next_run.isoformat()
-                
-                logger.warning(f"⚠️ Error #{new_error_count} for account {account_id}, backing off until {next_run}")
-            
-            return self.db.update_account(account_id, update_data)
-            
-        except Exception as e:
-            logger.error(f"❌ Error updating account stats: {e}")
-            return False
-    
-    def handle_posting_success(self, account_id: int, caption_id: int, image_id: Optional[int]) -> bool:
-        """Handle successful posting - update stats and schedule next run"""
-        try:
-            # Update posting stats (clears errors)
-            self.update_account_posting_stats(account_id, True, caption_id)
-            
-            # Mark caption as used
-            self.mark_caption_used(caption_id)
-            
-            # Schedule next regular run
-            account = self.db.get_account_by_id(account_id)
-            if account:
-                self.schedule_next(account)
-            
-            logger.info(f"✅ Handled successful posting for account {account_id}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Error handling posting success: {e}")
-            return False
-    
-    def handle_posting_failure(self, account_id: int, error_message: str) -> bool:
-        """Handle posting failure - apply backoff and store error"""
-        try:
-            # Update with error and backoff
-            self.update_account_posting_stats(account_id, False, error_message=error_message)
-            
-            logger.warning(f"⚠️ Handled posting failure for account {account_id}: {error_message}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Error handling posting failure: {e}")
-            return False
 
 # Global instance
 autopilot_service = AutopilotService()
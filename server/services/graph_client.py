@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+Graph Client Service
+Asyncio Threads Graph API client with a shared aiohttp connection pool,
+per-call timeouts and a concurrency cap, plus a sync facade for Flask code
+"""
+
+import os
+import json
+import random
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from collections import OrderedDict
+from typing import Any, Awaitable, Dict, List, Optional
+
+import aiohttp
+
+from services.meta_quota import meta_quota
+from services.ttl_cache import MISSING
+from services.token_validation import token_validation_cache
+
+logger = logging.getLogger(__name__)
+
+class GraphAPIError(Exception):
+    """A Graph API call returned a non-2xx response"""
+
+    def __init__(self, message: str, status: int = 0, data: Optional[Dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.data = data or {}
+
+class GraphResponse:
+    """Buffered Graph response (requests-like surface, so meta_quota can read it)"""
+
+    def __init__(self, status: int, headers: Dict[str, str], text: str):
+        self.status_code = status
+        self.headers = headers
+        self.text = text
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 300
+
+    def json(self) -> Dict[str, Any]:
+        return json.loads(self.text) if self.text else {}
+
+# Container states reported by GET /{container-id}?fields=status
+CONTAINER_READY = {'FINISHED', 'PUBLISHED'}
+CONTAINER_FAILED = {'ERROR', 'EXPIRED'}
+
+class ContainerPoller:
+    """
+    One polling loop for every in-flight media container
+
+    Callers register containers and await readiness. A single task checks
+    all due containers each round, one multi-id request (?ids=) per token,
+    and backs each container off exponentially (with jitter) while it is
+    IN_PROGRESS. Waiters are woken as soon as their container is ready.
+    """
+
+    def __init__(self, client: 'AsyncGraphClient', base_delay: float = 1.0, max_delay: float = 30.0,
+                 max_age: float = 600.0, batch_size: int = 50):
+        self.client = client
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.finished: 'OrderedDict[str, str]' = OrderedDict()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def track(self, token: str, container_id: str, account_id: Optional[int] = None,
+              initial_delay: Optional[float] = None) -> Dict[str, Any]:
+        """Start polling a container (no-op if already tracked); call on the client loop"""
+        entry = self.pending.get(container_id)
+        if entry is None:
+            loop = asyncio.get_running_loop()
+            entry = {
+                'token': token,
+                'account_id': account_id,
+                'attempts': 0,
+                'created_at': loop.time(),
+                'next_check': loop.time() + (self.base_delay if initial_delay is None else initial_delay),
+                'waiters': []
+            }
+            self.pending[container_id] = entry
+
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        self._wake.set()
+        return entry
+
+    async def wait_ready(self, token: str, container_id: str, account_id: Optional[int] = None,
+                         timeout: Optional[float] = None) -> str:
+        """Wait until the container can be published; raises GraphAPIError if it failed"""
+        status = self.finished.get(container_id)
+        if status is not None:
+            return status
+
+        entry = self.track(token, container_id, account_id)
+        waiter = asyncio.get_running_loop().create_future()
+        entry['waiters'].append(waiter)
+        try:
+            # shield: a caller timing out must not cancel the shared poll state
+            return await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        finally:
+            # A timed-out or cancelled caller must not leave its future behind
+            if waiter in entry['waiters']:
+                entry['waiters'].remove(waiter)
+
+    def _resolve(self, container_id: str, status: Optional[str] = None, error: Optional[Exception] = None):
+        entry = self.pending.pop(container_id, None)
+        if status is not None:
+            self.finished[container_id] = status
+            while len(self.finished) > 1000:
+                self.finished.popitem(last=False)
+        if not entry:
+            return
+        for waiter in entry['waiters']:
+            if waiter.done():
+                continue
+            if error is not None:
+                waiter.set_exception(error)
+            else:
+                waiter.set_result(status)
+
+    def _backoff(self, entry: Dict[str, Any], now: float):
+        entry['attempts'] += 1
+        delay = min(self.max_delay, self.base_delay * (2 ** entry['attempts']))
+        entry['next_check'] = now + delay * random.uniform(0.8, 1.2)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while self.pending:
+            now = loop.time()
+            due = [cid for cid, entry in self.pending.items() if entry['next_check'] <= now]
+            if due:
+                try:
+                    await self._check(due)
+                except Exception as e:
+                    logger.error(f"❌ Container poller round failed: {e}")
+                    for container_id in due:
+                        if container_id in self.pending:
+                            self._backoff(self.pending[container_id], loop.time())
+
+            if not self.pending:
+                break
+
+            delay = min(entry['next_check'] for entry in self.pending.values()) - loop.time()
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(0.0, delay))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _check(self, container_ids: List[str]):
+        groups: Dict[str, List[str]] = {}
+        for container_id in container_ids:
+            groups.setdefault(self.pending[container_id]['token'], []).append(container_id)
+
+        calls = []
+        for token, ids in groups.items():
+            for start in range(0, len(ids), self.batch_size):
+                chunk = ids[start:start + self.batch_size]
+                calls.append((chunk, self.client.request(
+                    'GET', '', token, self.pending[chunk[0]]['account_id'],
+                    params={'ids': ','.join(chunk), 'fields': 'status,error_message'}
+                )))
+
+        results = await asyncio.gather(*(call for _, call in calls), return_exceptions=True)
+        now = asyncio.get_running_loop().time()
+
+        for (chunk, _), result in zip(calls, results):
+            for container_id in chunk:
+                entry = self.pending.get(container_id)
+                if entry is None:
+                    continue
+
+                info = result.get(container_id, {}) if isinstance(result, dict) else {}
+                status = info.get('status')
+
+                if status in CONTAINER_READY:
+                    self._resolve(container_id, status)
+                elif status in CONTAINER_FAILED:
+                    message = info.get('error_message') or status
+                    self._resolve(container_id, error=GraphAPIError(f"Container {container_id} {status}: {message}"))
+                elif now - entry['created_at'] > self.max_age:
+                    self._resolve(container_id, error=GraphAPIError(f"Container {container_id} not ready after {int(self.max_age)}s"))
+                else:
+                    if isinstance(result, Exception):
+                        logger.warning(f"⚠️ Container status check failed for {container_id}: {result}")
+                    self._backoff(entry, now)
+
+class AsyncGraphClient:
+    """Coroutine API for the Threads Graph endpoints; must be used on one event loop"""
+
+    def __init__(self, pool_size: int = 50, concurrency: int = 20,
+                 connect_timeout: float = 5.0, read_timeout: float = 30.0):
+        self.base_url = "https://graph.threads.net/"
+        self.api_version = os.getenv('GRAPH_API_VERSION', 'v1.0')
+        self.api_url = f"{self.base_url}{self.api_version}/"
+        self.pool_size = pool_size
+        self.concurrency = concurrency
+        self.timeout = aiohttp.ClientTimeout(total=connect_timeout + read_timeout,
+                                             sock_connect=connect_timeout,
+                                             sock_read=read_timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.container_ready_timeout = float(os.getenv('GRAPH_CONTAINER_READY_TIMEOUT', '300'))
+        self.poller = ContainerPoller(
+            self,
+            base_delay=float(os.getenv('GRAPH_CONTAINER_POLL_BASE_SECONDS', '1')),
+            max_delay=float(os.getenv('GRAPH_CONTAINER_POLL_MAX_SECONDS', '30')),
+            max_age=self.container_ready_timeout
+        )
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def request(self, method: str, path: str, token: str, account_id: Optional[int] = None,
+                      params: Optional[Dict] = None, json_body: Optional[Dict] = None,
+                      timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Make one Graph call and return its JSON body
+
+        Usage headers are fed to meta_quota; non-2xx responses raise GraphAPIError.
+        `timeout` overrides the total timeout for this call only; otherwise the
+        client's connect/read/total timeouts apply.
+        """
+        session = await self._get_session()
+        url = path if path.startswith('http') else f"{self.api_url}{path}"
+        headers = {'Authorization': f'Bearer {token}'}
+        call_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else self.timeout
+
+        async with self._semaphore:
+            async with session.request(method, url, params=params, json=json_body,
+                                       headers=headers, timeout=call_timeout) as resp:
+                response = GraphResponse(resp.status, dict(resp.headers), await resp.text())
+
+        meta_quota.record_response(response, account_id)
+
+        if not response.ok:
+            try:
+                data = response.json()
+            except ValueError:
+                data = {}
+            message = data.get('error', {}).get('message') or response.text
+            raise GraphAPIError(f"{response.status_code} - {message}", response.status_code, data)
+
+        return response.json()
+
+    async def create_container(self, token: str, text: str, image_url: Optional[str] = None,
+                               account_id: Optional[int] = None) -> str:
+        """Create a media container (TEXT, or IMAGE when image_url is given) and return its id"""
+        params = {'media_type': 'IMAGE' if image_url else 'TEXT', 'text': text}
+        if image_url:
+            params['image_url'] = image_url
+
+        data = await self.request('POST', 'me/threads', token, account_id, json_body=params)
+        container_id = data.get('id')
+        if not container_id:
+            raise GraphAPIError("No container ID received")
+        return container_id
+
+    def ready_wait(self, ready_timeout: Optional[float] = None) -> float:
+        """Seconds to wait for container processing, capped by the caller's budget"""
+        if ready_timeout is None:
+            return self.container_ready_timeout
+        return max(0.0, min(ready_timeout, self.container_ready_timeout))
+
+    async def publish_container(self, token: str, container_id: str,
+                                account_id: Optional[int] = None) -> str:
+        """Publish a media container and return the thread id"""
+        data = await self.request('POST', 'me/threads_publish', token, account_id,
+                                  json_body={'creation_id': container_id})
+        thread_id = data.get('id')
+        if not thread_id:
+            raise GraphAPIError("No thread ID received")
+        return thread_id
+
+    async def post_thread(self, token: str, text: str, image_url: Optional[str] = None,
+                          account_id: Optional[int] = None,
+                          ready_timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Create and publish a thread; returns the same result shape as MetaClient.post_thread
+
+        ready_timeout caps the wait for image container processing (callers
+        with their own deadline pass the time they have left).
+        """
+        container_id = None
+        try:
+            container_id = await self.create_container(token, text, image_url, account_id)
+            logger.info(f"✅ Post created successfully, container: {container_id}")
+
+            if image_url:
+                # Image containers need processing before they can be published
+                wait = self.ready_wait(ready_timeout)
+                try:
+                    await self.poller.wait_ready(token, container_id, account_id, wait)
+                except asyncio.TimeoutError:
+                    logger.warning(f"⏰ Container {container_id} not ready within {wait:.0f}s")
+                    return {
+                        'success': False,
+                        'container_id': container_id,
+                        'status': 'pending',
+                        'error': f"Media container not ready (timeout after {wait:.0f}s)"
+                    }
+
+            thread_id = await self.publish_container(token, container_id, account_id)
+            logger.info(f"✅ Post published successfully, thread: {thread_id}")
+
+            return {
+                'success': True,
+                'container_id': container_id,
+                'thread_id': thread_id,
+                'status': 'published'
+            }
+        except Exception as e:
+            logger.error(f"❌ Error posting thread: {e}")
+            return {'success': False, 'error': str(e)}
+
+    async def get_recent_posts(self, token: str, limit: int = 10,
+                               account_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get the account's most recent threads with engagement fields"""
+        data = await self.request('GET', 'me/threads', token, account_id, params={
+            'fields': 'id,text,media_type,media_url,permalink,timestamp,likes,replies,reposts,quotes,views',
+            'limit': limit,
+        })
+        return data.get('data', [])
+
+    async def get_user_stats(self, token: str, account_id: Optional[int] = None) -> Dict[str, Any]:
+        """Profile plus recent posts, fetched concurrently"""
+        try:
+            profile_call = self.request('GET', 'me', token, account_id, params={
+                'fields': 'id,username,threads_biography,threads_profile_picture_url,follower_count',
+            })
+            user_data, posts = await asyncio.gather(
+                profile_call,
+                self.get_recent_posts(token, account_id=account_id),
+                return_exceptions=True
+            )
+            if isinstance(user_data, Exception):
+                raise user_data
+            if isinstance(posts, Exception):
+                logger.error(f"❌ Recent posts failed: {posts}")
+                posts = []
+
+            return {
+                'success': True,
+                'data': {
+                    'user_id': user_data.get('id'),
+                    'username': user_data.get('username'),
+                    'biography': user_data.get('threads_biography'),
+                    'profile_picture': user_data.get('threads_profile_picture_url'),
+                    'follower_count': user_data.get('follower_count', 0),
+                    'recent_posts': posts,
+                    'total_posts': len(posts),
+                }
+            }
+        except Exception as e:
+            logger.error(f"❌ Error getting user stats: {e}")
+            return {'success': False, 'error': str(e)}
+
+    async def validate_token(self, token: str, account_id: Optional[int] = None) -> bool:
+        """Check a token with GET /me, answering from token_validation_cache when possible"""
+        cached = token_validation_cache.get(token)
+        if cached is not MISSING:
+            return cached['valid']
+
+        try:
+            await self.request('GET', 'me', token, account_id, params={'fields': 'id'})
+            token_validation_cache.put(token, True)
+            return True
+        except GraphAPIError as e:
+            # Only a definite rejection is cached; throttling and outages are retried next time
+            if e.status in (400, 401, 403):
+                token_validation_cache.put(token, False)
+            return False
+        except Exception:
+            return False
+
+class GraphClient:
+    """
+    Sync facade over AsyncGraphClient
+
+    Runs one event loop on a daemon thread and submits coroutines to it, so
+    Flask handlers and autopilot workers can block on a single call or fan
+    many accounts' calls out concurrently with run_many().
+    """
+
+    def __init__(self):
+        self.client = AsyncGraphClient(
+            pool_size=int(os.getenv('GRAPH_POOL_SIZE', '50')),
+            concurrency=int(os.getenv('GRAPH_MAX_CONCURRENCY', '20')),
+            connect_timeout=float(os.getenv('GRAPH_CONNECT_TIMEOUT', '5')),
+            read_timeout=float(os.getenv('GRAPH_READ_TIMEOUT', '30'))
+        )
+        # Upper bound on how long a caller blocks on one facade call
+        self.call_timeout = float(os.getenv('GRAPH_CALL_TIMEOUT_SECONDS', '60'))
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None:
+            return self._loop
+
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='graph-client', daemon=True)
+                thread.start()
+                self._loop = loop
+                logger.info("🔌 Graph client event loop started")
+            return self._loop
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine on the client loop and wait for its result
+
+        Waits at most `timeout` seconds (default call_timeout); on timeout the
+        coroutine is cancelled and concurrent.futures.TimeoutError is raised.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self._get_loop())
+        try:
+            return future.result(self.call_timeout if timeout is None else timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def run_many(self, coros: List[Awaitable], timeout: Optional[float] = None) -> List[Any]:
+        """Run coroutines concurrently; exceptions are returned in place of results"""
+        async def gather():
+            return await asyncio.gather(*coros, return_exceptions=True)
+        return self.run(gather(), timeout)
+
+    def post_thread(self, token: str, text: str, image_url: Optional[str] = None,
+                    account_id: Optional[int] = None,
+                    ready_timeout: Optional[float] = None) -> Dict[str, Any]:
+        # Image posts may wait on container processing on top of the create/publish calls
+        timeout = self.call_timeout + (self.client.ready_wait(ready_timeout) if image_url else 0)
+        return self.run(self.client.post_thread(token, text, image_url, account_id, ready_timeout), timeout)
+
+    def get_user_stats(self, token: str, account_id: Optional[int] = None) -> Dict[str, Any]:
+        return self.run(self.client.get_user_stats(token, account_id))
+
+    def get_recent_posts(self, token: str, limit: int = 10,
+                         account_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self.run(self.client.get_recent_posts(token, limit, account_id))
+
+    def validate_token(self, token: str, account_id: Optional[int] = None) -> bool:
+        return self.run(self.client.validate_token(token, account_id))
+
+    def track_container(self, token: str, container_id: str, account_id: Optional[int] = None):
+        """Start polling a container's status in the background"""
+        async def track():
+            self.client.poller.track(token, container_id, account_id)
+        self.run(track())
+
+    def wait_container_ready(self, token: str, container_id: str, account_id: Optional[int] = None,
+                             timeout: Optional[float] = None) -> str:
+        """Block until the shared poller reports the container ready (raises on failure/timeout)"""
+        wait = self.client.container_ready_timeout if timeout is None else timeout
+        return self.run(self.client.poller.wait_ready(token, container_id, account_id, wait), wait + 5)
+
+# Global graph client instance
+graph_client = GraphClient()
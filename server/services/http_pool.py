@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+HTTP Pool Service
+Shared keep-alive requests sessions with bounded connection pools
+"""
+
+import os
+import logging
+import requests
+from threading import Lock
+from typing import Dict, Any, Optional, Tuple
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+class PooledSession:
+    """Thread-safe wrapper around a requests.Session backed by a connection pool"""
+
+    def __init__(self, name: str, pool_size: int = 20, connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0, pool_block: bool = False):
+        self.name = name
+        self.pool_size = pool_size
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+
+        # One adapter per scheme; pool_maxsize bounds the keep-alive sockets per host
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            pool_block=pool_block
+        )
+        self.session = requests.Session()
+        self.session.headers.update({'Connection': 'keep-alive'})
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+        self._lock = Lock()
+        self._requests = 0
+        self._errors = 0
+
+        logger.info(f"🔌 PooledSession '{name}' initialized (pool size: {pool_size}, timeout: {self.timeout})")
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request through the shared pool, applying the default timeout"""
+        kwargs.setdefault('timeout', self.timeout)
+
+        with self._lock:
+            self._requests += 1
+
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self._errors += 1
+            raise
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request('PUT', url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        return self.request('PATCH', url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request('DELETE', url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        return self.request('HEAD', url, **kwargs)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get request and connection reuse counters for this session"""
+        connections_opened = 0
+        pool_requests = 0
+
+        try:
+            pools = self.adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                connections_opened += getattr(pool, 'num_connections', 0)
+                pool_requests += getattr(pool, 'num_requests', 0)
+        except Exception as e:
+            logger.debug(f"Could not read pool stats for '{self.name}': {e}")
+
+        with self._lock:
+            total_requests = self._requests
+            errors = self._errors
+
+        reused = max(0, pool_requests - connections_opened)
+
+        return {
+            'name': self.name,
+            'pool_size': self.pool_size,
+            'requests': total_requests,
+            'errors': errors,
+            'connections_opened': connections_opened,
+            'connections_reused': reused,
+            'reuse_ratio': round(reused / pool_requests, 3) if pool_requests else 0.0
+        }
+
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
+
+_sessions: Dict[str, PooledSession] = {}
+_sessions_lock = Lock()
+
+def get_http_session(name: str = 'default', pool_size: Optional[int] = None,
+                     connect_timeout: Optional[float] = None,
+                     read_timeout: Optional[float] = None) -> PooledSession:
+    """
+    Get (or lazily create) the shared pooled session for a given name
+
+    Defaults come from HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT and HTTP_READ_TIMEOUT.
+    Arguments only apply on first creation of the named session.
+    """
+    session = _sessions.get(name)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = PooledSession(
+                name,
+                pool_size=pool_size or int(os.getenv('HTTP_POOL_SIZE', '20')),
+                connect_timeout=connect_timeout or float(os.getenv('HTTP_CONNECT_TIMEOUT', '5')),
+                read_timeout=read_timeout or float(os.getenv('HTTP_READ_TIMEOUT', '30'))
+            )
+            _sessions[name] = session
+        return session
+
+def get_pool_metrics() -> Dict[str, Dict[str, Any]]:
+    """Get metrics for every shared session created so far"""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+    return {session.name: session.get_metrics() for session in sessions}
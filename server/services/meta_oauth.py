@@ -5,11 +5,15 @@ Handles OAuth flows for Threads API authentication
 """
 
 import os
+import time
 import logging
 import requests
 from typing import Optional, Dict, Any
 from datetime import datetime, timedelta
 from urllib.parse import urlencode
+from services.meta_quota import meta_quota
+from services.ttl_cache import MISSING
+from services.token_validation import token_validation_cache
 
 logger = logging.getLogger(__name__)
 
@@ -80,6 +84,7 @@ class MetaOAuthService:
             }
             
             response = requests.post(token_url, data=token_data)
+            meta_quota.record_response(response, account_id)
             
             if not response.ok:
                 logger.error(f"❌ Token exchange failed: {response.status_code} - {response.text}")
@@ -115,8 +120,8 @@ class MetaOAuthService:
             logger.error(f"❌ Error exchanging code for tokens: {e}")
             raise
     
-    def _get_token_details(self, access_token: str) -> Dict[str, Any]:
-        """Get details about the access token"""
+    def _debug_token(self, access_token: str) -> Optional[Dict[str, Any]]:
+        """Call debug_token and cache the result; None if Meta could not be reached"""
         try:
             url = f"{self.graph_api_base}debug_token"
             params = {
@@ -125,27 +130,56 @@ class MetaOAuthService:
             }
             
             response = requests.get(url, params=params)
+            meta_quota.record_response(response)
             
             if not response.ok:
                 logger.error(f"❌ Token debug failed: {response.status_code} - {response.text}")
-                return {}
+                if 400 <= response.status_code < 500 and response.status_code != 429:
+                    token_validation_cache.put(access_token, False)
+                return None
             
             data = response.json().get('data', {})
+            expires_at = data.get('expires_at') or None
+            valid = data.get('is_valid', True) and (not expires_at or expires_at > time.time())
             
-            return {
+            details = {
                 'user_id': data.get('user_id'),
                 'app_id': data.get('app_id'),
                 'scopes': data.get('scopes', []),
-                'expires_at': data.get('expires_at'),
+                'expires_at': expires_at,
                 'issued_at': data.get('issued_at'),
             }
+            token_validation_cache.put(access_token, valid, **details)
+            return {'valid': valid, **details}
             
         except Exception as e:
             logger.error(f"❌ Error getting token details: {e}")
+            return None
+    
+    def _get_token_details(self, access_token: str) -> Dict[str, Any]:
+        """Get details about the access token (cached per token)"""
+        cached = token_validation_cache.get(access_token)
+        if cached is MISSING or cached.get('scopes') is None:
+            cached = self._debug_token(access_token)
+        if not cached:
             return {}
+        
+        return {
+            'user_id': cached.get('user_id'),
+            'app_id': cached.get('app_id'),
+            'scopes': cached.get('scopes') or [],
+            'expires_at': cached.get('expires_at'),
+            'issued_at': cached.get('issued_at'),
+        }
     
-    def refresh_access_token(self, refresh_token: str, account_id: int) -> Dict[str, Any]:
-        """Refresh an access token using refresh token"""
+    def refresh_access_token(self, refresh_token: str, account_id: int,
+                             previous_access_token: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Refresh an access token using refresh token
+        
+        previous_access_token (the token being replaced) lets the new token
+        reuse its cached debug info instead of another debug_token call.
+        """
         try:
             logger.info(f"🔄 Refreshing token for account {account_id}")
             
@@ -158,6 +192,7 @@ class MetaOAuthService:
             }
             
             response = requests.post(token_url, data=token_data)
+            meta_quota.record_response(response, account_id)
             
             if not response.ok:
                 logger.error(f"❌ Token refresh failed: {response.status_code} - {response.text}")
@@ -170,13 +205,22 @@ class MetaOAuthService:
                 logger.error("❌ No access token in refresh response")
                 raise Exception("No access token received from refresh")
             
-            # Get token details
-            token_details = self._get_token_details(access_token)
-            
             # Calculate expiration
             expires_in = token_info.get('expires_in', 0)
             expires_at = datetime.now() + timedelta(seconds=expires_in) if expires_in > 0 else None
             
+            # A refresh keeps the user, app and scopes of the old token; reuse its
+            # cached debug info (the cache is keyed by access token) instead of
+            # querying debug_token again
+            previous = token_validation_cache.get(previous_access_token) if previous_access_token else MISSING
+            if previous is not MISSING and previous.get('valid') and previous.get('scopes') is not None:
+                token_details = {key: previous.get(key) for key in ('user_id', 'app_id', 'scopes', 'issued_at')}
+                token_validation_cache.put(access_token, True,
+                                           expires_at=expires_at.timestamp() if expires_at else None,
+                                           **token_details)
+            else:
+                token_details = self._get_token_details(access_token)
+            
             result = {
                 'access_token': access_token,
                 'refresh_token': token_info.get('refresh_token', refresh_token),  # Keep old refresh token if new one not provided
@@ -194,32 +238,13 @@ class MetaOAuthService:
             raise
     
     def validate_token(self, access_token: str) -> bool:
-        """Validate if an access token is still valid"""
-        try:
-            url = f"{self.graph_api_base}debug_token"
-            params = {
-                'input_token': access_token,
-                'access_token': f"{self.app_id}|{self.app_secret}",
-            }
-            
-            response = requests.get(url, params=params)
-            
-            if not response.ok:
-                return False
-            
-            data = response.json().get('data', {})
-            expires_at = data.get('expires_at')
-            
-            if expires_at:
-                # Check if token is expired
-                expiration_time = datetime.fromtimestamp(expires_at)
-                return datetime.now() < expiration_time
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Error validating token: {e}")
-            return False
+        """Validate if an access token is still valid (cached; invalid results only briefly)"""
+        cached = token_validation_cache.get(access_token)
+        if cached is not MISSING:
+            return cached['valid']
+        
+        result = self._debug_token(access_token)
+        return bool(result and result['valid'])
 
 # Global instance
 meta_oauth_service = MetaOAuthService()
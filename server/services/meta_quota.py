@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Meta Quota Tracker
+Tracks Graph API usage from Meta's usage response headers so callers can
+slow down or skip work before requests start failing with rate limit errors
+"""
+
+import os
+import json
+import time
+import logging
+from threading import Lock
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Graph error codes that mean "throttled": 4 = app limit, 17/32/613 = user/page/call limits
+APP_THROTTLE_CODES = {4}
+ACCOUNT_THROTTLE_CODES = {17, 32, 613}
+
+def _max_usage(usage: Dict[str, Any]) -> float:
+    """Highest of the percentage counters in a usage object"""
+    values = [usage.get(field) for field in ('call_count', 'total_cputime', 'total_time', 'acc_id_util_pct')]
+    return max([float(v) for v in values if isinstance(v, (int, float))] or [0.0])
+
+class MetaQuotaTracker:
+    """Per-app and per-account Graph API usage, fed from every response"""
+
+    def __init__(self):
+        self.slow_threshold = float(os.getenv('META_USAGE_SLOW_PCT', '75'))
+        self.stop_threshold = float(os.getenv('META_USAGE_STOP_PCT', '95'))
+        self.cooldown_seconds = int(os.getenv('META_USAGE_COOLDOWN_SECONDS', '300'))
+        # Meta reports usage over a rolling hour; readings older than this are ignored
+        self.usage_ttl_seconds = int(os.getenv('META_USAGE_TTL_SECONDS', '900'))
+
+        self.lock = Lock()
+        self.app: Dict[str, float] = {'usage': 0.0, 'updated_at': 0.0, 'blocked_until': 0.0}
+        self.accounts: Dict[str, Dict[str, float]] = {}
+
+        logger.info(f"📈 MetaQuotaTracker initialized (slow at {self.slow_threshold}%, stop at {self.stop_threshold}%)")
+
+    def _account(self, account_id: Any) -> Dict[str, float]:
+        return self.accounts.setdefault(str(account_id), {'usage': 0.0, 'updated_at': 0.0, 'blocked_until': 0.0})
+
+    def record_response(self, response, account_id: Optional[Any] = None):
+        """Update usage from a Graph API response's headers (and throttle errors)"""
+        try:
+            headers = response.headers
+            now = time.time()
+
+            app_usage = headers.get('X-App-Usage')
+            if app_usage:
+                usage = _max_usage(json.loads(app_usage))
+                with self.lock:
+                    self.app['usage'] = usage
+                    self.app['updated_at'] = now
+
+            buc_usage = headers.get('X-Business-Use-Case-Usage')
+            if buc_usage and account_id is not None:
+                entries = [entry for group in json.loads(buc_usage).values() for entry in group]
+                if entries:
+                    usage = max(_max_usage(entry) for entry in entries)
+                    regain_minutes = max(entry.get('estimated_time_to_regain_access') or 0 for entry in entries)
+                    with self.lock:
+                        state = self._account(account_id)
+                        state['usage'] = usage
+                        state['updated_at'] = now
+                        if regain_minutes:
+                            state['blocked_until'] = max(state['blocked_until'], now + regain_minutes * 60)
+
+            if response.status_code == 429 or not response.ok:
+                self._record_error(response, account_id)
+
+        except Exception as e:
+            logger.debug(f"Could not parse Meta usage headers: {e}")
+
+    def _record_error(self, response, account_id: Optional[Any]):
+        code = None
+        try:
+            code = response.json().get('error', {}).get('code')
+        except Exception:
+            pass
+
+        if response.status_code != 429 and code not in APP_THROTTLE_CODES | ACCOUNT_THROTTLE_CODES:
+            return
+
+        retry_after = response.headers.get('Retry-After')
+        seconds = int(retry_after) if retry_after and retry_after.isdigit() else None
+        self.record_throttle(account_id, seconds, app_wide=code in APP_THROTTLE_CODES or account_id is None)
+
+    def record_throttle(self, account_id: Optional[Any] = None, retry_after_seconds: Optional[int] = None,
+                        app_wide: bool = False):
+        """Mark the app or an account as throttled for retry_after_seconds (default cooldown)"""
+        until = time.time() + (retry_after_seconds or self.cooldown_seconds)
+
+        with self.lock:
+            state = self.app if app_wide else self._account(account_id)
+            state['blocked_until'] = max(state['blocked_until'], until)
+
+        target = 'app' if app_wide else f"account {account_id}"
+        logger.warning(f"🐢 Meta API throttled for {target} until {time.strftime('%H:%M:%S', time.localtime(until))}")
+
+    def _fresh_usage(self, state: Dict[str, float], now: float) -> float:
+        return state['usage'] if now - state['updated_at'] <= self.usage_ttl_seconds else 0.0
+
+    def app_usage(self) -> float:
+        """Latest app-wide usage percentage (0 when stale or unknown)"""
+        with self.lock:
+            return self._fresh_usage(self.app, time.time())
+
+    def account_usage(self, account_id: Any) -> float:
+        """Latest usage percentage for one account (0 when stale or unknown)"""
+        with self.lock:
+            state = self.accounts.get(str(account_id))
+            return self._fresh_usage(state, time.time()) if state else 0.0
+
+    def remaining_budget(self, account_id: Optional[Any] = None) -> float:
+        """Percentage of quota left for the app, or for an account within the app"""
+        usage = self.app_usage()
+        if account_id is not None:
+            usage = max(usage, self.account_usage(account_id))
+        return max(0.0, 100.0 - usage)
+
+    def defer_seconds(self, account_id: Any) -> int:
+        """Seconds an account should wait before its next Graph call (0 = go ahead)"""
+        now = time.time()
+        with self.lock:
+            blocked_until = self.app['blocked_until']
+            state = self.accounts.get(str(account_id))
+            if state:
+                blocked_until = max(blocked_until, state['blocked_until'])
+            usage = self._fresh_usage(self.app, now)
+            if state:
+                usage = max(usage, self._fresh_usage(state, now))
+
+        if blocked_until > now:
+            return int(blocked_until - now) + 1
+        if usage >= self.stop_threshold:
+            return self.cooldown_seconds
+        return 0
+
+    def pace_limit(self, count: int) -> int:
+        """
+        How many of `count` Graph-bound jobs to run now
+
+        Full speed below the slow threshold, tapering linearly to one job at
+        the stop threshold, so the app's hourly budget is spread out instead
+        of being exhausted early and answered with 429s.
+        """
+        usage = self.app_usage()
+        if count <= 0 or usage < self.slow_threshold:
+            return count
+        if usage >= self.stop_threshold:
+            return 1
+
+        headroom = (self.stop_threshold - usage) / (self.stop_threshold - self.slow_threshold)
+        return max(1, int(count * headroom))
+
+    def get_status(self) -> Dict[str, Any]:
+        """Snapshot of tracked usage for health/status endpoints"""
+        now = time.time()
+        with self.lock:
+            throttled = [
+                account_id for account_id, state in self.accounts.items()
+                if state['blocked_until'] > now
+            ]
+            return {
+                'app_usage_pct': self._fresh_usage(self.app, now),
+                'app_throttled': self.app['blocked_until'] > now,
+                'tracked_accounts': len(self.accounts),
+                'throttled_accounts': throttled
+            }
+
+# Global quota tracker instance
+meta_quota = MetaQuotaTracker()
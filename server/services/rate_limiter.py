@@ -1,20 +1,155 @@
 #!/usr/bin/env python3
 """
 Simple in-memory rate limiter
-Tracks request counts per account/IP with time-based windows
+Tracks request counts per account/IP with pluggable limiting engines:
+- sliding_log: original exact sliding window over stored timestamps (default)
+- gcra: generic cell rate algorithm, one float per key (opt-in)
+- token_bucket: classic token bucket, constant memory per key
+- sqlite: GCRA in a SQLite file shared by all worker processes on one host
+- postgres: GCRA in Supabase via the rate_limit_reserve/rate_limit_check RPCs, shared by all instances
 """
 
+import os
+import math
 import time
+import heapq
+import sqlite3
 import logging
-from typing import Dict, Tuple
+import tempfile
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
 from threading import Lock
 
 logger = logging.getLogger(__name__)
 
-class RateLimiter:
+# Expired keys dropped opportunistically by each check (keeps expiry incremental)
+EXPIRE_PER_CHECK = 2
+# Expired keys dropped per lock hold during cleanup_old_entries
+EXPIRE_BATCH_SIZE = 256
+# Shared engines reserve at most max_requests / RESERVE_MIN_RATIO requests per round trip
+RESERVE_MIN_RATIO = 10
+
+def gcra_remaining(tat: Optional[float], now: float, max_requests: int, window_seconds: float) -> int:
+    """Requests still allowed right now for a key with theoretical arrival time tat"""
+    interval = window_seconds / max_requests
+    used = max(0.0, (tat if tat is not None else now) - now)
+    return max(0, min(max_requests, math.floor((window_seconds - used) / interval + 1e-9)))
+
+def gcra_check(tat: Optional[float], now: float, max_requests: int,
+               window_seconds: float) -> Tuple[bool, int, float, float]:
+    """
+    One GCRA step: returns (allowed, remaining, new_tat, retry_after_seconds)
+    
+    new_tat is what the key's TAT becomes if the request is consumed.
+    """
+    interval = window_seconds / max_requests
+    new_tat = max(tat if tat is not None else now, now) + interval
+    over = (new_tat - now) - window_seconds
+    
+    if over > 1e-9:
+        return False, 0, new_tat, over
+    return True, gcra_remaining(new_tat, now, max_requests, window_seconds), new_tat, 0.0
+
+def gcra_reserve(tat: Optional[float], now: float, max_requests: int, window_seconds: float,
+                 count: int) -> Tuple[int, int, float, float]:
+    """
+    Consume up to `count` requests in one GCRA step: returns (granted, remaining, new_tat, retry_after)
+    
+    Grants as many as fit right now; granted is 0 (with retry_after) when none do.
+    """
+    granted = min(count, gcra_remaining(tat, now, max_requests, window_seconds))
+    if granted < 1:
+        _, _, _, retry_after = gcra_check(tat, now, max_requests, window_seconds)
+        return 0, 0, tat if tat is not None else now, retry_after
+    
+    new_tat = max(tat if tat is not None else now, now) + granted * window_seconds / max_requests
+    return granted, gcra_remaining(new_tat, now, max_requests, window_seconds), new_tat, 0.0
+
+class ExpiringEngine:
+    """
+    Base for limiter engines: one lock plus a min-heap of (expires_at, key)
+    
+    A key is pushed when created; when its heap entry comes due the key is
+    either dropped (state equals a fresh key) or re-pushed at its current
+    expiry, so the heap holds about one entry per live key and expiry work
+    is spread across checks instead of a stop-the-world sweep.
+    """
+    
+    name = 'base'
+    
     def __init__(self):
-        self.requests: Dict[str, list] = {}
         self.lock = Lock()
+        self.expiry_heap: List[Tuple[float, str]] = []
+    
+    def _expires_at(self, key: str) -> Optional[float]:
+        """When the key's state becomes equivalent to a fresh key (None if absent)"""
+        raise NotImplementedError
+    
+    def _drop(self, key: str):
+        raise NotImplementedError
+    
+    def _track(self, key: str, expires_at: float):
+        heapq.heappush(self.expiry_heap, (expires_at, key))
+    
+    def _expire(self, now: float, limit: int) -> int:
+        """Pop up to `limit` due heap entries; caller holds the lock"""
+        removed = 0
+        heap = self.expiry_heap
+        
+        for _ in range(limit):
+            if not heap or heap[0][0] > now:
+                break
+            
+            _, key = heapq.heappop(heap)
+            expires_at = self._expires_at(key)
+            if expires_at is None:
+                continue  # reset or already dropped
+            if expires_at <= now:
+                self._drop(key)
+                removed += 1
+            else:
+                heapq.heappush(heap, (expires_at, key))
+        
+        return removed
+    
+    def tracked_keys(self) -> int:
+        """Approximate number of live keys (heap entries)"""
+        with self.lock:
+            return len(self.expiry_heap)
+    
+    def cleanup_old_entries(self) -> int:
+        """
+        Drop expired keys in small batches, releasing the lock between batches
+        
+        A key expires once its state equals a fresh key's, so there is no
+        separate max-age: dropping it any earlier would forget a live limit.
+        """
+        removed = 0
+        while True:
+            with self.lock:
+                batch = self._expire(time.time(), EXPIRE_BATCH_SIZE)
+                done = not self.expiry_heap or self.expiry_heap[0][0] > time.time()
+            removed += batch
+            if done:
+                return removed
+
+class SlidingLogEngine(ExpiringEngine):
+    """Exact sliding window that stores every request timestamp (O(n) per check)"""
+    
+    name = 'sliding_log'
+    
+    def __init__(self):
+        super().__init__()
+        self.requests: Dict[str, list] = {}
+        self.expires: Dict[str, float] = {}
+    
+    def _expires_at(self, key: str) -> Optional[float]:
+        return self.expires.get(key)
+    
+    def _drop(self, key: str):
+        self.requests.pop(key, None)
+        self.expires.pop(key, None)
     
     def is_allowed(self, key: str, max_requests: int, window_seconds: int) -> Tuple[bool, int]:
         """
@@ -23,11 +158,13 @@ class RateLimiter:
         """
         with self.lock:
             now = time.time()
+            self._expire(now, EXPIRE_PER_CHECK)
             window_start = now - window_seconds
             
             # Initialize or get existing requests for this key
             if key not in self.requests:
                 self.requests[key] = []
+                self._track(key, now + window_seconds)
             
             # Remove old requests outside the window
             self.requests[key] = [
@@ -43,6 +180,7 @@ class RateLimiter:
             else:
                 # Add current request
                 self.requests[key].append(now)
+                self.expires[key] = now + window_seconds
                 remaining = max_requests - current_count - 1
                 allowed = True
             
@@ -68,33 +206,436 @@ class RateLimiter:
     def reset_key(self, key: str):
         """Reset rate limit for a specific key"""
         with self.lock:
-            if key in self.requests:
-                del self.requests[key]
+            self._drop(key)
+
+class TokenBucketEngine(ExpiringEngine):
+    """
+    Token bucket with capacity max_requests refilled at max_requests/window_seconds
+    
+    Each key holds [tokens, updated_at, full_at], so memory and time per check are constant.
+    """
+    
+    name = 'token_bucket'
+    
+    def __init__(self):
+        super().__init__()
+        self.buckets: Dict[str, List[float]] = {}
     
-    def cleanup_old_entries(self, max_age_seconds: int = 3600):
-        """Clean up old entries to prevent memory leaks"""
+    def _expires_at(self, key: str) -> Optional[float]:
+        bucket = self.buckets.get(key)
+        return bucket[2] if bucket else None
+    
+    def _drop(self, key: str):
+        self.buckets.pop(key, None)
+    
+    def _refill(self, key: str, max_requests: int, window_seconds: int, now: float) -> List[float]:
+        rate = max_requests / window_seconds
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = [float(max_requests), now, now]
+            self.buckets[key] = bucket
+        else:
+            bucket[0] = min(float(max_requests), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        return bucket
+    
+    def is_allowed(self, key: str, max_requests: int, window_seconds: int) -> Tuple[bool, int]:
+        """
+        Check if request is allowed for given key
+        Returns (allowed, remaining_requests)
+        """
         with self.lock:
             now = time.time()
-            cutoff = now - max_age_seconds
+            self._expire(now, EXPIRE_PER_CHECK)
+            is_new = key not in self.buckets
+            bucket = self._refill(key, max_requests, window_seconds, now)
             
-            keys_to_remove = []
-            for key, request_times in self.requests.items():
-                # Keep only recent requests
-                recent_requests = [
-                    req_time for req_time in request_times 
-                    if req_time > cutoff
-                ]
-                
-                if recent_requests:
-                    self.requests[key] = recent_requests
-                else:
-                    keys_to_remove.append(key)
+            if bucket[0] < 1.0:
+                return False, 0
             
-            # Remove empty entries
-            for key in keys_to_remove:
-                del self.requests[key]
+            bucket[0] -= 1.0
+            bucket[2] = now + (max_requests - bucket[0]) * window_seconds / max_requests
+            if is_new:
+                self._track(key, bucket[2])
+            return True, int(bucket[0])
+    
+    def get_remaining(self, key: str, max_requests: int, window_seconds: int) -> int:
+        """Get remaining requests without consuming one"""
+        with self.lock:
+            if key not in self.buckets:
+                return max_requests
+            bucket = self._refill(key, max_requests, window_seconds, time.time())
+            return int(bucket[0])
+    
+    def reset_key(self, key: str):
+        """Reset rate limit for a specific key"""
+        with self.lock:
+            self._drop(key)
+
+class GCRAEngine(ExpiringEngine):
+    """
+    Generic cell rate algorithm: allows bursts of max_requests, then one
+    request every window_seconds/max_requests
+    
+    Each key stores only its theoretical arrival time (TAT).
+    """
+    
+    name = 'gcra'
+    
+    def __init__(self):
+        super().__init__()
+        self.tats: Dict[str, float] = {}
+    
+    def _expires_at(self, key: str) -> Optional[float]:
+        return self.tats.get(key)
+    
+    def _drop(self, key: str):
+        self.tats.pop(key, None)
+    
+    def is_allowed(self, key: str, max_requests: int, window_seconds: int) -> Tuple[bool, int]:
+        """
+        Check if request is allowed for given key
+        Returns (allowed, remaining_requests)
+        """
+        with self.lock:
+            now = time.time()
+            self._expire(now, EXPIRE_PER_CHECK)
+            tat = self.tats.get(key)
+            allowed, remaining, new_tat, _ = gcra_check(tat, now, max_requests, window_seconds)
+            
+            if not allowed:
+                return False, 0
             
-            logger.info(f"🧹 Rate limiter cleanup: removed {len(keys_to_remove)} old entries")
+            self.tats[key] = new_tat
+            if tat is None:
+                self._track(key, new_tat)
+            return True, remaining
+    
+    def get_remaining(self, key: str, max_requests: int, window_seconds: int) -> int:
+        """Get remaining requests without consuming one"""
+        with self.lock:
+            tat = self.tats.get(key)
+            if tat is None:
+                return max_requests
+            return gcra_remaining(tat, time.time(), max_requests, window_seconds)
+    
+    def reset_key(self, key: str):
+        """Reset rate limit for a specific key"""
+        with self.lock:
+            self._drop(key)
+
+class SharedBackendEngine:
+    """
+    Base for limiter engines whose GCRA state lives outside the process
+    
+    A check that reaches the store costs one round trip (a SQLite write
+    transaction or a Postgres RPC). To cut that, each store call reserves
+    up to RATE_LIMITER_SHARED_RESERVE requests at once and hands the extra
+    ones out locally; a lease lasts as long as its requests take at the
+    sustained rate, so a process can run at most reserve-1 requests ahead
+    of the shared limit. A key reserves at most max_requests /
+    RESERVE_MIN_RATIO at a time, so small limits (under 20 requests, e.g.
+    3/hour) stay exact and cost one round trip per allowed call. Denials are remembered locally
+    until their retry-after passes (other processes can only tighten a
+    limit, never loosen it), so a throttled key stops hitting the store.
+    If the store fails, checks fall back to a local GCRA engine rather
+    than failing the request.
+    """
+    
+    name = 'shared'
+    
+    def __init__(self):
+        self.lock = Lock()
+        self.blocked_until: Dict[str, float] = {}
+        # key -> [requests left, lease expires_at, store remaining when reserved]
+        self.leases: Dict[str, List[float]] = {}
+        self.reserve = max(1, int(os.getenv('RATE_LIMITER_SHARED_RESERVE', '5')))
+        self.fallback = GCRAEngine()
+    
+    def _peek(self, key: str, max_requests: int, window_seconds: int) -> int:
+        """Remaining requests in the shared store, without consuming one"""
+        raise NotImplementedError
+    
+    def _reserve(self, key: str, max_requests: int, window_seconds: int,
+                 count: int) -> Tuple[int, int, float]:
+        """Consume up to `count` requests in the shared store: (granted, remaining, retry_after)"""
+        raise NotImplementedError
+    
+    def _delete(self, key: Optional[str] = None) -> int:
+        """Delete one key, or every expired key when key is None"""
+        raise NotImplementedError
+    
+    def _reserve_count(self, max_requests: int) -> int:
+        return max(1, min(self.reserve, max_requests // RESERVE_MIN_RATIO))
+    
+    def is_allowed(self, key: str, max_requests: int, window_seconds: int) -> Tuple[bool, int]:
+        """
+        Check if request is allowed for given key
+        Returns (allowed, remaining_requests)
+        """
+        now = time.time()
+        with self.lock:
+            if self.blocked_until.get(key, 0) > now:
+                return False, 0
+            lease = self.leases.get(key)
+            if lease is not None:
+                if lease[0] >= 1 and lease[1] > now:
+                    lease[0] -= 1
+                    return True, int(lease[2] + lease[0])
+                del self.leases[key]
+        
+        count = self._reserve_count(max_requests)
+        try:
+            granted, remaining, retry_after = self._reserve(key, max_requests, window_seconds, count)
+        except Exception as e:
+            logger.warning(f"⚠️ Shared rate limiter ({self.name}) unavailable, using local limits: {e}")
+            return self.fallback.is_allowed(key, max_requests, window_seconds)
+        
+        if granted < 1:
+            if retry_after > 0:
+                with self.lock:
+                    self.blocked_until[key] = now + retry_after
+            return False, 0
+        
+        if granted > 1:
+            with self.lock:
+                self.leases[key] = [granted - 1, now + granted * window_seconds / max_requests, remaining]
+        return True, remaining + granted - 1
+    
+    def get_remaining(self, key: str, max_requests: int, window_seconds: int) -> int:
+        """Get remaining requests without consuming one"""
+        now = time.time()
+        with self.lock:
+            if self.blocked_until.get(key, 0) > now:
+                return 0
+            lease = self.leases.get(key)
+            leased = int(lease[0]) if lease is not None and lease[1] > now else 0
+        
+        try:
+            return min(max_requests, self._peek(key, max_requests, window_seconds) + leased)
+        except Exception as e:
+            logger.warning(f"⚠️ Shared rate limiter ({self.name}) unavailable, using local limits: {e}")
+            return self.fallback.get_remaining(key, max_requests, window_seconds)
+    
+    def reset_key(self, key: str):
+        """Reset rate limit for a specific key"""
+        with self.lock:
+            self.blocked_until.pop(key, None)
+            self.leases.pop(key, None)
+        self.fallback.reset_key(key)
+        
+        try:
+            self._delete(key)
+        except Exception as e:
+            logger.error(f"❌ Error resetting shared rate limit for {key}: {e}")
+    
+    def cleanup_old_entries(self) -> int:
+        """Drop expired keys from the shared store and local caches"""
+        now = time.time()
+        with self.lock:
+            for key in [k for k, until in self.blocked_until.items() if until <= now]:
+                del self.blocked_until[key]
+            for key in [k for k, lease in self.leases.items() if lease[1] <= now]:
+                del self.leases[key]
+        removed = self.fallback.cleanup_old_entries()
+        
+        try:
+            removed += self._delete()
+        except Exception as e:
+            logger.error(f"❌ Error cleaning up shared rate limits: {e}")
+        return removed
+    
+    def tracked_keys(self) -> int:
+        """Keys held locally (blocked keys, leases and fallback state)"""
+        with self.lock:
+            held = len(self.blocked_until) + len(self.leases)
+        return held + self.fallback.tracked_keys()
+
+class SQLiteEngine(SharedBackendEngine):
+    """GCRA state in a local SQLite file, shared by every worker process on the host"""
+    
+    name = 'sqlite'
+    
+    def __init__(self, path: str = None):
+        super().__init__()
+        self.path = path or os.getenv(
+            'RATE_LIMITER_SQLITE_PATH',
+            os.path.join(tempfile.gettempdir(), 'threads_bot_rate_limits.db')
+        )
+        self.local = threading.local()
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS rate_limits (limit_key TEXT PRIMARY KEY, tat REAL NOT NULL)'
+        )
+    
+    def _connection(self) -> sqlite3.Connection:
+        """One autocommit connection per thread"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+    
+    def _peek(self, key: str, max_requests: int, window_seconds: int) -> int:
+        row = self._connection().execute('SELECT tat FROM rate_limits WHERE limit_key = ?', (key,)).fetchone()
+        return gcra_remaining(row[0] if row else None, time.time(), max_requests, window_seconds)
+    
+    def _reserve(self, key: str, max_requests: int, window_seconds: int,
+                 count: int) -> Tuple[int, int, float]:
+        conn = self._connection()
+        now = time.time()
+        
+        # BEGIN IMMEDIATE takes the write lock up front so read-modify-write is atomic across processes
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tat FROM rate_limits WHERE limit_key = ?', (key,)).fetchone()
+            granted, remaining, new_tat, retry_after = gcra_reserve(
+                row[0] if row else None, now, max_requests, window_seconds, count
+            )
+            if granted:
+                conn.execute(
+                    'INSERT INTO rate_limits (limit_key, tat) VALUES (?, ?) '
+                    'ON CONFLICT(limit_key) DO UPDATE SET tat = excluded.tat',
+                    (key, new_tat)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        
+        return granted, remaining, retry_after
+    
+    def _delete(self, key: Optional[str] = None) -> int:
+        conn = self._connection()
+        if key is not None:
+            return conn.execute('DELETE FROM rate_limits WHERE limit_key = ?', (key,)).rowcount
+        return conn.execute('DELETE FROM rate_limits WHERE tat <= ?', (time.time(),)).rowcount
+
+class PostgresEngine(SharedBackendEngine):
+    """GCRA state in Supabase Postgres via the rate_limit_reserve/rate_limit_check RPCs"""
+    
+    name = 'postgres'
+    
+    def _rpc(self, function: str, payload: Dict) -> Optional[Dict]:
+        """First row of a rate limit RPC (None if the function is not deployed)"""
+        from database import get_db
+        db = get_db()
+        
+        response = db._make_request('POST', f"{db.supabase_url}/rest/v1/rpc/{function}", json=payload)
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise RuntimeError(f"{function} RPC returned {response.status_code}: {response.text}")
+        
+        rows = response.json()
+        return rows[0] if isinstance(rows, list) else rows
+    
+    def _peek(self, key: str, max_requests: int, window_seconds: int) -> int:
+        row = self._rpc('rate_limit_check', {
+            'p_key': key,
+            'p_max_requests': max_requests,
+            'p_window_seconds': window_seconds,
+            'p_consume': False
+        })
+        if row is None:
+            raise RuntimeError("rate_limit_check RPC not found")
+        return int(row['remaining'])
+    
+    def _reserve(self, key: str, max_requests: int, window_seconds: int,
+                 count: int) -> Tuple[int, int, float]:
+        payload = {'p_key': key, 'p_max_requests': max_requests, 'p_window_seconds': window_seconds}
+        
+        if count > 1:
+            row = self._rpc('rate_limit_reserve', {**payload, 'p_count': count})
+            if row is not None:
+                return int(row['granted']), int(row['remaining']), float(row.get('retry_after') or 0)
+        
+        # One request at a time (also used until migration 014 is applied)
+        row = self._rpc('rate_limit_check', {**payload, 'p_consume': True})
+        if row is None:
+            raise RuntimeError("rate_limit_check RPC not found")
+        return (1 if row['allowed'] else 0), int(row['remaining']), float(row.get('retry_after') or 0)
+    
+    def _delete(self, key: Optional[str] = None) -> int:
+        from database import get_db
+        db = get_db()
+        
+        if key is not None:
+            params = {'limit_key': f'eq.{key}'}
+        else:
+            params = {'tat': f'lte.{datetime.now(timezone.utc).isoformat()}'}
+        
+        response = db._make_request(
+            'DELETE',
+            f"{db.supabase_url}/rest/v1/rate_limits",
+            params=params
+        )
+        if response.status_code not in [200, 204]:
+            raise RuntimeError(f"rate_limits delete returned {response.status_code}: {response.text}")
+        return len(response.json()) if response.status_code == 200 and response.text else 0
+
+ENGINES = {
+    SlidingLogEngine.name: SlidingLogEngine,
+    TokenBucketEngine.name: TokenBucketEngine,
+    GCRAEngine.name: GCRAEngine,
+}
+
+# Engines whose state is shared across processes; sharding them locally would not help
+SHARED_ENGINES = {
+    SQLiteEngine.name: SQLiteEngine,
+    PostgresEngine.name: PostgresEngine,
+}
+
+class RateLimiter:
+    """
+    Rate limiter facade; the engine comes from RATE_LIMITER_ENGINE unless given
+    
+    Keys are spread over RATE_LIMITER_SHARDS independently locked engine
+    instances, so checks on different keys rarely contend and cleanup only
+    ever holds one shard's lock for one small batch.
+    """
+    
+    def __init__(self, engine: str = None, shards: int = None):
+        engine_name = engine or os.getenv('RATE_LIMITER_ENGINE', 'sliding_log')
+        if engine_name not in ENGINES and engine_name not in SHARED_ENGINES:
+            logger.warning(f"⚠️ Unknown rate limiter engine '{engine_name}', using sliding_log")
+            engine_name = SlidingLogEngine.name
+        
+        if engine_name in SHARED_ENGINES:
+            shard_count = 1
+            self.shards = [SHARED_ENGINES[engine_name]()]
+        else:
+            shard_count = max(1, shards or int(os.getenv('RATE_LIMITER_SHARDS', '16')))
+            self.shards = [ENGINES[engine_name]() for _ in range(shard_count)]
+        logger.info(f"🚦 Rate limiter using '{engine_name}' engine across {shard_count} shards")
+    
+    def _shard(self, key: str):
+        return self.shards[hash(key) % len(self.shards)]
+    
+    def is_allowed(self, key: str, max_requests: int, window_seconds: int) -> Tuple[bool, int]:
+        """
+        Check if request is allowed for given key
+        Returns (allowed, remaining_requests)
+        """
+        return self._shard(key).is_allowed(key, max_requests, window_seconds)
+    
+    def get_remaining(self, key: str, max_requests: int, window_seconds: int) -> int:
+        """Get remaining requests without consuming one"""
+        return self._shard(key).get_remaining(key, max_requests, window_seconds)
+    
+    def reset_key(self, key: str):
+        """Reset rate limit for a specific key"""
+        self._shard(key).reset_key(key)
+    
+    def cleanup_old_entries(self):
+        """Clean up expired entries to prevent memory leaks (one shard and batch at a time)"""
+        removed = sum(shard.cleanup_old_entries() for shard in self.shards)
+        logger.info(f"🧹 Rate limiter cleanup: removed {removed} old entries")
+    
+    def tracked_keys(self) -> int:
+        """Approximate number of keys held across all shards"""
+        return sum(shard.tracked_keys() for shard in self.shards)
 
 # Global rate limiter instance
 rate_limiter = RateLimiter()
@@ -5,13 +5,22 @@ Handles session storage and retrieval using Supabase Storage
 """
 
 import os
+import gzip
 import json
+import time
+import hashlib
 import logging
 import requests
-from typing import Optional, Dict, Any
+from threading import Lock
+from datetime import datetime
+from typing import Optional, Dict, Any, Tuple
+from services.ttl_cache import TTLCache, MISSING
 
 logger = logging.getLogger(__name__)
 
+# Version header for compressed session blobs; plain JSON blobs carry none
+SESSION_FORMAT_GZIP = b'TBSESS1:gzip\n'
+
 class SessionStore:
     def __init__(self):
         self.supabase_url = os.getenv('SUPABASE_URL')
@@ -29,6 +38,92 @@ class SessionStore:
         else:
             self.headers = {}
             logger.warning("⚠️ SessionStore initialized without Supabase credentials - session features disabled")
+        
+        # Local copies of session blobs, revalidated with ETag/Last-Modified
+        self.cache = TTLCache(
+            'sessions',
+            max_size=int(os.getenv('SESSION_CACHE_MAX_ENTRIES', '256')),
+            ttl_seconds=float(os.getenv('SESSION_CACHE_TTL_SECONDS', '86400'))
+        )
+        # Within this window a cached session is trusted without contacting Storage
+        self.fresh_seconds = float(os.getenv('SESSION_CACHE_FRESH_SECONDS', '60'))
+        # Optional on-disk copy (survives restarts, shared by workers); unset disables it
+        self.cache_dir = os.getenv('SESSION_CACHE_DIR') or None
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        
+        # How new sessions are written: 'json' (minified) or 'gzip' (versioned, compressed)
+        self.encoding = os.getenv('SESSION_ENCODING', 'json').lower()
+        if self.encoding not in ('json', 'gzip'):
+            logger.warning(f"⚠️ Unknown SESSION_ENCODING '{self.encoding}', using json")
+            self.encoding = 'json'
+        
+        # username -> {'size', 'updated_at'} from one bucket listing, refreshed on a TTL
+        self.index: Optional[Dict[str, Dict[str, Any]]] = None
+        self.index_loaded_at = 0.0
+        self.index_ttl_seconds = float(os.getenv('SESSION_INDEX_TTL_SECONDS', '60'))
+        self.index_lock = Lock()
+    
+    def _disk_path(self, username: str) -> str:
+        digest = hashlib.sha256(username.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+    
+    def _cache_get(self, username: str) -> Optional[Dict[str, Any]]:
+        """Get the cached entry for username from memory, then disk"""
+        entry = self.cache.get(username)
+        if entry is not MISSING:
+            return entry
+        
+        if not self.cache_dir:
+            return None
+        
+        try:
+            with open(self._disk_path(username), 'r') as f:
+                entry = json.load(f)
+            # Disk copies are always revalidated before first use
+            entry['checked_at'] = 0
+            self.cache.set(username, entry)
+            return entry
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug(f"Could not read cached session for {username}: {e}")
+            return None
+    
+    def _cache_put(self, username: str, data: Dict[Any, Any], etag: Optional[str] = None,
+                   last_modified: Optional[str] = None):
+        """Store a session blob locally (memory and, if enabled, disk)"""
+        entry = {
+            'data': data,
+            'etag': etag,
+            'last_modified': last_modified,
+            'checked_at': time.time()
+        }
+        self.cache.set(username, entry)
+        
+        if not self.cache_dir:
+            return
+        
+        try:
+            path = self._disk_path(username)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.debug(f"Could not write cached session for {username}: {e}")
+    
+    def _cache_drop(self, username: str):
+        """Forget the local copy of a session"""
+        self.cache.invalidate(username)
+        if self.cache_dir:
+            try:
+                os.remove(self._disk_path(username))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.debug(f"Could not remove cached session for {username}: {e}")
     
     def exists(self, username: str) -> bool:
         """Check if session exists for username"""
@@ -36,6 +131,16 @@ class SessionStore:
             logger.debug(f"🔕 Session check disabled for {username} - Supabase not configured")
             return False
             
+        # A session we hold locally and checked recently is known to exist
+        entry = self.cache.get(username)
+        if entry is not MISSING and time.time() - entry['checked_at'] < self.fresh_seconds:
+            return True
+        
+        # Answer from the bulk index (one listing serves every account)
+        index = self.get_index()
+        if index is not None:
+            return username in index
+        
         try:
             file_path = f"{username}.json"
             
@@ -58,19 +163,42 @@ class SessionStore:
             logger.debug(f"🔕 Session load disabled for {username} - Supabase not configured")
             return None
             
+        cached = self._cache_get(username)
+        if cached and time.time() - cached['checked_at'] < self.fresh_seconds:
+            logger.info(f"✅ Loaded session for {username} (cached)")
+            return cached['data']
+        
         try:
             file_path = f"{username}.json"
             
+            # Conditional GET: Storage answers 304 when our copy is still current
+            headers = dict(self.headers)
+            if cached and cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached and cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+            
             response = requests.get(
                 f"{self.supabase_url}/storage/v1/object/{self.bucket_name}/{file_path}",
-                headers=self.headers
+                headers=headers
             )
             
-            if response.status_code == 200:
-                session_data = response.json()
+            if response.status_code == 304 and cached:
+                self._cache_put(username, cached['data'], cached.get('etag'), cached.get('last_modified'))
+                logger.info(f"✅ Loaded session for {username} (revalidated)")
+                return cached['data']
+            elif response.status_code == 200:
+                session_data = self.decode_session(response.content)
+                self._cache_put(
+                    username, session_data,
+                    response.headers.get('ETag'),
+                    response.headers.get('Last-Modified')
+                )
                 logger.info(f"✅ Loaded session for {username}")
                 return session_data
             elif response.status_code == 404:
+                self._cache_drop(username)
+                self._index_drop(username)
                 logger.info(f"📂 No session found for {username}")
                 return None
             else:
@@ -81,8 +209,23 @@ class SessionStore:
             logger.error(f"❌ Error loading session for {username}: {e}")
             return None
     
+    def encode_session(self, session_data: Dict[Any, Any]) -> Tuple[bytes, str]:
+        """Serialise session data in the configured encoding; returns (body, content type)"""
+        body = json.dumps(session_data, separators=(',', ':')).encode('utf-8')
+        
+        if self.encoding == 'gzip':
+            return SESSION_FORMAT_GZIP + gzip.compress(body, compresslevel=6), 'application/octet-stream'
+        return body, 'application/json'
+    
+    @staticmethod
+    def decode_session(body: bytes) -> Dict[Any, Any]:
+        """Parse a stored session blob in any supported encoding (legacy pretty JSON included)"""
+        if body.startswith(SESSION_FORMAT_GZIP):
+            body = gzip.decompress(body[len(SESSION_FORMAT_GZIP):])
+        return json.loads(body)
+    
     def save_session(self, username: str, session_data: Dict[Any, Any]) -> bool:
-        """Save session data for username"""
+        """Save session data for username (single upsert request)"""
         if not self.configured:
             logger.warning(f"🔕 Session save disabled for {username} - Supabase not configured")
             return False
@@ -90,16 +233,17 @@ class SessionStore:
         try:
             file_path = f"{username}.json"
             
-            # Convert session data to JSON
-            session_json = json.dumps(session_data, indent=2)
+            session_body, content_type = self.encode_session(session_data)
             
             # Upload to Supabase Storage
             files = {
-                'file': (file_path, session_json, 'application/json')
+                'file': (file_path, session_body, content_type)
             }
             
+            # x-upsert creates or overwrites in one request
             headers_upload = {
-                'Authorization': f'Bearer {self.supabase_key}'
+                'Authorization': f'Bearer {self.supabase_key}',
+                'x-upsert': 'true'
             }
             
             response = requests.post(
@@ -108,23 +252,23 @@ class SessionStore:
                 headers=headers_upload
             )
             
-            if response.status_code in [200, 201]:
-                logger.info(f"✅ Saved session for {username}")
-                return True
-            else:
-                # Try updating if it already exists
+            if response.status_code == 409:
+                # Storage without upsert support reports the existing object; update it instead
                 response = requests.put(
                     f"{self.supabase_url}/storage/v1/object/{self.bucket_name}/{file_path}",
                     files=files,
                     headers=headers_upload
                 )
-                
-                if response.status_code == 200:
-                    logger.info(f"✅ Updated session for {username}")
-                    return True
-                else:
-                    logger.error(f"❌ Failed to save session for {username}: {response.status_code}")
-                    return False
+            
+            if response.status_code in [200, 201]:
+                # Write-through; the ETag is unknown until the next revalidation
+                self._cache_put(username, session_data)
+                self._index_put(username, len(session_body))
+                logger.info(f"✅ Saved session for {username} ({len(session_body)} bytes, {self.encoding})")
+                return True
+            else:
+                logger.error(f"❌ Failed to save session for {username}: {response.status_code}")
+                return False
                 
         except Exception as e:
             logger.error(f"❌ Error saving session for {username}: {e}")
@@ -143,8 +287,10 @@ class SessionStore:
                 f"{self.supabase_url}/storage/v1/object/{self.bucket_name}/{file_path}",
                 headers=self.headers
             )
+            self._cache_drop(username)
             
             if response.status_code in [200, 204]:
+                self._index_drop(username)
                 logger.info(f"✅ Deleted session for {username}")
                 return True
             else:
@@ -155,26 +301,109 @@ class SessionStore:
             logger.error(f"❌ Error deleting session for {username}: {e}")
             return False
     
-    def list_sessions(self) -> list:
-        """List all available sessions"""
-        try:
-            response = requests.get(
+    def _list_objects(self) -> Optional[list]:
+        """Fetch every object in the sessions bucket (None on failure)"""
+        objects = []
+        offset = 0
+        page_size = 1000
+        
+        # Storage list API is paginated; keep fetching until a short page
+        while True:
+            response = requests.post(
                 f"{self.supabase_url}/storage/v1/object/list/{self.bucket_name}",
+                json={'prefix': '', 'limit': page_size, 'offset': offset},
                 headers=self.headers
             )
             
-            if response.status_code == 200:
-                objects = response.json()
-                sessions = [obj['name'].replace('.json', '') for obj in objects if obj['name'].endswith('.json')]
-                logger.info(f"📂 Found {len(sessions)} sessions")
-                return sessions
-            else:
+            if response.status_code != 200:
                 logger.error(f"❌ Failed to list sessions: {response.status_code}")
-                return []
-                
+                return None
+            
+            page = response.json()
+            objects.extend(page)
+            
+            if len(page) < page_size:
+                return objects
+            offset += page_size
+    
+    def refresh_index(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Rebuild the session index from a single bucket listing"""
+        if not self.configured:
+            return None
+        
+        try:
+            objects = self._list_objects()
+            if objects is None:
+                return None
+            
+            index = {}
+            for obj in objects:
+                name = obj.get('name', '')
+                if not name.endswith('.json'):
+                    continue
+                metadata = obj.get('metadata') or {}
+                index[name[:-len('.json')]] = {
+                    'size': metadata.get('size'),
+                    'updated_at': obj.get('updated_at')
+                }
+            
+            with self.index_lock:
+                self.index = index
+                self.index_loaded_at = time.time()
+            
+            logger.info(f"📂 Session index refreshed: {len(index)} sessions")
+            return index
+            
         except Exception as e:
-            logger.error(f"❌ Error listing sessions: {e}")
+            logger.error(f"❌ Error refreshing session index: {e}")
+            return None
+    
+    def get_index(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Get the session index, refreshing it when older than the TTL (None if unavailable)
+
+        The returned dict is the shared live index: iterate it only under
+        index_lock (single lookups are fine).
+        """
+        if not self.configured:
+            return None
+        
+        with self.index_lock:
+            if self.index is not None and time.time() - self.index_loaded_at < self.index_ttl_seconds:
+                return self.index
+        
+        return self.refresh_index()
+    
+    def _index_put(self, username: str, size: Optional[int] = None):
+        with self.index_lock:
+            if self.index is not None:
+                self.index[username] = {'size': size, 'updated_at': datetime.utcnow().isoformat()}
+    
+    def _index_drop(self, username: str):
+        with self.index_lock:
+            if self.index is not None:
+                self.index.pop(username, None)
+    
+    def list_sessions(self) -> list:
+        """List all available sessions"""
+        if not self.configured:
+            logger.debug("🔕 Session listing disabled - Supabase not configured")
             return []
+        
+        index = self.get_index()
+        if index is None:
+            return []
+        
+        # _index_put/_index_drop mutate the index from other threads
+        with self.index_lock:
+            usernames = list(index.keys())
+        
+        logger.info(f"📂 Found {len(usernames)} sessions")
+        return usernames
+    
+    def existing_usernames(self) -> set:
+        """Get the set of usernames with a stored session from a single listing"""
+        return set(self.list_sessions())
 
 # Global instance
 session_store = SessionStore()
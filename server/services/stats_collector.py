@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Stats Collector Service
+Bulk profile and recent-post stats for every connected account, fetched on
+the shared Graph client with batch requests and bounded concurrency
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import concurrent.futures
+from urllib.parse import urlencode
+from typing import Any, Dict, List, Optional
+
+from database import get_db
+from services.graph_client import graph_client, GraphAPIError
+from services.meta_quota import meta_quota
+
+logger = logging.getLogger(__name__)
+
+# Default field projections: only what the dashboard and engagement totals use
+PROFILE_FIELDS = 'id,username,threads_profile_picture_url,follower_count'
+POST_FIELDS = 'id,timestamp,permalink,likes,replies,reposts,quotes,views'
+ENGAGEMENT_FIELDS = ('likes', 'replies', 'reposts', 'quotes', 'views')
+
+# Statuses of the batch request itself that mean the endpoint rejects batching
+BATCH_UNSUPPORTED_STATUSES = (400, 404, 405, 501)
+
+# Graph caps a batch request at 50 sub-requests
+BATCH_MAX_REQUESTS = 50
+
+class BatchUnsupportedError(GraphAPIError):
+    """The Graph batch endpoint rejected the batch request as a whole"""
+
+def summarize_engagement(posts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Engagement totals for a list of posts (same shape as MetaClient._get_recent_posts)"""
+    totals = {f'total_{field}': sum(post.get(field) or 0 for post in posts) for field in ENGAGEMENT_FIELDS}
+    interactions = totals['total_likes'] + totals['total_replies'] + totals['total_reposts'] + totals['total_quotes']
+    totals['avg_engagement'] = interactions / max(len(posts), 1)
+    return totals
+
+class StatsCollector:
+    """
+    Collects stats for many accounts at once
+
+    Accounts are packed into Graph batch requests of up to
+    BATCH_MAX_REQUESTS sub-requests (profile + first page of posts per
+    account, each sub-request carrying that account's own token), plus one
+    GET per extra page of posts, followed via the paging.cursors.after
+    cursor. `concurrency` batches run at a time on the graph client's event
+    loop, and accounts that meta_quota says are throttled are skipped
+    instead of burning more quota.
+    """
+
+    def __init__(self):
+        self.graph = graph_client
+        self.concurrency = int(os.getenv('STATS_COLLECTOR_CONCURRENCY', '10'))
+        self.max_posts = int(os.getenv('STATS_COLLECTOR_MAX_POSTS', '25'))
+        self.page_size = int(os.getenv('STATS_COLLECTOR_PAGE_SIZE', '25'))
+        self.timeout = float(os.getenv('STATS_COLLECTOR_TIMEOUT_SECONDS', '120'))
+        self.use_batch = os.getenv('STATS_COLLECTOR_USE_BATCH', 'true').lower() == 'true'
+        self.batch_accounts = int(os.getenv('STATS_COLLECTOR_BATCH_ACCOUNTS', '25'))
+        # Paused (not switched off) when the batch endpoint itself rejects a batch
+        self.batch_retry_seconds = float(os.getenv('STATS_COLLECTOR_BATCH_RETRY_SECONDS', '600'))
+        self.batch_paused_until = 0.0
+
+        logger.info(f"📊 StatsCollector initialized (concurrency: {self.concurrency}, max posts: {self.max_posts})")
+
+    def _batching(self) -> bool:
+        return self.use_batch and time.monotonic() >= self.batch_paused_until
+
+    def _posts_params(self, post_fields: str, max_posts: int) -> Optional[Dict[str, Any]]:
+        if max_posts <= 0:
+            return None
+        return {'fields': post_fields, 'limit': min(self.page_size, max_posts)}
+
+    @staticmethod
+    def _batch_body(item: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Parsed body of one batch sub-response; raises GraphAPIError for failed items"""
+        if not item:
+            raise GraphAPIError("Batch item timed out")
+        body = json.loads(item.get('body') or '{}')
+        if item.get('code') != 200:
+            message = body.get('error', {}).get('message') or f"HTTP {item.get('code')}"
+            raise GraphAPIError(f"{item.get('code')} - {message}", item.get('code') or 0, body)
+        return body
+
+    async def _fetch_batch(self, group: List[Dict[str, Any]], profile_fields: str,
+                           posts_params: Optional[Dict[str, Any]]) -> List[Any]:
+        """
+        Profile and first posts page for several accounts in one Graph batch request
+
+        Returns one {'profile', 'posts'} dict or GraphAPIError per token row,
+        in input order. The outer request uses the first row's token.
+        """
+        batch = []
+        for token_row in group:
+            token = {'access_token': token_row['access_token']}
+            batch.append({'method': 'GET', 'relative_url': f"me?{urlencode({'fields': profile_fields, **token})}"})
+            if posts_params is not None:
+                batch.append({'method': 'GET', 'relative_url': f"me/threads?{urlencode({**posts_params, **token})}"})
+
+        # Usage headers on a mixed batch can't be pinned on one account
+        account_id = group[0].get('account_id') if len(group) == 1 else None
+        try:
+            results = await self.graph.client.request('POST', '', group[0]['access_token'], account_id,
+                                                      json_body={'batch': batch, 'include_headers': False})
+        except GraphAPIError as e:
+            # Token problems also come back as 400 (OAuthException); those are not about batching
+            oauth_error = e.data.get('error', {}).get('type') == 'OAuthException'
+            if e.status in BATCH_UNSUPPORTED_STATUSES and not oauth_error:
+                raise BatchUnsupportedError(str(e), e.status, e.data)
+            raise
+        if not isinstance(results, list) or len(results) != len(batch):
+            raise BatchUnsupportedError("Unexpected batch response")
+
+        per_account = len(batch) // len(group)
+        firsts = []
+        for index in range(len(group)):
+            items = results[index * per_account:(index + 1) * per_account]
+            try:
+                bodies = [self._batch_body(item) for item in items]
+                firsts.append({'profile': bodies[0], 'posts': bodies[1] if len(bodies) > 1 else None})
+            except GraphAPIError as e:
+                firsts.append(e)
+        return firsts
+
+    async def _fetch_direct(self, token: str, account_id: Optional[int], profile_fields: str,
+                            posts_params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Profile and first posts page as two concurrent requests"""
+        calls = [self.graph.client.request('GET', 'me', token, account_id, params={'fields': profile_fields})]
+        if posts_params is not None:
+            calls.append(self.graph.client.request('GET', 'me/threads', token, account_id, params=posts_params))
+
+        bodies = await asyncio.gather(*calls)
+        return {'profile': bodies[0], 'posts': bodies[1] if len(bodies) > 1 else None}
+
+    async def _first_pages(self, group: List[Dict[str, Any]], profile_fields: str,
+                           posts_params: Optional[Dict[str, Any]]) -> List[Any]:
+        """
+        First pages for a group of token rows, batched when possible
+
+        Accounts whose batch item failed (other than 429) are retried
+        directly. Returns a first-page dict or an exception per row.
+        """
+        firsts: List[Any] = [None] * len(group)
+        if self._batching():
+            try:
+                firsts = await self._fetch_batch(group, profile_fields, posts_params)
+            except BatchUnsupportedError as e:
+                self.batch_paused_until = time.monotonic() + self.batch_retry_seconds
+                logger.warning(f"⚠️ Graph batch requests unavailable ({e}), using direct requests for {self.batch_retry_seconds:.0f}s")
+            except GraphAPIError as e:
+                if e.status == 429:
+                    return [e] * len(group)
+                logger.warning(f"⚠️ Batch request failed for {len(group)} accounts ({e}), retrying directly")
+
+        retry = [index for index, first in enumerate(firsts)
+                 if first is None or (isinstance(first, GraphAPIError) and first.status != 429)]
+        for index in retry:
+            if firsts[index] is not None:
+                logger.warning(f"⚠️ Batch item failed for account {group[index].get('account_id')} ({firsts[index]}), retrying directly")
+
+        direct = await asyncio.gather(*(
+            self._fetch_direct(group[index]['access_token'], group[index].get('account_id'), profile_fields, posts_params)
+            for index in retry
+        ), return_exceptions=True)
+        for index, first in zip(retry, direct):
+            firsts[index] = first
+        return firsts
+
+    async def collect_account(self, token: str, account_id: Optional[int] = None,
+                              profile_fields: str = PROFILE_FIELDS, post_fields: str = POST_FIELDS,
+                              max_posts: Optional[int] = None, first: Any = None) -> Dict[str, Any]:
+        """
+        Profile, up to max_posts recent posts and engagement totals for one account
+
+        `first` is the account's already fetched first page (or the exception
+        fetching it raised); when omitted it is fetched here.
+        """
+        max_posts = self.max_posts if max_posts is None else max_posts
+        posts_params = self._posts_params(post_fields, max_posts)
+
+        try:
+            if first is None:
+                token_row = {'access_token': token, 'account_id': account_id}
+                first = (await self._first_pages([token_row], profile_fields, posts_params))[0]
+            if isinstance(first, BaseException):
+                raise first
+
+            profile = first['profile']
+            posts: List[Dict[str, Any]] = []
+            page = first['posts']
+
+            while page is not None:
+                posts.extend(page.get('data', []))
+                after = page.get('paging', {}).get('cursors', {}).get('after')
+                if len(posts) >= max_posts or not after or not page.get('paging', {}).get('next'):
+                    break
+                page = await self.graph.client.request('GET', 'me/threads', token, account_id, params={
+                    **posts_params,
+                    'limit': min(self.page_size, max_posts - len(posts)),
+                    'after': after
+                })
+
+            posts = posts[:max_posts]
+            return {
+                'account_id': account_id,
+                'success': True,
+                'data': {
+                    'user_id': profile.get('id'),
+                    'username': profile.get('username'),
+                    'biography': profile.get('threads_biography'),
+                    'profile_picture': profile.get('threads_profile_picture_url'),
+                    'follower_count': profile.get('follower_count', 0),
+                    'recent_posts': posts,
+                    'total_posts': len(posts),
+                    'engagement': summarize_engagement(posts)
+                }
+            }
+
+        except Exception as e:
+            logger.error(f"❌ Error collecting stats for account {account_id}: {e}")
+            return {'account_id': account_id, 'success': False, 'error': str(e)}
+
+    async def _collect(self, tokens: List[Dict[str, Any]], results: List[Optional[Dict[str, Any]]],
+                       profile_fields: str = PROFILE_FIELDS, post_fields: str = POST_FIELDS,
+                       max_posts: Optional[int] = None):
+        """Fill results (same order as tokens) as each account completes"""
+        max_posts = self.max_posts if max_posts is None else max_posts
+        posts_params = self._posts_params(post_fields, max_posts)
+        per_account = 1 if posts_params is None else 2
+        size = 1
+        if self._batching():
+            size = max(1, min(self.batch_accounts, BATCH_MAX_REQUESTS // per_account))
+        semaphore = asyncio.Semaphore(max(1, self.concurrency))
+
+        async def collect_group(start: int):
+            group = tokens[start:start + size]
+            async with semaphore:
+                firsts = await self._first_pages(group, profile_fields, posts_params)
+
+                async def finish(index: int):
+                    token_row = group[index]
+                    results[start + index] = await self.collect_account(
+                        token_row['access_token'], token_row.get('account_id'), profile_fields,
+                        post_fields, max_posts, first=firsts[index])
+
+                await asyncio.gather(*(finish(index) for index in range(len(group))))
+
+        await asyncio.gather(*(collect_group(start) for start in range(0, len(tokens), size)))
+
+    def collect(self, tokens: List[Dict[str, Any]], **options) -> List[Dict[str, Any]]:
+        """
+        Collect stats for token rows ({'account_id', 'access_token'})
+
+        Results come back in input order. Options are passed to collect_account
+        (profile_fields, post_fields, max_posts). If the collection times out,
+        accounts that finished keep their results and the rest are failures.
+        """
+        if not tokens:
+            return []
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(tokens)
+        try:
+            self.graph.run(self._collect(tokens, results, **options), self.timeout)
+        except concurrent.futures.TimeoutError:
+            finished = sum(1 for result in results if result is not None)
+            logger.warning(f"⚠️ Stats collection timed out after {self.timeout:g}s ({finished}/{len(tokens)} accounts finished)")
+
+        return [
+            result if result is not None else
+            {'account_id': token_row.get('account_id'), 'success': False,
+             'error': f"Timed out after {self.timeout:g}s"}
+            for token_row, result in zip(tokens, list(results))
+        ]
+
+    def collect_all(self, account_ids: Optional[List[int]] = None, **options) -> Dict[str, Any]:
+        """Collect stats for every connected account (or just account_ids)"""
+        started = time.time()
+        tokens = get_db().get_oauth_tokens(account_ids)
+
+        ready, deferred = [], []
+        for token_row in tokens:
+            if meta_quota.defer_seconds(token_row['account_id']) > 0:
+                deferred.append(token_row['account_id'])
+            else:
+                ready.append(token_row)
+
+        try:
+            results = self.collect(ready, **options)
+        except Exception as e:
+            logger.error(f"❌ Stats collection failed: {e}")
+            results = [{'account_id': row['account_id'], 'success': False, 'error': str(e)} for row in ready]
+
+        collected = sum(1 for result in results if result['success'])
+        duration = round(time.time() - started, 2)
+        logger.info(f"📊 Collected stats for {collected}/{len(tokens)} accounts in {duration}s ({len(deferred)} deferred)")
+
+        return {
+            'accounts': results,
+            'collected': collected,
+            'failed': len(results) - collected,
+            'deferred': deferred,
+            'duration_seconds': duration
+        }
+
+# Global stats collector instance
+stats_collector = StatsCollector()
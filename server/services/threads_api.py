@@ -8,7 +8,9 @@ import os
 import logging
 from typing import Tuple, Optional, Dict, Any
 from services.session_store import session_store
-from database import DatabaseManager
+from services.ttl_cache import MISSING
+from services.token_validation import token_validation_cache
+from database import DatabaseManager, get_db
 
 logger = logging.getLogger(__name__)
 
@@ -19,15 +21,21 @@ class ThreadsPostError(Exception):
 class ThreadsClient:
     def __init__(self):
         self.meta_publish_enabled = os.getenv('META_THREADS_PUBLISH_ENABLED', 'false').lower() == 'true'
-        self.db = DatabaseManager()
         
         logger.info(f"🚀 ThreadsClient initialized")
         logger.info(f"🔐 Meta publish enabled: {self.meta_publish_enabled}")
     
-    def post_thread(self, account: Dict[str, Any], text: str, image_url: Optional[str] = None) -> Tuple[bool, str]:
+    @property
+    def db(self) -> DatabaseManager:
+        """Shared DatabaseManager (resolved per call so test factories take effect)"""
+        return get_db()
+    
+    def post_thread(self, account: Dict[str, Any], text: str, image_url: Optional[str] = None,
+                    ready_timeout: Optional[float] = None) -> Tuple[bool, str]:
         """
         Post to Threads using available methods
         Priority: Official API (if enabled + scopes) -> Session Client
+        ready_timeout caps the official API's wait for image processing.
         """
         try:
             account_id = account['id']
@@ -39,11 +47,14 @@ class ThreadsClient:
                 logger.info(f"🖼️ Image: {image_url}")
             
             # Try official Meta API first if enabled and account has proper tokens
-            if self.meta_publish_enabled and self._has_official_access(account):
+            if self.meta_publish_enabled and self.has_official_access(account):
                 try:
-                    success, message = self._post_via_official_api(account, text, image_url)
+                    success, message = self._post_via_official_api(account, text, image_url, ready_timeout)
                     if success:
                         return True, message
+                    elif message.startswith('OFFICIAL_API_PENDING'):
+                        # The container exists and is still processing; posting via session too would double-post
+                        return False, message
                     else:
                         logger.warning(f"⚠️ Official API failed, trying session: {message}")
                 except Exception as e:
@@ -56,7 +67,7 @@ class ThreadsClient:
             logger.error(f"❌ Error posting thread for account {account.get('id')}: {e}")
             return False, f"POSTING_ERROR: {str(e)}"
     
-    def _has_official_access(self, account: Dict[str, Any]) -> bool:
+    def has_official_access(self, account: Dict[str, Any]) -> bool:
         """Check if account has official API access with required scopes"""
         try:
             account_id = account['id']
@@ -76,6 +87,15 @@ class ThreadsClient:
             if not access_token:
                 return False
             
+            # Answer from validation results already cached for this token (no network call)
+            cached = token_validation_cache.get(access_token)
+            if cached is not MISSING:
+                if not cached['valid']:
+                    logger.info(f"🔐 Official access check for {account_id}: token known invalid")
+                    return False
+                if cached.get('scopes') is not None:
+                    scopes = cached['scopes']
+            
             # Check for required publishing scope
             required_scopes = ['threads_content_publish', 'threads_basic']
             has_scopes = all(scope in scopes for scope in required_scopes)
@@ -87,8 +107,15 @@ class ThreadsClient:
             logger.error(f"❌ Error checking official access: {e}")
             return False
     
-    def _post_via_official_api(self, account: Dict[str, Any], text: str, image_url: Optional[str] = None) -> Tuple[bool, str]:
-        """Post via official Meta Threads API"""
+    def _post_via_official_api(self, account: Dict[str, Any], text: str, image_url: Optional[str] = None,
+                               ready_timeout: Optional[float] = None) -> Tuple[bool, str]:
+        """
+        Post via official Meta Threads API
+
+        Creates and publishes a real thread (this path used to return a
+        simulated success). Only reached when META_THREADS_PUBLISH_ENABLED
+        is true and the account has official access.
+        """
         try:
             account_id = account['id']
             threads_user_id = account['threads_user_id']
@@ -102,22 +129,19 @@ class ThreadsClient:
             
             access_token = token_data['access_token']
             
-            # This would make the actual API call to Meta's Threads API
-            # For now, simulate success
-            logger.info(f"🔐 Simulating official API post for {threads_user_id}")
+            # Create + publish through the shared async Graph client (pooled, with timeouts)
+            from services.graph_client import graph_client
+            result = graph_client.post_thread(access_token, text, image_url, account_id, ready_timeout)
             
-            # TODO: Replace with actual Meta API call
-            # Example:
-            # response = requests.post(
-            #     f"https://graph.threads.net/v1/{threads_user_id}/threads",
-            #     data={
-            #         'text': text,
-            #         'image_url': image_url,
-            #         'access_token': access_token
-            #     }
-            # )
+            if result.get('status') == 'pending':
+                logger.warning(f"⏳ Container {result['container_id']} still processing for account {account_id}")
+                return False, f"OFFICIAL_API_PENDING: container {result['container_id']} still processing ({result.get('error')})"
+            
+            if not result.get('success'):
+                raise ThreadsPostError(result.get('error', 'Unknown Graph API error'))
             
-            return True, "OFFICIAL_API_SUCCESS: Posted via Meta Threads API"
+            logger.info(f"🔐 Published thread {result.get('thread_id')} for {threads_user_id}")
+            return True, f"OFFICIAL_API_SUCCESS: Posted via Meta Threads API (thread {result.get('thread_id')})"
             
         except Exception as e:
             logger.error(f"❌ Official API posting failed: {e}")
@@ -179,7 +203,7 @@ class ThreadsClient:
     
     def get_posting_method(self, account: Dict[str, Any]) -> str:
         """Get the posting method that would be used for this account"""
-        if self.meta_publish_enabled and self._has_official_access(account):
+        if self.meta_publish_enabled and self.has_official_access(account):
             return "official_api"
         elif session_store.exists(account['username']):
             return "session_client"
@@ -193,7 +217,7 @@ class ThreadsClient:
             account_id = account['id']
             
             has_session = session_store.exists(username)
-            has_official = self._has_official_access(account)
+            has_official = self.has_official_access(account)
             posting_method = self.get_posting_method(account)
             
             status = {
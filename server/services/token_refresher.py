@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Token Refresher Service
+Background refresh of OAuth access tokens ahead of their expiry, so the
+posting path never has to discover and repair an expired token
+"""
+
+import os
+import time
+import heapq
+import logging
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import get_db
+from services.meta_oauth import meta_oauth_service
+from services.token_validation import token_validation_cache
+
+logger = logging.getLogger(__name__)
+
+def parse_expires_at(value: Any) -> Optional[float]:
+    """Epoch seconds for an expires_at column value (naive timestamps are local time)"""
+    if not value:
+        return None
+    try:
+        if isinstance(value, (int, float)):
+            return float(value)
+        expires_at = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        return expires_at.timestamp()
+    except ValueError:
+        return None
+
+class TokenRefresher:
+    """
+    Min-heap of (refresh_at, account_id) built from oauth_tokens.expires_at
+
+    Entries are pushed `lead_seconds` before expiry. Each pass pops every
+    due account, re-reads their token rows in one request, refreshes them
+    `concurrency` at a time and stores the results with store_access_token.
+    Superseded heap entries are skipped lazily via the `scheduled` map.
+    Failed refreshes are retried with a doubling delay.
+    """
+
+    def __init__(self):
+        # Every process that runs start.py would refresh the same tokens; enable on one instance only
+        self.enabled = os.getenv('TOKEN_REFRESH_ENABLED', 'false').lower() == 'true'
+        self.lead_seconds = int(os.getenv('TOKEN_REFRESH_LEAD_SECONDS', str(3 * 24 * 3600)))
+        self.concurrency = int(os.getenv('TOKEN_REFRESH_CONCURRENCY', '4'))
+        self.batch_size = int(os.getenv('TOKEN_REFRESH_BATCH_SIZE', '50'))
+        self.reload_seconds = int(os.getenv('TOKEN_REFRESH_RELOAD_SECONDS', '600'))
+        self.retry_seconds = int(os.getenv('TOKEN_REFRESH_RETRY_SECONDS', '300'))
+        self.max_retry_seconds = int(os.getenv('TOKEN_REFRESH_MAX_RETRY_SECONDS', '21600'))
+
+        self.lock = threading.Lock()
+        self.heap: List[Tuple[float, int]] = []
+        self.scheduled: Dict[int, float] = {}
+        self.failures: Dict[int, int] = {}
+        self.loaded_at = 0.0
+        self.stats = {'refreshed': 0, 'failed': 0, 'last_run_at': None}
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        logger.info(f"🔑 TokenRefresher initialized (lead: {self.lead_seconds}s, concurrency: {self.concurrency})")
+
+    def schedule(self, account_id: int, refresh_at: float):
+        """(Re)schedule an account's refresh; replaces any earlier schedule"""
+        with self.lock:
+            self.scheduled[account_id] = refresh_at
+            heapq.heappush(self.heap, (refresh_at, account_id))
+        self._wake.set()
+
+    def track(self, account_id: int, expires_at: Any):
+        """Schedule a refresh lead_seconds before expires_at (no-op for non-expiring tokens)"""
+        expires_ts = parse_expires_at(expires_at)
+        if expires_ts is None:
+            with self.lock:
+                self.scheduled.pop(account_id, None)
+            return
+        self.schedule(account_id, expires_ts - self.lead_seconds)
+
+    def load(self) -> int:
+        """Rebuild the schedule from every row in oauth_tokens"""
+        tokens = get_db().get_oauth_tokens()
+        heap, scheduled = [], {}
+        for token_row in tokens:
+            expires_ts = parse_expires_at(token_row.get('expires_at'))
+            if expires_ts is None:
+                continue
+            account_id = token_row['account_id']
+            refresh_at = expires_ts - self.lead_seconds
+            # Keep a pending retry delay instead of hammering a failing account
+            if account_id in self.failures:
+                refresh_at = max(refresh_at, self.scheduled.get(account_id, refresh_at))
+            scheduled[account_id] = refresh_at
+            heap.append((refresh_at, account_id))
+
+        heapq.heapify(heap)
+        with self.lock:
+            self.heap = heap
+            self.scheduled = scheduled
+            self.loaded_at = time.time()
+
+        logger.info(f"🔑 Tracking expiry for {len(scheduled)} tokens")
+        return len(scheduled)
+
+    def next_due_at(self) -> Optional[float]:
+        """When the earliest scheduled refresh is due (None if nothing is tracked)"""
+        with self.lock:
+            while self.heap and self.scheduled.get(self.heap[0][1]) != self.heap[0][0]:
+                heapq.heappop(self.heap)
+            return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now: float, limit: int) -> List[int]:
+        """Pop up to `limit` accounts whose refresh is due"""
+        due = []
+        with self.lock:
+            while self.heap and len(due) < limit and self.heap[0][0] <= now:
+                refresh_at, account_id = heapq.heappop(self.heap)
+                if self.scheduled.get(account_id) != refresh_at:
+                    continue
+                del self.scheduled[account_id]
+                due.append(account_id)
+        return due
+
+    def _refresh_one(self, token_row: Dict[str, Any]) -> bool:
+        account_id = token_row['account_id']
+        # Long-lived Threads tokens are refreshed with themselves when no refresh token is stored
+        refresh_token = token_row.get('refresh_token') or token_row.get('access_token')
+
+        try:
+            previous_access_token = token_row.get('access_token')
+            result = meta_oauth_service.refresh_access_token(refresh_token, account_id, previous_access_token)
+            stored = get_db().store_access_token(account_id, {
+                'access_token': result['access_token'],
+                # refresh_access_token echoes back the token it was given; don't store an access token as refresh token
+                'refresh_token': result.get('refresh_token') if token_row.get('refresh_token') else None,
+                'expires_at': result.get('expires_at'),
+                'scope': ','.join(result.get('scopes') or []) or None
+            })
+            if not stored:
+                raise Exception("store_access_token failed")
+            if previous_access_token and previous_access_token != result['access_token']:
+                # The replaced token must not keep answering validation checks from cache
+                token_validation_cache.invalidate(previous_access_token)
+
+            with self.lock:
+                self.failures.pop(account_id, None)
+            expires_ts = parse_expires_at(result.get('expires_at'))
+            if expires_ts is not None:
+                # A token shorter-lived than the lead time must not come straight back into this pass
+                self.schedule(account_id, max(expires_ts - self.lead_seconds, time.time() + self.retry_seconds))
+            return True
+
+        except Exception as e:
+            with self.lock:
+                attempts = self.failures.get(account_id, 0) + 1
+                self.failures[account_id] = attempts
+            delay = min(self.max_retry_seconds, self.retry_seconds * (2 ** (attempts - 1)))
+            logger.error(f"❌ Token refresh failed for account {account_id} (attempt {attempts}, retry in {delay}s): {e}")
+            self.schedule(account_id, time.time() + delay)
+            return False
+
+    def run_pending(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Refresh every token that is due; returns counts for this pass"""
+        now = time.time() if now is None else now
+        if now - self.loaded_at >= self.reload_seconds:
+            self.load()
+
+        refreshed = failed = 0
+        while True:
+            account_ids = self.pop_due(now, self.batch_size)
+            if not account_ids:
+                break
+
+            tokens = get_db().get_oauth_tokens(account_ids)
+            found = {token_row['account_id'] for token_row in tokens}
+            for account_id in account_ids:
+                if account_id not in found:
+                    logger.warning(f"⚠️ No token row for account {account_id}, dropping from refresh schedule")
+
+            # Another worker may already have refreshed a row; only refresh what is still due
+            due = []
+            for token_row in tokens:
+                expires_ts = parse_expires_at(token_row.get('expires_at'))
+                if expires_ts is not None and expires_ts - self.lead_seconds > now and token_row['account_id'] not in self.failures:
+                    self.track(token_row['account_id'], token_row['expires_at'])
+                else:
+                    due.append(token_row)
+
+            if due:
+                with ThreadPoolExecutor(max_workers=max(1, min(self.concurrency, len(due)))) as executor:
+                    results = list(executor.map(self._refresh_one, due))
+                refreshed += sum(1 for ok in results if ok)
+                failed += sum(1 for ok in results if not ok)
+
+        with self.lock:
+            self.stats['refreshed'] += refreshed
+            self.stats['failed'] += failed
+            self.stats['last_run_at'] = datetime.now(timezone.utc).isoformat()
+
+        if refreshed or failed:
+            logger.info(f"🔑 Token refresh pass: {refreshed} refreshed, {failed} failed")
+        return {'refreshed': refreshed, 'failed': failed}
+
+    def _loop(self):
+        while True:
+            try:
+                self.run_pending()
+            except Exception as e:
+                logger.error(f"❌ Token refresher error: {e}")
+
+            next_due = self.next_due_at()
+            wait = self.reload_seconds
+            if next_due is not None:
+                wait = min(wait, max(1.0, next_due - time.time()))
+            self._wake.clear()
+            self._wake.wait(wait)
+
+    def start(self):
+        """Start the background refresh thread (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if not self.enabled:
+            logger.info("🔑 Token refresher disabled (TOKEN_REFRESH_ENABLED=false)")
+            return
+        if not meta_oauth_service.oauth_configured:
+            logger.warning("⚠️ Meta OAuth not configured - token refresher not started")
+            return
+        self._thread = threading.Thread(target=self._loop, name='token-refresher', daemon=True)
+        self._thread.start()
+        logger.info("🔑 Token refresher thread started")
+
+    def get_status(self) -> Dict[str, Any]:
+        """Snapshot for health/status endpoints"""
+        next_due = self.next_due_at()
+        with self.lock:
+            return {
+                'enabled': self.enabled,
+                'running': self._thread is not None and self._thread.is_alive(),
+                'tracked_tokens': len(self.scheduled),
+                'retrying': len(self.failures),
+                'next_refresh_at': datetime.fromtimestamp(next_due, timezone.utc).isoformat() if next_due else None,
+                **self.stats
+            }
+
+# Global token refresher instance
+token_refresher = TokenRefresher()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Token Validation Cache
+Remembers debug_token / Graph validation results per access token so
+repeated validity and scope checks don't each cost a Graph API call
+"""
+
+import os
+import time
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional
+
+from services.ttl_cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+def token_key(access_token: str) -> str:
+    """Cache key for a token (raw tokens are never kept as keys)"""
+    return hashlib.sha256(access_token.encode('utf-8')).hexdigest()
+
+class TokenValidationCache:
+    """
+    Validity, scopes and expiry per token hash
+
+    Valid results are kept for `ttl_seconds` (and never past the token's own
+    expires_at); invalid results only for `negative_ttl_seconds`, so a token
+    that was fixed or re-issued is picked up again quickly.
+    """
+
+    def __init__(self):
+        max_size = int(os.getenv('TOKEN_VALIDATION_CACHE_MAX_ENTRIES', '1024'))
+        self.valid = TTLCache('token_validation', max_size=max_size,
+                              ttl_seconds=float(os.getenv('TOKEN_VALIDATION_CACHE_TTL', '300')))
+        self.invalid = TTLCache('token_validation_negative', max_size=max_size,
+                                ttl_seconds=float(os.getenv('TOKEN_VALIDATION_NEGATIVE_TTL', '30')))
+
+    def get(self, access_token: Optional[str]) -> Any:
+        """Cached info dict ({'valid', 'scopes', 'expires_at', ...}) or MISSING"""
+        if not access_token:
+            return MISSING
+
+        key = token_key(access_token)
+        info = self.valid.get(key)
+        if info is not MISSING:
+            expires_at = info.get('expires_at')
+            if expires_at and expires_at <= time.time():
+                self.valid.invalidate(key)
+                return {**info, 'valid': False}
+            return info
+
+        return self.invalid.get(key)
+
+    def put(self, access_token: str, valid: bool, scopes: Optional[List[str]] = None,
+            expires_at: Optional[float] = None, **details):
+        """Record a validation result; expires_at is epoch seconds (0/None = no expiry)"""
+        key = token_key(access_token)
+        info = {'valid': valid, 'scopes': scopes, 'expires_at': expires_at or None, **details}
+        if valid:
+            self.invalid.invalidate(key)
+            self.valid.set(key, info)
+        else:
+            self.valid.invalidate(key)
+            self.invalid.set(key, info)
+
+    def invalidate(self, access_token: str):
+        key = token_key(access_token)
+        self.valid.invalidate(key)
+        self.invalid.invalidate(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'valid': self.valid.get_stats(),
+            'invalid': self.invalid.get_stats()
+        }
+
+# Global token validation cache instance
+token_validation_cache = TokenValidationCache()
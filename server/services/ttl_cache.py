@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+TTL Cache Service
+Small thread-safe in-process cache with per-entry expiry and LRU eviction
+"""
+
+import copy
+import time
+import logging
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Returned by get() on a miss; callers never cache None ("no row" results are always re-read)
+MISSING = object()
+
+class TTLCache:
+    """LRU cache whose entries also expire after ttl_seconds"""
+
+    def __init__(self, name: str, max_size: int = 1024, ttl_seconds: float = 60.0):
+        self.name = name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        logger.info(f"🗃️ TTLCache '{name}' initialized (max size: {max_size}, ttl: {ttl_seconds}s)")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Get a cached value, or MISSING if absent or expired
+
+        Dicts and lists are returned as copies so callers cannot mutate the cached row.
+        """
+        if not self.enabled:
+            return MISSING
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return MISSING
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._misses += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+
+        return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+    def set(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entry when full"""
+        if not self.enabled:
+            return
+
+        if isinstance(value, (dict, list)):
+            value = copy.deepcopy(value)
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key: Hashable):
+        """Drop a single entry"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters for this cache"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'name': self.name,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_ratio': round(self._hits / lookups, 3) if lookups else 0.0
+            }
@@ -131,7 +131,7 @@ if not validate_environment():
     print("❌ Environment not ready. Exiting.")
     exit(1)
 
-from database import DatabaseManager
+from database import get_db
 import asyncio
 
 app = Flask(__name__)
@@ -156,6 +156,7 @@ try:
     from routes.captions import captions
     from routes.images import images
     from routes.config_status import bp as config_status_bp
+    from routes.engagement import engagement
     
     app.register_blueprint(accounts)
     app.register_blueprint(auth)
@@ -164,6 +165,7 @@ try:
     app.register_blueprint(captions)
     app.register_blueprint(images)
     app.register_blueprint(config_status_bp)
+    app.register_blueprint(engagement)
     print("✅ Route blueprints registered successfully")
 except ImportError as e:
     print(f"⚠️ Could not import route blueprints: {e}")
@@ -214,7 +216,7 @@ def health():
     """Detailed health check endpoint"""
     try:
         # Test database connection
-        db = DatabaseManager()
+        db = get_db()
         db.get_accounts()
         
         # Test Meta OAuth service
@@ -225,6 +227,9 @@ def health():
         from services.threads_api import threads_client
         threads_ok = hasattr(threads_client, 'post_thread')
         
+        from services.http_pool import get_pool_metrics
+        from services.token_validation import token_validation_cache
+        
         return jsonify({
             "ok": True,
             "health": "ok",
@@ -236,6 +241,11 @@ def health():
                 'database': 'connected',
                 'meta_oauth': 'available' if oauth_ok else 'unavailable',
                 'threads_api': 'available' if threads_ok else 'unavailable'
+            },
+            "http_pools": get_pool_metrics(),
+            "caches": {
+                **db.get_cache_stats(),
+                'token_validation': token_validation_cache.get_stats()
             }
         })
     except Exception as e:
@@ -262,7 +272,7 @@ def info():
 def schedule_posts():
     """Get or create posting schedules"""
     try:
-        db = DatabaseManager()
+        db = get_db()
         
         if request.method == 'GET':
             # Get all schedules
@@ -306,12 +316,10 @@ def get_accounts():
     try:
         logger.info("🔍 Starting get_accounts request...")
         
-        # Test database connection
-        db = DatabaseManager()
-        logger.info(f"✅ DatabaseManager initialized")
+        db = get_db()
         
-        # Get accounts with safe operation
-        raw_accounts = safe_database_operation("get_active_accounts", db.get_active_accounts)
+        # Accounts with token presence and last post time in one query
+        raw_accounts = safe_database_operation("get_accounts_overview", db.get_accounts_overview)
         
         if raw_accounts is None:
             return jsonify(handle_api_error(
@@ -322,15 +330,18 @@ def get_accounts():
         
         logger.info(f"📋 Retrieved {len(raw_accounts)} raw accounts")
         
+        # One storage listing instead of an exists() probe per account
+        from services.session_store import session_store
+        session_usernames = session_store.existing_usernames()
+        
         # Transform accounts to match frontend expectations
         accounts = []
         for account in raw_accounts:
             # Check if account has a token (connected via OAuth)
-            has_token = db.get_token_by_account_id(account['id']) is not None
+            has_token = bool(account.get('has_token'))
             
             # Check session connection
-            from services.session_store import session_store
-            has_session = session_store.exists(account.get('username', ''))
+            has_session = account.get('username', '') in session_usernames
             
             # Determine connection status
             if has_token:
@@ -343,8 +354,8 @@ def get_accounts():
                 threads_connected = False
                 connection_status = 'disconnected'
             
-            # Get last posted from posting history (more accurate than account.last_posted_at)
-            last_posted_from_history = db.get_last_posted_for_account(account['id'])
+            # Last posted from posting history (more accurate than account.last_posted_at)
+            last_posted_from_history = account.get('last_posted_from_history')
             
             # Transform account data
             transformed_account = {
@@ -391,7 +402,7 @@ def add_account():
         logger.info(f"🔍 Adding new account: {username}")
         
         # Initialize database
-        db = DatabaseManager()
+        db = get_db()
         
         # Add account with safe operation
         success = safe_database_operation("add_account", db.add_account, username, password)
@@ -426,7 +437,7 @@ def toggle_account(account_id):
         data = request.json
         active = data.get('active', False)
         
-        db = DatabaseManager()
+        db = get_db()
         # This would need to be implemented in DatabaseManager
         # For now, return success
         return jsonify({"message": "Account status updated successfully"})
@@ -446,7 +457,7 @@ def update_account(account_id):
         
         logger.info(f"🔍 Updating account {account_id} with data: {data}")
         
-        db = DatabaseManager()
+        db = get_db()
         success = safe_database_operation("update_account", db.update_account, account_id, data)
         
         if success is None:
@@ -473,7 +484,7 @@ def delete_account(account_id):
     try:
         logger.info(f"🔍 Deleting account {account_id}")
         
-        db = DatabaseManager()
+        db = get_db()
         success = safe_database_operation("delete_account", db.delete_account, account_id)
         
         if success is None:
@@ -497,7 +508,7 @@ def delete_account(account_id):
 @app.route('/api/statistics')
 def get_statistics():
     try:
-        db = DatabaseManager()
+        db = get_db()
         accounts = db.get_active_accounts()
         
         # Calculate statistics
@@ -545,7 +556,7 @@ def get_captions():
     try:
         logger.info("🔍 Fetching all captions...")
         
-        db = DatabaseManager()
+        db = get_db()
         captions = safe_database_operation("get_all_captions", db.get_all_captions)
         
         if captions is None:
@@ -751,7 +762,7 @@ def get_images():
     try:
         logger.info("🔍 Fetching all images...")
         
-        db = DatabaseManager()
+        db = get_db()
         images = safe_database_operation("get_all_images", db.get_all_images)
         
         if images is None:
@@ -782,7 +793,7 @@ def add_image():
                 return jsonify({"error": "No files selected"}), 400
             
             uploaded_images = []
-            db = DatabaseManager()
+            db = get_db()
             
             for file in files:
                 if file and file.filename:
@@ -857,7 +868,7 @@ def add_image():
             if not url:
                 return jsonify({"error": "Image URL required"}), 400
             
-            db = DatabaseManager()
+            db = get_db()
             success = db.add_image(url, filename, size, type)
             
             if success:
@@ -875,7 +886,7 @@ def delete_image(image_id):
     try:
         logger.info(f"🔍 Deleting image {image_id}")
         
-        db = DatabaseManager()
+        db = get_db()
         success = safe_database_operation("delete_image", db.delete_image, image_id)
         
         if success is None:
@@ -901,7 +912,7 @@ def debug_info():
     """Debug endpoint to check environment and database"""
     try:
         import os
-        from database import DatabaseManager
+        from database import get_db
         
         debug_info = {
             "environment": {
@@ -920,7 +931,7 @@ def debug_info():
         
         # Test database connection
         try:
-            db = DatabaseManager()
+            db = get_db()
             captions = db.get_all_captions()
             debug_info["database_test"] = {
                 "status": "success",
@@ -1056,7 +1067,7 @@ if __name__ == '__main__':
             try:
                 time.sleep(300)  # Run every 5 minutes
                 from services.rate_limiter import rate_limiter
-                rate_limiter.cleanup_old_entries(max_age_seconds=3600)
+                rate_limiter.cleanup_old_entries()
             except Exception as e:
                 logger.error(f"Rate limiter cleanup error: {e}")
     
@@ -1065,6 +1076,13 @@ if __name__ == '__main__':
     cleanup_thread.start()
     print("🧹 Rate limiter cleanup thread started")
     
+    # Refresh OAuth tokens ahead of expiry so posting never hits an expired token
+    try:
+        from services.token_refresher import token_refresher
+        token_refresher.start()
+    except Exception as e:
+        print(f"⚠️ Could not start token refresher: {e}")
+    
     # Start Flask app
     print(f"🌐 Starting Flask server on port {port}")
     app.run(host='0.0.0.0', port=port, debug=False) 
\ No newline at end of file
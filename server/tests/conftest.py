@@ -0,0 +1,11 @@
+"""
+Pytest configuration for the server unit tests
+
+These tests run offline: modules are imported from the server directory
+(as start.py does) and network calls are replaced per test.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,113 @@
+"""Tests for incremental engagement ingestion (cursor and re-fetch window)"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import engagement_tracker as et
+from services.graph_client import GraphAPIError
+
+NOW = datetime(2025, 6, 10, 12, 0, tzinfo=timezone.utc)
+
+
+class FakeGraph:
+    """Serves me/threads pages and per-post insights"""
+
+    def __init__(self, pages, failing=()):
+        self.client = self
+        self.pages = pages
+        self.failing = set(failing)
+        self.listing_params = []
+
+    async def request(self, method, path, token, account_id=None, params=None, **kwargs):
+        if path == 'me/threads':
+            self.listing_params.append(dict(params))
+            return self.pages[params.get('after')]
+        post_id = path.split('/')[0]
+        if post_id in self.failing:
+            raise GraphAPIError('500 - boom', 500)
+        return {'data': [{'name': 'likes', 'values': [{'value': 3}]},
+                         {'name': 'views', 'total_value': {'value': 40}}]}
+
+
+def post(post_id, hours_ago):
+    timestamp = (NOW - timedelta(hours=hours_ago)).strftime('%Y-%m-%dT%H:%M:%S+0000')
+    return {'id': post_id, 'timestamp': timestamp}
+
+
+def page(posts, after=None):
+    data = {'data': posts}
+    if after:
+        data['paging'] = {'cursors': {'after': after}, 'next': f'https://graph.threads.net/next?after={after}'}
+    return data
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    monkeypatch.setenv('ENGAGEMENT_REFETCH_DAYS', '3')
+    monkeypatch.setenv('ENGAGEMENT_BACKFILL_DAYS', '30')
+    return et.EngagementTracker()
+
+
+def ingest(tracker, monkeypatch, graph, cursor=None):
+    monkeypatch.setattr(et, 'graph_client', graph)
+    token_row = {'account_id': 1, 'access_token': 'token'}
+
+    async def run():
+        return await tracker._ingest_account(token_row, cursor, NOW, asyncio.Semaphore(5))
+
+    return asyncio.run(run())
+
+
+def listed_since(graph):
+    return datetime.fromtimestamp(graph.listing_params[0]['since'], timezone.utc)
+
+
+def test_first_run_backfills_and_follows_paging(tracker, monkeypatch):
+    graph = FakeGraph({
+        None: page([post('a', 1), post('b', 30)], after='p2'),
+        'p2': page([post('c', 50)]),
+    })
+
+    result = ingest(tracker, monkeypatch, graph)
+
+    assert listed_since(graph) == NOW - timedelta(days=30)
+    assert graph.listing_params[1]['after'] == 'p2'
+    assert [row['thread_id'] for row in result['rows']] == ['a', 'b', 'c']
+    assert result['rows'][0]['likes'] == 3 and result['rows'][0]['views'] == 40
+    assert result['cursor']['last_post_at'] == (NOW - timedelta(hours=1)).isoformat()
+    assert result['since_date'] == (NOW - timedelta(hours=50)).date()
+
+
+def test_recent_cursor_still_refetches_the_window(tracker, monkeypatch):
+    graph = FakeGraph({None: page([])})
+    cursor = {'last_post_at': (NOW - timedelta(hours=2)).isoformat()}
+
+    result = ingest(tracker, monkeypatch, graph, cursor)
+
+    assert listed_since(graph) == NOW - timedelta(days=3)
+    # No new posts: the cursor keeps its position
+    assert result['cursor']['last_post_at'] == cursor['last_post_at']
+
+
+def test_old_cursor_lists_everything_since_the_cursor(tracker, monkeypatch):
+    graph = FakeGraph({None: page([post('a', 1), post('old', 24 * 20)])})
+    cursor = {'last_post_at': (NOW - timedelta(days=10)).isoformat()}
+
+    result = ingest(tracker, monkeypatch, graph, cursor)
+
+    assert listed_since(graph) == NOW - timedelta(days=10)
+    # Listing stops at the first post older than the cutoff
+    assert [row['thread_id'] for row in result['rows']] == ['a']
+
+
+def test_cursor_stops_at_the_oldest_failed_post(tracker, monkeypatch):
+    graph = FakeGraph({None: page([post('a', 1), post('b', 5), post('c', 9), post('d', 12)])},
+                      failing={'b', 'c'})
+
+    result = ingest(tracker, monkeypatch, graph)
+
+    assert [row['thread_id'] for row in result['rows']] == ['a', 'd']
+    assert result['failed'] == 2
+    assert result['cursor']['last_post_at'] == (NOW - timedelta(hours=9)).isoformat()
@@ -0,0 +1,126 @@
+"""Tests for the async Graph client request payloads and container polling"""
+
+import asyncio
+
+import pytest
+
+from services import graph_client as graph_module
+from services.graph_client import AsyncGraphClient, ContainerPoller, GraphAPIError
+
+
+def capture_requests(client, response):
+    calls = []
+
+    async def fake_request(method, path, token, account_id=None, **kwargs):
+        calls.append({'method': method, 'path': path, **kwargs})
+        return response
+
+    client.request = fake_request
+    return calls
+
+
+def test_create_container_text_post():
+    client = AsyncGraphClient()
+    calls = capture_requests(client, {'id': 'c1'})
+
+    container_id = asyncio.run(client.create_container('token', 'hello'))
+
+    assert container_id == 'c1'
+    assert calls[0]['path'] == 'me/threads'
+    assert calls[0]['json_body'] == {'media_type': 'TEXT', 'text': 'hello'}
+
+
+def test_create_container_image_post():
+    client = AsyncGraphClient()
+    calls = capture_requests(client, {'id': 'c2'})
+
+    asyncio.run(client.create_container('token', 'hello', 'https://example.com/a.jpg'))
+
+    assert calls[0]['json_body'] == {
+        'media_type': 'IMAGE',
+        'text': 'hello',
+        'image_url': 'https://example.com/a.jpg'
+    }
+
+
+class ScriptedClient:
+    """Answers ?ids= status checks from a per-container list of statuses"""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.calls = []
+
+    async def request(self, method, path, token, account_id=None, params=None, **kwargs):
+        ids = params['ids'].split(',')
+        self.calls.append((token, ids))
+        return {cid: {'status': self.statuses[cid].pop(0) if len(self.statuses[cid]) > 1 else self.statuses[cid][0]}
+                for cid in ids}
+
+
+def make_poller(statuses, **options):
+    client = ScriptedClient(statuses)
+    options = {'base_delay': 0.01, 'max_delay': 0.05, 'max_age': 5.0, **options}
+    return ContainerPoller(client, **options), client
+
+
+def test_poller_backoff_doubles_up_to_max_delay(monkeypatch):
+    monkeypatch.setattr(graph_module.random, 'uniform', lambda low, high: 1.0)
+    poller = ContainerPoller(None, base_delay=1.0, max_delay=10.0)
+    entry = {'attempts': 0}
+
+    delays = []
+    for _ in range(5):
+        poller._backoff(entry, 100.0)
+        delays.append(entry['next_check'] - 100.0)
+
+    assert delays == [2.0, 4.0, 8.0, 10.0, 10.0]
+
+
+def test_poller_checks_containers_per_token_and_wakes_waiters():
+    poller, client = make_poller({
+        'a': ['IN_PROGRESS', 'FINISHED'],
+        'b': ['FINISHED'],
+        'c': ['FINISHED'],
+    })
+
+    async def run():
+        return await asyncio.gather(
+            poller.wait_ready('t1', 'a', timeout=2),
+            poller.wait_ready('t1', 'b', timeout=2),
+            poller.wait_ready('t2', 'c', timeout=2),
+        )
+
+    assert asyncio.run(run()) == ['FINISHED', 'FINISHED', 'FINISHED']
+    assert sorted((token, sorted(ids)) for token, ids in client.calls[:2]) == [('t1', ['a', 'b']), ('t2', ['c'])]
+    assert client.calls[2:] == [('t1', ['a'])]
+    assert poller.pending == {}
+
+
+def test_poller_raises_for_failed_container():
+    poller, _ = make_poller({'a': ['ERROR']})
+
+    with pytest.raises(GraphAPIError, match='Container a ERROR'):
+        asyncio.run(poller.wait_ready('t1', 'a', timeout=2))
+
+
+def test_poller_gives_up_after_max_age():
+    poller, _ = make_poller({'a': ['IN_PROGRESS']}, max_age=0.05)
+
+    with pytest.raises(GraphAPIError, match='not ready after'):
+        asyncio.run(poller.wait_ready('t1', 'a', timeout=2))
+
+
+def test_wait_ready_timeout_removes_waiter_but_keeps_polling():
+    poller, _ = make_poller({'a': ['IN_PROGRESS']})
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await poller.wait_ready('t1', 'a', timeout=0.03)
+        entry = poller.pending['a']
+        poller._task.cancel()
+        return entry
+
+    entry = asyncio.run(run())
+
+    assert entry['waiters'] == []
+    assert entry['attempts'] >= 1
@@ -0,0 +1,85 @@
+"""Tests for Meta usage header parsing and pacing"""
+
+import json
+
+import pytest
+
+from services import meta_quota as mq
+from services.graph_client import GraphResponse
+from services.meta_quota import MetaQuotaTracker
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    monkeypatch.setattr(mq.time, 'time', lambda: 1000.0)
+    return MetaQuotaTracker()
+
+
+def response(status=200, headers=None, body=''):
+    return GraphResponse(status, headers or {}, body)
+
+
+def test_app_usage_uses_highest_counter(tracker):
+    tracker.record_response(response(headers={
+        'X-App-Usage': json.dumps({'call_count': 12, 'total_cputime': 40, 'total_time': 7})
+    }))
+
+    assert tracker.app_usage() == 40.0
+    assert tracker.remaining_budget() == 60.0
+
+
+def test_business_use_case_usage_is_per_account(tracker):
+    tracker.record_response(response(headers={
+        'X-Business-Use-Case-Usage': json.dumps({
+            '1789': [
+                {'type': 'threads', 'call_count': 20, 'total_cputime': 5, 'total_time': 3,
+                 'estimated_time_to_regain_access': 0},
+                {'type': 'threads_publish', 'call_count': 96, 'total_cputime': 1, 'total_time': 1,
+                 'estimated_time_to_regain_access': 0},
+            ]
+        })
+    }), account_id=7)
+
+    assert tracker.account_usage(7) == 96.0
+    assert tracker.account_usage(8) == 0.0
+    assert tracker.defer_seconds(7) == tracker.cooldown_seconds
+    assert tracker.defer_seconds(8) == 0
+
+
+def test_regain_access_minutes_block_the_account(tracker):
+    tracker.record_response(response(headers={
+        'X-Business-Use-Case-Usage': json.dumps({
+            '1789': [{'call_count': 100, 'estimated_time_to_regain_access': 2}]
+        })
+    }), account_id=7)
+
+    assert tracker.defer_seconds(7) == 121
+
+
+def test_business_usage_without_account_is_ignored(tracker):
+    tracker.record_response(response(headers={
+        'X-Business-Use-Case-Usage': json.dumps({'1789': [{'call_count': 99}]})
+    }))
+
+    assert tracker.accounts == {}
+
+
+def test_malformed_headers_are_ignored(tracker):
+    tracker.record_response(response(headers={'X-App-Usage': 'not json'}), account_id=7)
+
+    assert tracker.app_usage() == 0.0
+
+
+def test_throttle_errors_block_app_or_account(tracker):
+    tracker.record_response(response(400, {}, json.dumps({'error': {'code': 17}})), account_id=7)
+    assert tracker.defer_seconds(7) > 0
+    assert tracker.defer_seconds(8) == 0
+
+    tracker.record_response(response(429, {'Retry-After': '30'}, json.dumps({'error': {'code': 4}})), account_id=8)
+    assert tracker.defer_seconds(9) == 31
+
+
+def test_pace_limit_tapers_between_thresholds(tracker):
+    for usage, expected in [(50, 10), (75, 10), (85, 5), (95, 1)]:
+        tracker.app = {'usage': float(usage), 'updated_at': 1000.0, 'blocked_until': 0.0}
+        assert tracker.pace_limit(10) == expected
@@ -0,0 +1,113 @@
+"""Tests for the in-process rate limiter engines"""
+
+import pytest
+
+from services import rate_limiter as rl
+from services.rate_limiter import GCRAEngine, SlidingLogEngine, TokenBucketEngine, gcra_check
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rl.time, 'time', clock)
+    return clock
+
+
+@pytest.mark.parametrize('engine_class', [SlidingLogEngine, TokenBucketEngine, GCRAEngine])
+def test_allows_burst_then_denies(clock, engine_class):
+    engine = engine_class()
+
+    results = [engine.is_allowed('key', 3, 60) for _ in range(4)]
+
+    assert results == [(True, 2), (True, 1), (True, 0), (False, 0)]
+    assert engine.get_remaining('key', 3, 60) == 0
+    assert engine.get_remaining('other', 3, 60) == 3
+
+
+@pytest.mark.parametrize('engine_class', [TokenBucketEngine, GCRAEngine])
+def test_smooth_engines_free_one_request_per_interval(clock, engine_class):
+    engine = engine_class()
+    for _ in range(3):
+        engine.is_allowed('key', 3, 60)
+
+    clock.now += 19.9
+    assert engine.is_allowed('key', 3, 60) == (False, 0)
+
+    clock.now += 0.1
+    assert engine.is_allowed('key', 3, 60) == (True, 0)
+
+
+def test_sliding_log_frees_requests_when_they_leave_the_window(clock):
+    engine = SlidingLogEngine()
+    for _ in range(3):
+        engine.is_allowed('key', 3, 60)
+
+    clock.now += 59.9
+    assert engine.is_allowed('key', 3, 60) == (False, 0)
+
+    # All three were logged at the same instant, so they leave together
+    clock.now += 0.2
+    assert engine.is_allowed('key', 3, 60) == (True, 2)
+
+
+def test_gcra_check_retry_after_boundary():
+    now = 1000.0
+    allowed, remaining, tat, retry_after = gcra_check(None, now, 2, 10)
+    assert (allowed, remaining, retry_after) == (True, 1, 0.0)
+
+    allowed, remaining, tat, _ = gcra_check(tat, now, 2, 10)
+    assert (allowed, remaining) == (True, 0)
+
+    allowed, _, _, retry_after = gcra_check(tat, now, 2, 10)
+    assert not allowed
+    assert retry_after == pytest.approx(5.0)
+
+    # Exactly retry_after later the next request fits
+    assert gcra_check(tat, now + retry_after, 2, 10)[0]
+
+
+@pytest.mark.parametrize('engine_class', [SlidingLogEngine, TokenBucketEngine, GCRAEngine])
+def test_reset_key_restores_full_limit(clock, engine_class):
+    engine = engine_class()
+    for _ in range(3):
+        engine.is_allowed('key', 3, 60)
+
+    engine.reset_key('key')
+
+    assert engine.is_allowed('key', 3, 60) == (True, 2)
+
+
+@pytest.mark.parametrize('engine_class', [SlidingLogEngine, TokenBucketEngine, GCRAEngine])
+def test_cleanup_drops_only_expired_keys(clock, engine_class):
+    engine = engine_class()
+    engine.is_allowed('short', 3, 10)
+    engine.is_allowed('long', 3, 600)
+
+    clock.now += 11
+    assert engine.cleanup_old_entries() == 1
+    assert engine.tracked_keys() == 1
+    assert engine.get_remaining('long', 3, 600) == 2
+
+
+def test_sharded_facade_spreads_keys_and_cleans_every_shard(clock):
+    limiter = rl.RateLimiter(engine='gcra', shards=4)
+    keys = [f'account:{index}' for index in range(40)]
+    for key in keys:
+        assert limiter.is_allowed(key, 2, 60) == (True, 1)
+
+    assert len(limiter.shards) == 4
+    assert sum(1 for shard in limiter.shards if shard.tracked_keys()) > 1
+    assert limiter.tracked_keys() == 40
+    assert limiter.get_remaining(keys[0], 2, 60) == 1
+
+    clock.now += 31
+    limiter.cleanup_old_entries()
+    assert limiter.tracked_keys() == 0
@@ -0,0 +1,61 @@
+"""Tests for session blob encoding and the session index"""
+
+import gzip
+import json
+
+from services.session_store import SESSION_FORMAT_GZIP, SessionStore
+
+SESSION = {'cookies': {'sessionid': 'abc', 'csrftoken': 'def'}, 'uuids': {'phone_id': 'p1'}, 'user_id': 42}
+
+
+def make_store(monkeypatch, encoding):
+    monkeypatch.setenv('SESSION_ENCODING', encoding)
+    return SessionStore()
+
+
+def test_gzip_round_trip(monkeypatch):
+    store = make_store(monkeypatch, 'gzip')
+
+    body, content_type = store.encode_session(SESSION)
+
+    assert body.startswith(SESSION_FORMAT_GZIP)
+    assert content_type == 'application/octet-stream'
+    assert json.loads(gzip.decompress(body[len(SESSION_FORMAT_GZIP):])) == SESSION
+    assert SessionStore.decode_session(body) == SESSION
+
+
+def test_json_round_trip_is_minified(monkeypatch):
+    store = make_store(monkeypatch, 'json')
+
+    body, content_type = store.encode_session(SESSION)
+
+    assert content_type == 'application/json'
+    assert b' ' not in body
+    assert SessionStore.decode_session(body) == SESSION
+
+
+def test_decodes_legacy_pretty_json_blobs():
+    legacy = json.dumps(SESSION, indent=2).encode('utf-8')
+
+    assert SessionStore.decode_session(legacy) == SESSION
+
+
+def test_unknown_encoding_falls_back_to_json(monkeypatch):
+    store = make_store(monkeypatch, 'brotli')
+
+    assert store.encoding == 'json'
+    assert store.encode_session(SESSION)[1] == 'application/json'
+
+
+def test_list_sessions_returns_a_snapshot_of_the_index(monkeypatch):
+    store = make_store(monkeypatch, 'json')
+    store.configured = True
+    store.index = {'alice': {}, 'bob': {}}
+    store.index_loaded_at = float('inf')
+
+    usernames = store.list_sessions()
+    store._index_put('carol')
+    store._index_drop('alice')
+
+    assert sorted(usernames) == ['alice', 'bob']
+    assert store.existing_usernames() == {'bob', 'carol'}
@@ -0,0 +1,116 @@
+"""Tests for the shared (cross-process) rate limiter backends"""
+
+import pytest
+
+from services import rate_limiter as rl
+from services.rate_limiter import SQLiteEngine, gcra_reserve
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rl.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'rate_limits.db')
+
+
+def test_gcra_reserve_grants_what_fits():
+    granted, remaining, tat, retry_after = gcra_reserve(None, 0.0, 10, 10, 4)
+    assert (granted, remaining, tat, retry_after) == (4, 6, 4.0, 0.0)
+
+    granted, remaining, tat, _ = gcra_reserve(tat, 0.0, 10, 10, 8)
+    assert (granted, remaining, tat) == (6, 0, 10.0)
+
+    granted, _, _, retry_after = gcra_reserve(tat, 0.0, 10, 10, 1)
+    assert granted == 0
+    assert retry_after == pytest.approx(1.0)
+
+
+def test_sqlite_small_limit_is_exact_and_blocks_until_retry_after(clock, db_path):
+    engine = SQLiteEngine(db_path)
+
+    assert [engine.is_allowed('key', 3, 60) for _ in range(4)] == [
+        (True, 2), (True, 1), (True, 0), (False, 0)
+    ]
+    assert engine.blocked_until['key'] == pytest.approx(clock.now + 20)
+    assert engine.leases == {}
+
+    clock.now += 19.9
+    assert engine.is_allowed('key', 3, 60) == (False, 0)
+
+    clock.now += 0.1
+    assert engine.is_allowed('key', 3, 60) == (True, 0)
+
+
+def test_sqlite_limit_is_shared_between_processes(clock, db_path):
+    first, second = SQLiteEngine(db_path), SQLiteEngine(db_path)
+
+    allowed = sum(first.is_allowed('key', 50, 60)[0] for _ in range(30))
+    allowed += sum(second.is_allowed('key', 50, 60)[0] for _ in range(30))
+
+    assert allowed == 50
+    assert second.get_remaining('key', 50, 60) == 0
+
+
+def test_sqlite_reserves_ahead_for_large_limits(clock, db_path, monkeypatch):
+    engine = SQLiteEngine(db_path)
+    round_trips = []
+    reserve = engine._reserve
+
+    def counting_reserve(*args):
+        round_trips.append(args)
+        return reserve(*args)
+
+    monkeypatch.setattr(engine, '_reserve', counting_reserve)
+
+    results = [engine.is_allowed('key', 100, 60) for _ in range(10)]
+
+    assert [remaining for _, remaining in results] == list(range(99, 89, -1))
+    assert len(round_trips) == 2
+    assert engine.get_remaining('key', 100, 60) == 90
+
+
+def test_sqlite_lease_expires_after_its_sustained_duration(clock, db_path):
+    engine = SQLiteEngine(db_path)
+    engine.is_allowed('key', 100, 60)
+
+    # 5 requests at 100/60s take 3 seconds; afterwards the store is asked again
+    clock.now += 3
+    assert engine.is_allowed('key', 100, 60)[0]
+    assert engine.leases['key'][1] == pytest.approx(clock.now + 3)
+
+
+def test_shared_engine_falls_back_to_local_limits(clock, db_path, monkeypatch):
+    engine = SQLiteEngine(db_path)
+
+    def unavailable(*args):
+        raise RuntimeError('store down')
+
+    monkeypatch.setattr(engine, '_reserve', unavailable)
+
+    assert [engine.is_allowed('key', 2, 60)[0] for _ in range(3)] == [True, True, False]
+
+
+def test_sqlite_reset_and_cleanup(clock, db_path):
+    engine = SQLiteEngine(db_path)
+    for _ in range(4):
+        engine.is_allowed('key', 3, 60)
+
+    engine.reset_key('key')
+    assert engine.is_allowed('key', 3, 60) == (True, 2)
+
+    clock.now += 61
+    assert engine.cleanup_old_entries() == 1
+    assert engine.tracked_keys() == 0
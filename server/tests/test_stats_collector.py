@@ -0,0 +1,82 @@
+"""Tests for cross-account Graph batching in the stats collector"""
+
+import asyncio
+import json
+
+from services.graph_client import GraphAPIError
+from services.stats_collector import StatsCollector
+
+
+class FakeClient:
+    """Answers batch and direct calls; the token 'bad' fails and 'slow' hangs"""
+
+    def __init__(self):
+        self.batches = []
+
+    async def request(self, method, path, token, account_id=None, params=None, json_body=None, **kwargs):
+        if method == 'POST':
+            self.batches.append(json_body['batch'])
+            results = []
+            for sub in json_body['batch']:
+                sub_token = sub['relative_url'].split('access_token=')[1].split('&')[0]
+                if sub_token == 'bad':
+                    results.append({'code': 500, 'body': json.dumps({'error': {'message': 'boom'}})})
+                elif sub['relative_url'].startswith('me?'):
+                    results.append({'code': 200, 'body': json.dumps({'id': sub_token})})
+                else:
+                    results.append({'code': 200, 'body': json.dumps({'data': [{'id': 'p', 'likes': 2}]})})
+            return results
+        if token == 'bad':
+            raise GraphAPIError('500 - boom', 500)
+        if token == 'slow':
+            await asyncio.sleep(5)
+        return {'id': token} if path == 'me' else {'data': []}
+
+
+class FakeGraph:
+    def __init__(self):
+        self.client = FakeClient()
+
+    def run(self, coro, timeout):
+        from services.graph_client import graph_client
+        return graph_client.run(coro, timeout)
+
+
+def make_collector():
+    collector = StatsCollector()
+    collector.graph = FakeGraph()
+    return collector
+
+
+def test_accounts_share_batches_of_up_to_50_sub_requests():
+    collector = make_collector()
+    tokens = [{'account_id': index, 'access_token': f't{index}'} for index in range(60)]
+
+    results = collector.collect(tokens)
+
+    assert [len(batch) for batch in collector.graph.client.batches] == [50, 50, 20]
+    assert [result['data']['user_id'] for result in results] == [f't{index}' for index in range(60)]
+    assert results[0]['data']['engagement']['total_likes'] == 2
+
+
+def test_failed_batch_item_is_retried_directly_for_that_account_only():
+    collector = make_collector()
+    tokens = [{'account_id': 1, 'access_token': 't1'}, {'account_id': 2, 'access_token': 'bad'}]
+
+    results = collector.collect(tokens)
+
+    assert results[0]['success'] is True
+    assert results[1] == {'account_id': 2, 'success': False, 'error': '500 - boom'}
+    assert len(collector.graph.client.batches) == 1
+
+
+def test_timeout_keeps_accounts_that_finished():
+    collector = make_collector()
+    collector.use_batch = False
+    collector.timeout = 0.2
+    tokens = [{'account_id': 1, 'access_token': 't1'}, {'account_id': 2, 'access_token': 'slow'}]
+
+    results = collector.collect(tokens)
+
+    assert results[0]['success'] is True
+    assert results[1] == {'account_id': 2, 'success': False, 'error': 'Timed out after 0.2s'}
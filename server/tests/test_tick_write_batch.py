@@ -0,0 +1,118 @@
+"""Tests for the autopilot tick write-back batch"""
+
+from services.autopilot import TickWriteBatch
+
+
+class FakeDB:
+    """Records the bulk writes TickWriteBatch.flush makes"""
+
+    def __init__(self, rpc_result=True, bulk_ok=True):
+        self.rpc_result = rpc_result
+        self.bulk_ok = bulk_ok
+        self.calls = []
+
+    def bulk_insert_posting_history(self, rows):
+        self.calls.append(('history', rows))
+        return True
+
+    def update_accounts_bulk(self, rows):
+        self.calls.append(('rpc', rows))
+        return self.rpc_result
+
+    def bulk_update_accounts(self, account_ids, data):
+        self.calls.append(('patch', account_ids, data))
+        return self.bulk_ok
+
+    def update_account(self, account_id, data):
+        self.calls.append(('row', account_id, data))
+        return True
+
+    def set_captions_used(self, caption_ids, used):
+        self.calls.append(('captions', caption_ids, used))
+        return True
+
+    def set_staged_posts_status(self, staged_ids, status):
+        self.calls.append(('staged_status', staged_ids, status))
+        return True
+
+    def bulk_insert_staged_posts(self, rows):
+        self.calls.append(('staged_rows', rows))
+        return rows
+
+    def named(self, name):
+        return [call for call in self.calls if call[0] == name]
+
+
+def queue_accounts(batch):
+    batch.update_account({'id': 1}, {'last_error': None, 'error_count': 0})
+    batch.update_account({'id': 1}, {'next_run_at': 'a'})
+    batch.update_account({'id': 2}, {'last_error': 'x', 'error_count': 1})
+    batch.update_account({'id': 3}, {'last_error': 'x', 'error_count': 1})
+
+
+def test_flush_writes_all_account_rows_in_one_rpc():
+    batch, db = TickWriteBatch(), FakeDB()
+    queue_accounts(batch)
+    batch.add_history(1, 10, None, 'posted', 't1')
+
+    written = batch.flush(db)
+
+    assert written == {'posting_history': 1, 'accounts': 3, 'captions': 0}
+    assert db.named('rpc') == [('rpc', [
+        {'id': 1, 'last_error': None, 'error_count': 0, 'next_run_at': 'a'},
+        {'id': 2, 'last_error': 'x', 'error_count': 1},
+        {'id': 3, 'last_error': 'x', 'error_count': 1},
+    ])]
+    assert db.named('patch') == []
+
+
+def test_flush_groups_identical_updates_when_rpc_is_missing():
+    batch, db = TickWriteBatch(), FakeDB(rpc_result=None)
+    queue_accounts(batch)
+
+    assert batch.flush(db)['accounts'] == 3
+    assert sorted(db.named('patch'), key=lambda call: call[1]) == [
+        ('patch', [1], {'last_error': None, 'error_count': 0, 'next_run_at': 'a'}),
+        ('patch', [2, 3], {'last_error': 'x', 'error_count': 1}),
+    ]
+    assert db.named('row') == []
+
+
+def test_flush_falls_back_to_per_row_updates():
+    batch, db = TickWriteBatch(), FakeDB(rpc_result=False, bulk_ok=False)
+    queue_accounts(batch)
+
+    assert batch.flush(db)['accounts'] == 3
+    assert sorted(call[1] for call in db.named('row')) == [1, 2, 3]
+
+
+def test_flush_orders_staged_status_before_new_staged_rows_and_resets():
+    batch, db = TickWriteBatch(), FakeDB()
+    batch.set_caption_used(5, True)
+    batch.set_caption_used(6, True)
+    batch.set_caption_used(6, False)
+    batch.set_staged_status(7, 'failed')
+    batch.add_staged_post({'account_id': 1, 'container_id': 'c1'})
+
+    written = batch.flush(db)
+
+    assert written['captions'] == 2
+    assert ('captions', [5], True) in db.calls and ('captions', [6], False) in db.calls
+    names = [call[0] for call in db.calls]
+    assert names.index('staged_status') < names.index('staged_rows')
+
+    db.calls.clear()
+    batch.flush(db)
+    assert db.calls == []
+
+
+def test_checkpoint_flushes_only_after_interval():
+    batch, db = TickWriteBatch(flush_seconds=60), FakeDB()
+    batch.add_history(1, None, None, 'failed')
+
+    batch.checkpoint(db)
+    assert db.calls == []
+
+    batch.last_flush -= 61
+    batch.checkpoint(db)
+    assert db.named('history')
@@ -0,0 +1,80 @@
+"""Tests for the token refresher's expiry heap"""
+
+import pytest
+
+from services import token_refresher as tr
+from services.token_refresher import TokenRefresher, parse_expires_at
+
+
+class FakeDB:
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def get_oauth_tokens(self, account_ids=None):
+        return [row for row in self.tokens if account_ids is None or row['account_id'] in account_ids]
+
+
+@pytest.fixture
+def refresher(monkeypatch):
+    monkeypatch.setenv('TOKEN_REFRESH_LEAD_SECONDS', '100')
+    return TokenRefresher()
+
+
+def test_pop_due_returns_accounts_in_refresh_order(refresher):
+    for account_id, refresh_at in [(1, 30.0), (2, 10.0), (3, 20.0), (4, 50.0)]:
+        refresher.schedule(account_id, refresh_at)
+
+    assert refresher.next_due_at() == 10.0
+    assert refresher.pop_due(40.0, limit=2) == [2, 3]
+    assert refresher.pop_due(40.0, limit=10) == [1]
+    assert refresher.next_due_at() == 50.0
+
+
+def test_rescheduling_supersedes_the_earlier_entry(refresher):
+    refresher.schedule(1, 10.0)
+    refresher.schedule(2, 20.0)
+    refresher.schedule(1, 30.0)
+
+    assert refresher.pop_due(25.0, limit=10) == [2]
+    assert refresher.next_due_at() == 30.0
+    assert refresher.pop_due(30.0, limit=10) == [1]
+    assert refresher.next_due_at() is None
+
+
+def test_track_schedules_lead_seconds_before_expiry(refresher):
+    refresher.track(1, '2030-01-01T00:00:00+00:00')
+    refresher.track(2, None)
+
+    expires_ts = parse_expires_at('2030-01-01T00:00:00Z')
+    assert refresher.scheduled == {1: expires_ts - 100}
+
+
+def test_load_builds_heap_and_keeps_pending_retries(refresher, monkeypatch):
+    monkeypatch.setattr(tr, 'get_db', lambda: FakeDB([
+        {'account_id': 1, 'expires_at': 1300.0},
+        {'account_id': 2, 'expires_at': 1200.0},
+        {'account_id': 3, 'expires_at': None},
+    ]))
+    refresher.failures[1] = 2
+    refresher.scheduled[1] = 5000.0
+
+    assert refresher.load() == 2
+    assert refresher.next_due_at() == 1100.0
+    assert refresher.pop_due(10000.0, limit=10) == [2, 1]
+
+
+def test_failed_refresh_backs_off_exponentially(refresher, monkeypatch):
+    monkeypatch.setattr(tr.time, 'time', lambda: 1000.0)
+
+    def failing_refresh(*args):
+        raise Exception('invalid token')
+
+    monkeypatch.setattr(tr.meta_oauth_service, 'refresh_access_token', failing_refresh)
+    token_row = {'account_id': 1, 'access_token': 'abc'}
+
+    delays = []
+    for _ in range(3):
+        assert refresher._refresh_one(token_row) is False
+        delays.append(refresher.scheduled[1] - 1000.0)
+
+    assert delays == [refresher.retry_seconds, refresher.retry_seconds * 2, refresher.retry_seconds * 4]